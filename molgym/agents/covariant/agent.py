@@ -3,6 +3,7 @@ from typing import List, Optional, Tuple, Dict, Any
 import numpy as np
 import torch
 import torch.distributions
+from ase import Atoms
 from cormorant.cg_lib import SphericalHarmonics, CGDict
 from cormorant.so3_lib import SO3Tau, SO3Vec
 
@@ -163,9 +164,9 @@ class CovariantAC(AbstractActorCritic):
         return element_index, position
 
     def parse_observations(self, observations: List[ObservationType]) -> Dict[str, torch.Tensor]:
-        parsed_observations = [self.observation_space.parse(observation) for observation in observations]
-        atoms_list = [tup[0] for tup in parsed_observations]
-        bags = [observation[1] for observation in observations]
+        parsed_observations = [self.observation_space.parse_arrays(observation) for observation in observations]
+        atoms_list = [Atoms(numbers=numbers, positions=positions) for numbers, positions, _ in parsed_observations]
+        bags = [bag for _, _, bag in parsed_observations]
 
         # Canvas
         data = tools.process_atoms_list(atoms_list,
@@ -188,7 +189,7 @@ class CovariantAC(AbstractActorCritic):
         data['empty'] = torch.tensor([len(atoms) == 0 for atoms in atoms_list], dtype=torch.bool, device=self.device)
 
         # Bag
-        data['bags'] = torch.tensor([list(bag) for bag in bags], dtype=self.dtype, device=self.device)  # (batches, zs)
+        data['bags'] = torch.as_tensor(np.stack(bags), dtype=self.dtype, device=self.device)  # (batches, zs)
         data['element_mask'] = data['bags'] > 0  # (batches, zs)
 
         # Value mask
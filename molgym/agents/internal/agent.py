@@ -1,7 +1,6 @@
 from typing import Tuple, List, Optional
 
 import ase
-import ase.data
 import numpy as np
 import schnetpack as spk
 import torch
@@ -99,8 +98,7 @@ class SchNetAC(AbstractActorCritic):
         element = int(round(element))
         sign = -1 if int(round(kappa)) else 1
 
-        atoms, bag = self.observation_space.parse(observation)
-        positions = [atom.position for atom in atoms]
+        _, positions, _ = self.observation_space.parse_arrays(observation)
         position = zmat.position_atom_helper(positions=positions,
                                              focus=focus,
                                              distance=distance,
@@ -122,25 +120,26 @@ class SchNetAC(AbstractActorCritic):
         action_mask = torch.zeros(size=(len(observations), 6), dtype=torch.float32, device=self.device)
 
         for i, observation in enumerate(observations):
-            atoms, formula = self.observation_space.parse(observation)
-            bag_tuple = [count for atomic_num, count in formula]
-            if len(atoms) > 0:
-                features[i, :len(atoms), :] = self.embedding_fn(self.converter(atoms))
-                focus_mask[i, :len(atoms)] = 1
-                focus_mask_next[i, :len(atoms) + 1] = 1
+            numbers, positions, bag = self.observation_space.parse_arrays(observation)
+            num_atoms = len(numbers)
+            if num_atoms > 0:
+                atoms = ase.Atoms(numbers=numbers, positions=positions)
+                features[i, :num_atoms, :] = self.embedding_fn(self.converter(atoms))
+                focus_mask[i, :num_atoms] = 1
+                focus_mask_next[i, :num_atoms + 1] = 1
             else:
                 focus_mask[i, :1] = 1  # focus null-atom
                 focus_mask_next[i, :2] = 1
 
-            element_count[i] = torch.tensor(bag_tuple, dtype=torch.float32, device=self.device)
+            element_count[i] = torch.as_tensor(bag, dtype=torch.float32, device=self.device)
 
             # Mask out subactions:
-            action_mask[i, 0] = len(atoms) >= 1  # focus
+            action_mask[i, 0] = num_atoms >= 1  # focus
             action_mask[i, 1] = 1.0  # element
-            action_mask[i, 2] = len(atoms) >= 1  # distance
-            action_mask[i, 3] = len(atoms) >= 2  # angle
-            action_mask[i, 4] = len(atoms) >= 3  # dihedral
-            action_mask[i, 5] = len(atoms) >= 3  # kappa
+            action_mask[i, 2] = num_atoms >= 1  # distance
+            action_mask[i, 3] = num_atoms >= 2  # angle
+            action_mask[i, 4] = num_atoms >= 3  # dihedral
+            action_mask[i, 5] = num_atoms >= 3  # kappa
 
         return (
             features,  # n_obs x n_atoms x n_afeats
@@ -161,8 +160,7 @@ class SchNetAC(AbstractActorCritic):
         dihedral = to_numpy(dihedral)
 
         for i, observation in enumerate(observations):
-            atoms, bag = self.observation_space.parse(observation)
-            positions = [atom.position for atom in atoms]
+            numbers, positions, _ = self.observation_space.parse_arrays(observation)
             new_position = zmat.position_atom_helper(
                 positions=positions,
                 focus=int(round(focus[i, 0])),
@@ -171,9 +169,8 @@ class SchNetAC(AbstractActorCritic):
                 dihedral=dihedral[i, 0],
             )
             new_element = int(round(element[i, 0]))
-            atomic_number = bag[new_element][0]
-            new_atom = ase.Atom(symbol=ase.data.chemical_symbols[atomic_number], position=new_position)
-            atoms.append(new_atom)
+            atomic_number = self.observation_space.bag_space.zs[new_element]
+            atoms = ase.Atoms(numbers=np.append(numbers, atomic_number), positions=np.vstack([positions, new_position]))
             features[i] = self.embedding_fn(self.converter(atoms))[:, -1, :]
 
         return features
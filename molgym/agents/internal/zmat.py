@@ -1,4 +1,3 @@
-from typing import List
 
 import numpy as np
 
@@ -97,7 +96,7 @@ def position_point(p0: np.ndarray, p1: np.ndarray, p2: np.ndarray, distance: flo
 
 
 def position_atom_helper(
-    positions: List[np.ndarray],
+    positions: np.ndarray,  # (n, 3)
     focus: int,
     distance: float,
     angle: float,
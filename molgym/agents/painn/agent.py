@@ -1,7 +1,6 @@
 from typing import Tuple, List, Optional
 
 import ase
-import ase.data
 import numpy as np
 import torch
 import torch.distributions
@@ -128,8 +127,7 @@ class PainnAC(AbstractActorCritic):
         element = int(round(element))
         sign = -1 if int(round(kappa)) else 1
 
-        atoms, bag = self.observation_space.parse(observation)
-        positions = [atom.position for atom in atoms]
+        _, positions, _ = self.observation_space.parse_arrays(observation)
         position = zmat.position_atom_helper(positions=positions,
                                              focus=focus,
                                              distance=distance,
@@ -153,30 +151,29 @@ class PainnAC(AbstractActorCritic):
         graph_states = []
         worker_index_all = []
         for i, obs in enumerate(observations):
-            # Get Atoms() object from observation
-            atoms, formula = self.observation_space.parse(obs)
-            bag_tuple = [count for atomic_num, count in formula]
-            if len(atoms) > 0:
+            numbers, positions, bag = self.observation_space.parse_arrays(obs)
+            num_atoms = len(numbers)
+            if num_atoms > 0:
                 # Transform to graph dictionary
-                graph_state = self.transformer(atoms)
+                graph_state = self.transformer(ase.Atoms(numbers=numbers, positions=positions))
                 graph_states.append(graph_state)
                 worker_index_all.append(i)
 
-                focus_mask[i, :len(atoms)] = 1
-                focus_mask_next[i, :len(atoms) + 1] = 1
+                focus_mask[i, :num_atoms] = 1
+                focus_mask_next[i, :num_atoms + 1] = 1
             else:
                 focus_mask[i, :1] = 1  # focus null-atom
                 focus_mask_next[i, :2] = 1
 
-            element_count[i] = torch.tensor(bag_tuple, dtype=torch.float32, device=self.device)
+            element_count[i] = torch.as_tensor(bag, dtype=torch.float32, device=self.device)
 
             # Mask out subactions:
-            action_mask[i, 0] = len(atoms) >= 1  # focus
+            action_mask[i, 0] = num_atoms >= 1  # focus
             action_mask[i, 1] = 1.0  # element
-            action_mask[i, 2] = len(atoms) >= 1  # distance
-            action_mask[i, 3] = len(atoms) >= 2  # angle
-            action_mask[i, 4] = len(atoms) >= 3  # dihedral
-            action_mask[i, 5] = len(atoms) >= 3  # kappa
+            action_mask[i, 2] = num_atoms >= 1  # distance
+            action_mask[i, 3] = num_atoms >= 2  # angle
+            action_mask[i, 4] = num_atoms >= 3  # dihedral
+            action_mask[i, 5] = num_atoms >= 3  # kappa
 
         # Get PaiNN embeddings for all observations
         if len(graph_states) > 0:
@@ -188,11 +185,9 @@ class PainnAC(AbstractActorCritic):
             nodes_scalar, _, edge_offset = self._get_painn_embeddings(batch)
             edge_offset = edge_offset.squeeze(-1).squeeze(-1)
 
-        for i, obs in enumerate(observations):
-            atoms, formula = self.observation_space.parse(obs)
-            if len(atoms) > 0:
-                worker_index = worker_index_all.index(i)
-                features[i, :len(atoms), :] = nodes_scalar[edge_offset[worker_index]:edge_offset[worker_index]+batch['num_nodes'][worker_index], :]
+        for worker_index, i in enumerate(worker_index_all):
+            start, num_nodes = edge_offset[worker_index], batch['num_nodes'][worker_index]
+            features[i, :num_nodes, :] = nodes_scalar[start:start + num_nodes, :]
 
 
         return (
@@ -214,8 +209,7 @@ class PainnAC(AbstractActorCritic):
         dihedral = to_numpy(dihedral)
 
         for i, observation in enumerate(observations):
-            atoms, bag = self.observation_space.parse(observation)
-            positions = [atom.position for atom in atoms]
+            numbers, positions, _ = self.observation_space.parse_arrays(observation)
             new_position = zmat.position_atom_helper(
                 positions=positions,
                 focus=int(round(focus[i, 0])),
@@ -224,9 +218,8 @@ class PainnAC(AbstractActorCritic):
                 dihedral=dihedral[i, 0],
             )
             new_element = int(round(element[i, 0]))
-            atomic_number = bag[new_element][0]
-            new_atom = ase.Atom(symbol=ase.data.chemical_symbols[atomic_number], position=new_position)
-            atoms.append(new_atom)
+            atomic_number = self.observation_space.bag_space.zs[new_element]
+            atoms = ase.Atoms(numbers=np.append(numbers, atomic_number), positions=np.vstack([positions, new_position]))
             graph_state = [self.transformer(atoms)]
             batch_host = data_painn.collate_atomsdata(graph_state, pin_memory=self.pin)
             batch = {
@@ -250,8 +243,7 @@ class PainnAC(AbstractActorCritic):
 
         graph_states = []
         for i, observation in enumerate(observations):
-            atoms, bag = self.observation_space.parse(observation)
-            positions = [atom.position for atom in atoms]
+            numbers, positions, _ = self.observation_space.parse_arrays(observation)
             new_position = zmat.position_atom_helper(
                 positions=positions,
                 focus=int(round(focus[i, 0])),
@@ -260,9 +252,8 @@ class PainnAC(AbstractActorCritic):
                 dihedral=dihedral[i, 0],
             )
             new_element = int(round(element[i, 0]))
-            atomic_number = bag[new_element][0]
-            new_atom = ase.Atom(symbol=ase.data.chemical_symbols[atomic_number], position=new_position)
-            atoms.append(new_atom)
+            atomic_number = self.observation_space.bag_space.zs[new_element]
+            atoms = ase.Atoms(numbers=np.append(numbers, atomic_number), positions=np.vstack([positions, new_position]))
             graph_states.append(self.transformer(atoms))
 
 
@@ -293,7 +284,7 @@ class PainnAC(AbstractActorCritic):
         return features
 
 
-    def _get_painn_embeddings(self, input_dict: dict) -> Tuple[torch.tensor, torch.tensor, torch.tensor]:
+    def _get_painn_embeddings(self, input_dict: dict) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
 
         # Unpad and concatenate edges and features into batch (0th) dimension
         edges_displacement = layer.unpad_and_cat(
@@ -51,7 +51,7 @@ class DynamicPPOBuffer:
 
         self.current_index += 1
 
-    def finish_path(self, last_val: float) -> Tuple[Optional[float], int]:
+    def finish_path(self, last_val: float, end_index: Optional[int] = None) -> Tuple[Optional[float], int]:
         """
         Call this at the end of a trajectory, or when one gets cut off
         by an epoch ending. This looks back in the buffer to where the
@@ -65,12 +65,19 @@ class DynamicPPOBuffer:
         should be V(s_T), the value function estimated for the last state.
         This allows us to bootstrap the reward-to-go calculation to account
         for timesteps beyond the arbitrary episode horizon (or epoch cutoff).
+
+        The "end_index" argument allows finishing a trajectory that ended
+        before the most recently stored time step (e.g., when its rewards
+        only became available later). By default, the trajectory ends at
+        the current index.
         """
+        end_index = self.current_index if end_index is None else end_index
+        assert self.start_index <= end_index <= self.current_index
 
-        if self.is_finished():
+        if self.start_index == end_index:
             return None, 0
 
-        path_slice = slice(self.start_index, self.current_index)
+        path_slice = slice(self.start_index, end_index)
         rews = np.array(self.rew_buf[path_slice] + [last_val])
         vals = np.array(self.val_buf[path_slice] + [last_val])
 
@@ -82,12 +89,15 @@ class DynamicPPOBuffer:
         self.ret_buf += util.discount_cumsum(rews, self.gamma).tolist()[:-1]
 
         episodic_return = self.ret_buf[self.start_index]
-        episode_length = self.current_index - self.start_index
+        episode_length = end_index - self.start_index
 
-        self.start_index = self.current_index
+        self.start_index = end_index
 
-        # Ensure that all buffer fields have the same length
-        assert all(len(getattr(self, field)) == self.current_index for field in DynamicPPOBuffer.BUFFER_FIELDS)
+        # Ensure that all buffer fields have consistent lengths
+        assert len(self.adv_buf) == len(self.ret_buf) == self.start_index
+        assert all(
+            len(getattr(self, field)) == self.current_index for field in DynamicPPOBuffer.BUFFER_FIELDS
+            if field not in ('adv_buf', 'ret_buf'))
 
         return episodic_return, episode_length
 
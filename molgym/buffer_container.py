@@ -1,9 +1,10 @@
 import itertools
-from typing import List
+from typing import List, Optional, Tuple
 
 import numpy as np
 
 from molgym.buffer import DynamicPPOBuffer
+from molgym.environment import PendingReward, resolve_rewards
 from molgym.spaces import ObservationType
 
 
@@ -20,10 +21,17 @@ class PPOBufferContainer:
         self.episodic_returns: List[float] = []
         self.episode_lengths: List[int] = []
 
+        # Rewards that are calculated after the rollout: (buffer, index in buffer, pending reward)
+        self.pending_rewards: List[Tuple[int, int, PendingReward]] = []
+        self.num_pending_rewards = [0] * self.size
+
+        # Episodes that cannot be finished before their rewards are known: end index for every buffer
+        self.pending_ends: List[List[int]] = [[] for _ in range(self.size)]
+
     def get_num_episodes(self) -> int:
         num_returns = len(self.episodic_returns)
         assert num_returns == len(self.episode_lengths)
-        return num_returns
+        return num_returns + sum(len(ends) for ends in self.pending_ends)
 
     def store(
         self,
@@ -34,30 +42,81 @@ class PPOBufferContainer:
         terminals: np.ndarray,
         values: np.ndarray,
         logps: np.ndarray,
+        infos: Optional[List[dict]] = None,
     ) -> None:
         assert len(observations) == actions.shape[0] == rewards.shape[0] == len(
             next_observations) == terminals.shape[0] == values.shape[0] == logps.shape[0] == len(self.buffers)
 
-        for i, buffer in enumerate(self.buffers):
-            buffer.store(
-                obs=observations[i],
-                act=actions[i],
-                reward=rewards[i],
-                next_obs=next_observations[i],
-                terminal=terminals[i],
-                value=values[i],
-                logp=logps[i],
-            )
-
-            if terminals[i]:
-                episodic_ret, episode_length = buffer.finish_path(0.0)
-                assert episodic_ret is not None and episode_length > 0
-                self.episodic_returns.append(episodic_ret)
-                self.episode_lengths.append(episode_length)
+        for i in range(self.size):
+            self.store_single(index=i,
+                              observation=observations[i],
+                              action=actions[i],
+                              reward=rewards[i],
+                              next_observation=next_observations[i],
+                              terminal=terminals[i],
+                              value=values[i],
+                              logp=logps[i],
+                              info=infos[i] if infos is not None else None)
+
+    def store_single(
+        self,
+        index: int,
+        observation: ObservationType,
+        action: np.ndarray,
+        reward: float,
+        next_observation: ObservationType,
+        terminal: bool,
+        value: float,
+        logp: float,
+        info: Optional[dict] = None,
+    ) -> None:
+        # Store a step of a single environment (e.g., stepped independently of the others)
+        buffer = self.buffers[index]
+        buffer.store(
+            obs=observation,
+            act=action,
+            reward=reward,
+            next_obs=next_observation,
+            terminal=terminal,
+            value=value,
+            logp=logp,
+        )
+
+        if info is not None and 'pending_reward' in info:
+            self.pending_rewards.append((index, buffer.current_index - 1, info['pending_reward']))
+            self.num_pending_rewards[index] += 1
+
+        if terminal:
+            if self.num_pending_rewards[index] > 0:
+                self.pending_ends[index].append(buffer.current_index)
+            else:
+                self._finish_episode(buffer)
+
+    def _finish_episode(self, buffer: DynamicPPOBuffer, end_index: Optional[int] = None) -> None:
+        episodic_ret, episode_length = buffer.finish_path(0.0, end_index=end_index)
+        assert episodic_ret is not None and episode_length > 0
+        self.episodic_returns.append(episodic_ret)
+        self.episode_lengths.append(episode_length)
+
+    def resolve_rewards(self) -> None:
+        # Calculate all pending rewards in one batch, then finish the episodes that were waiting for them
+        if self.pending_rewards:
+            rewards = resolve_rewards([pending for _, _, pending in self.pending_rewards])
+            for (i, index, _), reward in zip(self.pending_rewards, rewards):
+                self.buffers[i].rew_buf[index] = reward
+            self.pending_rewards = []
+            self.num_pending_rewards = [0] * self.size
+
+        for buffer, ends in zip(self.buffers, self.pending_ends):
+            for end_index in ends:
+                self._finish_episode(buffer, end_index=end_index)
+            ends.clear()
 
     def finish_paths(self, values: np.ndarray):
         assert values.shape[0] == self.size
 
+        self.resolve_rewards()
+
         for buffer, value in zip(self.buffers, values):
             # the buffer could be already finished so we have to check
             if not buffer.is_finished():
@@ -0,0 +1,173 @@
+import collections
+import hashlib
+import logging
+import multiprocessing.util
+import os
+import sqlite3
+from typing import Optional, Dict
+
+import numpy as np
+from ase import Atoms
+
+
+def get_canonical_key(atoms: Atoms, charge: int, spin: int, method: str, decimals=4) -> str:
+    """
+    Key of a geometry that is invariant to translation, rotation (and reflection), and permutation of the atoms.
+
+    The geometry is described by the sorted multiset of (Z_i, Z_j, d_ij) over all pairs of atoms. Distinct geometries
+    with identical multisets exist but are rare in practice.
+    """
+    numbers = np.asarray(atoms.numbers, dtype=np.int64)
+    positions = np.asarray(atoms.positions, dtype=np.float64)
+
+    i, j = np.triu_indices(len(numbers), k=1)
+    distances = np.round(np.linalg.norm(positions[i] - positions[j], axis=-1), decimals=decimals) + 0.0
+    z_low = np.minimum(numbers[i], numbers[j])
+    z_high = np.maximum(numbers[i], numbers[j])
+    order = np.lexsort((distances, z_high, z_low))
+
+    composition = ','.join(f'{z}:{count}' for z, count in sorted(collections.Counter(numbers.tolist()).items()))
+
+    digest = hashlib.sha1()
+    digest.update(f'{method};{charge};{spin};{composition};'.encode())
+    digest.update(np.ascontiguousarray(z_low[order]).tobytes())
+    digest.update(np.ascontiguousarray(z_high[order]).tobytes())
+    digest.update(np.ascontiguousarray(distances[order]).tobytes())
+    return digest.hexdigest()
+
+
+def get_geometry_fingerprint(atoms: Atoms, decimals=6) -> bytes:
+    # Identifies a geometry exactly (up to rounding), i.e., atom order and orientation matter
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(atoms.numbers, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(np.round(atoms.positions, decimals=decimals) + 0.0).tobytes())
+    return digest.digest()
+
+
+def _write_energies(connection: sqlite3.Connection, energies: Dict[str, float]) -> None:
+    # Writes (and commits) the given energies in a single transaction and clears them
+    if energies:
+        connection.executemany('INSERT OR REPLACE INTO energies (key, energy) VALUES (?, ?)', list(energies.items()))
+        connection.commit()
+        energies.clear()
+
+
+class EnergyStore:
+    """
+    Content-addressed store of energies with an in-memory LRU cache in front of an (optional) SQLite database.
+    Several processes (e.g., runs with different seeds) can share the same database file. A forked process (e.g., an
+    environment worker) opens its own connection, as SQLite connections must not be used across a fork.
+
+    New energies are written to the database in batches of commit_interval, in get_info (i.e., once per iteration), in
+    close, and when the process exits.
+    """
+    def __init__(self, path: Optional[str] = None, capacity=100000, commit_interval=100) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.commit_interval = commit_interval
+
+        self.memory: 'collections.OrderedDict[str, float]' = collections.OrderedDict()
+        self.pending: Dict[str, float] = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.connection: Optional[sqlite3.Connection] = None
+        self.finalizer: Optional[multiprocessing.util.Finalize] = None
+        self.pid = os.getpid()
+        if self.path is not None:
+            self._connect(self.path)
+
+    def _connect(self, path: str) -> None:
+        # Without a path, the store consists of the in-memory cache only (and never connects)
+        self.pid = os.getpid()
+        self.connection = sqlite3.connect(path, timeout=60.0, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS energies (key TEXT PRIMARY KEY, energy REAL NOT NULL)')
+        self.connection.commit()
+
+        # Finalizers (unlike atexit handlers) are also run when a multiprocessing worker shuts down
+        self.finalizer = multiprocessing.util.Finalize(self,
+                                                       _write_energies,
+                                                       args=(self.connection, self.pending),
+                                                       exitpriority=0)
+        logging.info(f'Energy store: {path} ({self.get_disk_size()} entries)')
+
+    def _get_connection(self) -> Optional[sqlite3.Connection]:
+        # The connection inherited from the parent process is abandoned (closing it could affect the parent)
+        if self.path is not None and self.connection is not None and self.pid != os.getpid():
+            self._connect(self.path)
+        return self.connection
+
+    def get(self, key: str) -> Optional[float]:
+        energy = self.memory.get(key)
+        if energy is not None:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return energy
+
+        energy = self.pending.get(key)
+        if energy is not None:
+            self._remember(key, energy)
+            self.memory_hits += 1
+            return energy
+
+        connection = self._get_connection()
+        if connection is not None:
+            row = connection.execute('SELECT energy FROM energies WHERE key = ?', (key, )).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                self.disk_hits += 1
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, energy: float) -> None:
+        self._remember(key, energy)
+
+        # Reconnecting after a fork makes sure that the energies are written when this process exits
+        if self._get_connection() is not None:
+            self.pending[key] = energy
+            if len(self.pending) >= self.commit_interval:
+                self.flush()
+
+    def flush(self) -> None:
+        connection = self._get_connection()
+        if connection is not None:
+            _write_energies(connection, self.pending)
+
+    def _remember(self, key: str, energy: float) -> None:
+        self.memory[key] = energy
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def get_disk_size(self) -> int:
+        self.flush()
+        connection = self._get_connection()
+        if connection is None:
+            return 0
+        return connection.execute('SELECT COUNT(*) FROM energies').fetchone()[0]
+
+    def get_info(self) -> Dict[str, float]:
+        self.flush()
+        num_requests = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'store_memory_hits': self.memory_hits,
+            'store_disk_hits': self.disk_hits,
+            'store_misses': self.misses,
+            'store_hit_rate': (self.memory_hits + self.disk_hits) / num_requests if num_requests > 0 else 0.0,
+            'store_memory_size': len(self.memory),
+        }
+
+    def close(self) -> None:
+        self.flush()
+        if self.finalizer is not None:
+            self.finalizer.cancel()
+            self.finalizer = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
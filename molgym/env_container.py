@@ -1,11 +1,16 @@
+import logging
+import multiprocessing
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from multiprocessing.connection import Connection
+from typing import List, Tuple, Optional, Callable, Any
 
 import gym
 import numpy as np
 
 # The class is based on: Baselines https://github.com/openai/baselines.
-from molgym.spaces import ObservationType
+from molgym.spaces import ObservationType, ArrayObservation
 
 
 class VecEnv(ABC):
@@ -73,6 +78,28 @@ class VecEnv(ABC):
     def reset_if_terminal(self, observations: List[ObservationType], terminals: List[bool]):
         raise NotImplementedError
 
+    def submit_step(self, index: int, action) -> Future:
+        """
+        Step a single environment independently of the others.
+        Returns a future of (obs, rew, done, info).
+        """
+        raise NotImplementedError
+
+    def reset_env(self, index: int) -> ObservationType:
+        # Reset a single environment
+        raise NotImplementedError
+
+    def get_remote_infos(self, name: str) -> List[dict]:
+        """
+        Statistics (get_info) of the objects with the given attribute name (e.g., 'reward') of the environments that
+        run in other processes. The objects of environments in this process are queried by their owner directly.
+        """
+        return []
+
+    def close(self) -> None:
+        # Release the threads or worker processes running the environments
+        pass
+
 
 # This class is based on: DeepRL https://github.com/ShangtongZhang/DeepRL.
 class SimpleEnvContainer(VecEnv):
@@ -111,6 +138,18 @@ class SimpleEnvContainer(VecEnv):
 
         return new_observations
 
+    def submit_step(self, index: int, action) -> Future:
+        # Steps the environment right away
+        future: Future = Future()
+        try:
+            future.set_result(self.environments[index].step(action))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def reset_env(self, index: int) -> ObservationType:
+        return self.environments[index].reset()
+
     def get_size(self) -> int:
         return len(self.environments)
 
@@ -119,3 +158,350 @@ class SimpleEnvContainer(VecEnv):
 
     def render(self, mode='human'):
         raise NotImplementedError
+
+
+class ThreadedEnvContainer(SimpleEnvContainer):
+    """
+    Steps all environments concurrently in a pool of threads. Energy calculations (subprocesses, reward workers, or
+    native code) release the GIL, such that the rewards of all environments are calculated in parallel. Results are
+    returned in the order of the environments.
+
+    If a seed is given, environment i is seeded with seed + i, so that every environment draws from its own random
+    state independently of the order in which the threads run.
+    """
+    def __init__(self, environments: List[gym.Env], num_threads: Optional[int] = None, seed: Optional[int] = None):
+        super().__init__(environments)
+
+        if seed is not None:
+            for i, env in enumerate(self.environments):
+                env.seed(seed + i)
+
+        self.executor = ThreadPoolExecutor(max_workers=num_threads or len(self.environments),
+                                           thread_name_prefix='env')
+
+    def step_wait(self):
+        assert self.actions and len(self.environments) == len(self.actions)
+
+        data = list(self.executor.map(lambda env, action: env.step(action), self.environments, self.actions))
+
+        obs_list, rewards, done_list, infos = zip(*data)
+        return obs_list, np.array(rewards), np.array(done_list), infos
+
+    def submit_step(self, index: int, action) -> Future:
+        return self.executor.submit(self.environments[index].step, action)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class SharedObservations:
+    """
+    Observations of several environments in shared memory: the canvases (see ArrayObservation), the number of atoms
+    on each canvas, and the counts of the bags.
+    """
+    def __init__(self, num_envs: int, canvas_size: int, bag_size: int, context: Any = multiprocessing) -> None:
+        self.num_envs = num_envs
+        self.canvas_size = canvas_size
+        self.bag_size = bag_size
+
+        self.canvases_buffer = context.RawArray('d', num_envs * canvas_size * 4)
+        self.num_atoms_buffer = context.RawArray('q', num_envs)
+        self.bags_buffer = context.RawArray('q', num_envs * bag_size)
+
+    def _get_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        canvases = np.frombuffer(self.canvases_buffer, dtype=np.float64).reshape(self.num_envs, self.canvas_size, 4)
+        num_atoms = np.frombuffer(self.num_atoms_buffer, dtype=np.int64)
+        bags = np.frombuffer(self.bags_buffer, dtype=np.int64).reshape(self.num_envs, self.bag_size)
+        return canvases, num_atoms, bags
+
+    def write(self, index: int, observation: ArrayObservation) -> None:
+        canvases, num_atoms, bags = self._get_arrays()
+        canvases[index] = observation.canvas
+        num_atoms[index] = observation.num_atoms
+        bags[index] = observation.bag
+
+    def read(self, index: int) -> ArrayObservation:
+        # Copies, as the shared arrays are overwritten by the next step
+        canvases, num_atoms, bags = self._get_arrays()
+        return ArrayObservation(canvases[index].copy(), num_atoms=int(num_atoms[index]), bag=bags[index].copy())
+
+
+def _subproc_worker(remote: Connection, parent_remote: Connection, env_fns: List[Callable[[], gym.Env]],
+                    indices: List[int], observations: SharedObservations, seed: Optional[int]) -> None:
+    parent_remote.close()
+    environments = [env_fn() for env_fn in env_fns]
+    if seed is not None:
+        for env, index in zip(environments, indices):
+            env.seed(seed + index)
+
+    try:
+        while True:
+            command, data = remote.recv()
+            if command == 'step':
+                results = []
+                for env, index, action in zip(environments, indices, data):
+                    observation, reward, done, info = env.step(action)
+                    observations.write(index, observation)
+                    results.append((reward, done, info))
+                remote.send(results)
+            elif command == 'step_one':
+                # Step the environment with the given position in the group
+                position, action = data
+                observation, reward, done, info = environments[position].step(action)
+                observations.write(indices[position], observation)
+                remote.send((reward, done, info))
+            elif command == 'reset':
+                # Reset the environments with the given positions in the group
+                for position in data:
+                    observations.write(indices[position], environments[position].reset())
+                remote.send(None)
+            elif command == 'get_info':
+                # Statistics of the distinct objects with the given name (e.g., the reward shared by the environments)
+                objects = {id(obj): obj for obj in (getattr(env, data, None) for env in environments) if obj is not None}
+                remote.send([obj.get_info() for obj in objects.values()])
+            elif command == 'close':
+                break
+            else:
+                raise RuntimeError(f'Unknown command: {command}')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+class SubprocEnvContainer(VecEnv):
+    """
+    Runs groups of environments in worker processes, which communicate over pipes. Observations are returned through
+    shared memory; rewards, terminals, and infos (which must be picklable) are sent over the pipes.
+
+    Environments are created in the (forked) workers by the given functions. If a worker dies (e.g., a segmentation
+    fault in a calculation), it is restarted with new environments: the episodes of its environments are terminated
+    with min_reward and info['worker_crashed'] set.
+
+    Since infos are pickled, rewards cannot be deferred (see PendingReward). As in ThreadedEnvContainer, environment i
+    is seeded with seed + i (plus a multiple of the number of environments after restarts).
+    """
+    def __init__(
+        self,
+        env_fns: List[Callable[[], gym.Env]],
+        canvas_size: int,
+        bag_size: int,
+        num_workers: Optional[int] = None,
+        min_reward=0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        super().__init__()
+
+        self.env_fns = env_fns
+        self.num_envs = len(env_fns)
+        self.num_workers = min(num_workers or self.num_envs, self.num_envs)
+
+        # Environments are assigned to workers in turns
+        self.groups = [list(range(worker, self.num_envs, self.num_workers)) for worker in range(self.num_workers)]
+
+        # The environments (including their rewards) are inherited by forking instead of pickling
+        self.context = multiprocessing.get_context('fork')
+        self.observations = SharedObservations(num_envs=self.num_envs,
+                                               canvas_size=canvas_size,
+                                               bag_size=bag_size,
+                                               context=self.context)
+
+        self.min_reward = min_reward
+        self.seed = seed
+        self.num_restarts = 0
+
+        self.remotes: List[Connection] = [None] * self.num_workers  # type: ignore
+        self.processes: List[Any] = [None] * self.num_workers
+        for worker in range(self.num_workers):
+            self._start_worker(worker)
+
+        self.waiting = False
+
+        # Single environments are stepped by threads waiting for their worker (one request per worker at a time)
+        self.locks = [threading.Lock() for _ in range(self.num_workers)]
+        self.executor = ThreadPoolExecutor(max_workers=self.num_envs, thread_name_prefix='env')
+
+    def _start_worker(self, worker: int) -> None:
+        remote, work_remote = self.context.Pipe()
+        process = self.context.Process(target=_subproc_worker,
+                                       args=(work_remote, remote, [self.env_fns[i] for i in self.groups[worker]],
+                                             self.groups[worker], self.observations, self._get_seed()),
+                                       daemon=True)
+        process.start()
+        work_remote.close()
+
+        self.remotes[worker] = remote
+        self.processes[worker] = process
+
+    def _get_seed(self) -> Optional[int]:
+        # Restarted environments do not repeat the episodes of their predecessors
+        return self.seed + self.num_restarts * self.num_envs if self.seed is not None else None
+
+    def _restart_worker(self, worker: int) -> None:
+        logging.warning(f'Environment worker {worker} (pid {self.processes[worker].pid}) died, restarting it')
+        self.remotes[worker].close()
+        self.processes[worker].join(timeout=1.0)
+        self.num_restarts += 1
+
+        self._start_worker(worker)
+        self._reset_group(worker, list(range(len(self.groups[worker]))))
+
+    def _reset_group(self, worker: int, positions: List[int]) -> None:
+        try:
+            self.remotes[worker].send(('reset', positions))
+            self.remotes[worker].recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            # Resets all environments of the worker
+            self._restart_worker(worker)
+
+    def step_async(self, actions) -> None:
+        assert not self.waiting and len(actions) == self.num_envs
+        for worker, (remote, group) in enumerate(zip(self.remotes, self.groups)):
+            try:
+                remote.send(('step', [actions[i] for i in group]))
+            except (BrokenPipeError, ConnectionResetError):
+                # The worker is restarted in step_wait
+                pass
+        self.waiting = True
+
+    def step_wait(self):
+        assert self.waiting
+
+        rewards = np.zeros(self.num_envs)
+        terminals = np.zeros(self.num_envs, dtype=bool)
+        infos: List[dict] = [{}] * self.num_envs
+
+        for worker, (remote, group) in enumerate(zip(self.remotes, self.groups)):
+            try:
+                results = remote.recv()
+            except (EOFError, ConnectionResetError):
+                self._restart_worker(worker)
+                results = [(self.min_reward, True, {'worker_crashed': True}) for _ in group]
+
+            for i, (reward, done, info) in zip(group, results):
+                rewards[i], terminals[i], infos[i] = reward, done, info
+
+        self.waiting = False
+        return [self.observations.read(i) for i in range(self.num_envs)], rewards, terminals, infos
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        # Worker and position in its group of an environment
+        worker = index % self.num_workers
+        return worker, self.groups[worker].index(index)
+
+    def submit_step(self, index: int, action) -> Future:
+        return self.executor.submit(self._step_one, index, action)
+
+    def _step_one(self, index: int, action) -> Tuple[ObservationType, float, bool, dict]:
+        worker, position = self._locate(index)
+        with self.locks[worker]:
+            try:
+                self.remotes[worker].send(('step_one', (position, action)))
+                reward, done, info = self.remotes[worker].recv()
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                self._restart_worker(worker)
+                reward, done, info = self.min_reward, True, {'worker_crashed': True}
+            return self.observations.read(index), reward, done, info
+
+    def reset_env(self, index: int) -> ObservationType:
+        worker, position = self._locate(index)
+        with self.locks[worker]:
+            self._reset_group(worker, [position])
+            return self.observations.read(index)
+
+    def reset(self) -> List[ObservationType]:
+        for worker, group in enumerate(self.groups):
+            self._reset_group(worker, list(range(len(group))))
+        return [self.observations.read(i) for i in range(self.num_envs)]
+
+    def get_remote_infos(self, name: str) -> List[dict]:
+        infos = []
+        for worker in range(self.num_workers):
+            with self.locks[worker]:
+                try:
+                    self.remotes[worker].send(('get_info', name))
+                    infos += self.remotes[worker].recv()
+                except (EOFError, BrokenPipeError, ConnectionResetError):
+                    # Statistics of a crashed worker are lost
+                    self._restart_worker(worker)
+        return infos
+
+    def reset_if_terminal(self, observations: List[ObservationType], terminals: List[bool]) -> List[ObservationType]:
+        assert self.num_envs == len(observations) == len(terminals)
+
+        for worker, group in enumerate(self.groups):
+            positions = [position for position, i in enumerate(group) if terminals[i]]
+            if positions:
+                self._reset_group(worker, positions)
+
+        return [self.observations.read(i) if terminal else observation
+                for i, (observation, terminal) in enumerate(zip(observations, terminals))]
+
+    def get_size(self) -> int:
+        return self.num_envs
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for remote, process in zip(self.remotes, self.processes):
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            process.join(timeout=5.0)
+            remote.close()
+
+    def render(self, mode='human'):
+        raise NotImplementedError
+
+
+class ScalableEnvContainer(VecEnv):
+    """
+    Exposes the first num_active environments of a container, such that the number of environments used in a rollout
+    can be changed between rollouts (see EnvAutoscaler). Inactive environments are reset before they are used again.
+    """
+    def __init__(self, envs: VecEnv, num_active: int) -> None:
+        self.envs = envs
+        self.max_size = self.envs.get_size()
+        self.num_active = num_active
+        assert 0 < self.num_active <= self.max_size
+
+        self.futures: List[Future] = []
+
+    def set_num_active(self, num_active: int) -> None:
+        assert 0 < num_active <= self.max_size
+        self.num_active = num_active
+
+    def step_async(self, actions: List[Any]) -> None:
+        assert len(actions) == self.num_active
+        self.futures = [self.envs.submit_step(i, action) for i, action in enumerate(actions)]
+
+    def step_wait(self) -> Tuple[List[ObservationType], np.ndarray, np.ndarray, List[dict]]:
+        results = [future.result() for future in self.futures]
+        self.futures = []
+        obs_list, rewards, done_list, infos = zip(*results)
+        return list(obs_list), np.array(rewards), np.array(done_list), list(infos)
+
+    def reset(self) -> List[ObservationType]:
+        return [self.envs.reset_env(i) for i in range(self.num_active)]
+
+    def reset_if_terminal(self, observations: List[ObservationType], terminals: List[bool]) -> List[ObservationType]:
+        assert self.num_active == len(observations) == len(terminals)
+        return [self.envs.reset_env(i) if terminal else observation
+                for i, (observation, terminal) in enumerate(zip(observations, terminals))]
+
+    def submit_step(self, index: int, action) -> Future:
+        assert index < self.num_active
+        return self.envs.submit_step(index, action)
+
+    def reset_env(self, index: int) -> ObservationType:
+        assert index < self.num_active
+        return self.envs.reset_env(index)
+
+    def get_remote_infos(self, name: str) -> List[dict]:
+        return self.envs.get_remote_infos(name)
+
+    def get_size(self) -> int:
+        return self.num_active
+
+    def close(self) -> None:
+        self.envs.close()
@@ -1,19 +1,56 @@
 import abc
 import itertools
 import logging
-from typing import Tuple, List
+from typing import Tuple, List, Dict, Optional, Union
 
-import ase.data
 import gym
 import numpy as np
 from ase import Atoms, Atom
-from scipy.spatial.qhull import ConvexHull, Delaunay
+from scipy.spatial.qhull import ConvexHull
 
-from molgym.reward import InteractionReward
+from molgym.neighbors import NeighborIndex
+from molgym.prescreen import PreScreen
+from molgym.reward import InteractionReward, MolecularReward, STATUS_OK
 from molgym.spaces import ActionSpace, ObservationSpace, ActionType, ObservationType, FormulaType
+from molgym.state import MolecularState, BaseStructure
 from molgym.tools.util import remove_atom_from_formula, get_formula_size, zs_to_formula
 
 
+class PendingReward:
+    """Reward for adding atoms[len(initial_atoms):] to initial_atoms whose energies have not been calculated yet."""
+    def __init__(self, reward: MolecularReward, initial_atoms: Union[Atoms, MolecularState],
+                 atoms: Union[Atoms, MolecularState], min_reward: float, offset=0.0) -> None:
+        self.reward = reward
+        self.initial_atoms = initial_atoms
+        self.atoms = atoms
+        self.min_reward = min_reward
+        self.offset = offset
+
+    @staticmethod
+    def to_reward(value: float, info: dict, min_reward: float) -> float:
+        if info['status'] != STATUS_OK:
+            return min_reward
+        return max(value, min_reward)
+
+
+def resolve_rewards(pending_rewards: List[PendingReward]) -> List[float]:
+    # Rewards sharing the same reward object are calculated in one batch
+    groups: Dict[int, List[int]] = {}
+    for index, pending in enumerate(pending_rewards):
+        groups.setdefault(id(pending.reward), []).append(index)
+
+    rewards = [0.0] * len(pending_rewards)
+    for indices in groups.values():
+        reward = pending_rewards[indices[0]].reward
+        results = reward.calculate_batch([(pending_rewards[i].initial_atoms, pending_rewards[i].atoms)
+                                          for i in indices])
+        for i, (value, info) in zip(indices, results):
+            pending = pending_rewards[i]
+            rewards[i] = PendingReward.to_reward(value, info, min_reward=pending.min_reward) + pending.offset
+
+    return rewards
+
+
 class AbstractMolecularEnvironment(gym.Env, abc.ABC):
     # Negative reward should be on the same order of magnitude as the positive ones.
     # Memory agent on QM9: mean 0.26, std 0.13, min -0.54, max 1.23 (negative reward indeed possible
@@ -28,6 +65,9 @@ class AbstractMolecularEnvironment(gym.Env, abc.ABC):
         max_solo_distance=2.0,  # Angstrom
         min_reward=-0.6,  # Hartree
         seed=0,
+        terminal_reward=False,
+        deferred_reward=False,
+        prescreen: Optional[PreScreen] = None,
     ):
         self.reward = reward
         self.observation_space = observation_space
@@ -39,7 +79,26 @@ class AbstractMolecularEnvironment(gym.Env, abc.ABC):
         self.max_solo_distance = max_solo_distance
         self.min_reward = min_reward
 
-        self.current_atoms = Atoms()
+        # In terminal-reward mode, intermediate steps are rewarded with zero and the terminal step receives the sum of
+        # all interaction rewards of the episode, which requires only a single energy calculation. Since intermediate
+        # energies are unknown, episodes cannot be terminated early when a step falls below min_reward; instead, the
+        # terminal reward is clipped at min_reward.
+        self.terminal_reward = terminal_reward
+
+        # In deferred-reward mode, steps return a placeholder reward of zero together with a PendingReward in the info
+        # dict. The energies of all pending rewards of a rollout are then calculated in one batch (see
+        # resolve_rewards). As in terminal-reward mode, episodes are not terminated early and rewards are clipped at
+        # min_reward instead.
+        self.deferred_reward = deferred_reward
+
+        # Placements rejected by the pre-screen are treated as invalid actions (no energy calculation)
+        self.prescreen = prescreen
+
+        # Serves the distance checks of new atoms (the largest radius determines the cell size)
+        self.neighbor_index = NeighborIndex(cell_size=max(self.min_atomic_distance, self.max_solo_distance))
+
+        # Atoms on the canvas (the reward and observation take them without building an ase.Atoms object)
+        self.current_atoms = self._new_state()
         self.current_formula: FormulaType = tuple()
 
     @abc.abstractmethod
@@ -52,24 +111,31 @@ class AbstractMolecularEnvironment(gym.Env, abc.ABC):
         done = atomic_number == 0
 
         if done:
-            return self.observation_space.build(self.current_atoms, self.current_formula), 0.0, done, {}
+            reward, info = self._calculate_terminal_reward() if self.terminal_reward else (0.0, {})
+            return self.observation_space.build(self.current_atoms, self.current_formula), reward, done, info
 
         new_atom = self.action_space.to_atom(action)
         if not self._is_valid_action(current_atoms=self.current_atoms, new_atom=new_atom):
-            return (
-                self.observation_space.build(self.current_atoms, self.current_formula),
-                self.min_reward,
-                True,
-                {},
-            )
-
-        reward, info = self._calculate_reward(new_atom)
-        print(f'reward:  {reward}')
-        if reward < self.min_reward:
-            done = True
-            print(f'TERMINATING DUE TO MIN REWARD:  {reward}')
-            reward = self.min_reward
-
+            if self.terminal_reward:
+                reward, info = self._calculate_terminal_reward(offset=self.min_reward)
+            else:
+                reward, info = self.min_reward, {}
+            return self.observation_space.build(self.current_atoms, self.current_formula), reward, True, info
+
+        if self.terminal_reward:
+            reward, info = 0.0, {}
+        elif self.deferred_reward:
+            reward_atoms = self._get_reward_atoms(self.current_atoms).copy()
+            next_reward_atoms = reward_atoms.copy()
+            next_reward_atoms.append(new_atom)
+            reward, info = self._defer_reward(reward_atoms, next_reward_atoms)
+        else:
+            reward, info = self._calculate_reward(new_atom)
+            print(f'reward:  {reward}')
+            if reward < self.min_reward:
+                done = True
+                print(f'TERMINATING DUE TO MIN REWARD:  {reward}')
+                reward = self.min_reward
 
         self.current_atoms.append(new_atom)
         self.current_formula = remove_atom_from_formula(self.current_formula, atomic_number)
@@ -78,46 +144,75 @@ class AbstractMolecularEnvironment(gym.Env, abc.ABC):
         if self._is_terminal():
             done = True
 
+        if done and self.terminal_reward:
+            reward, info = self._calculate_terminal_reward()
+
         return self.observation_space.build(self.current_atoms, self.current_formula), reward, done, info
 
     def _is_terminal(self) -> bool:
         return len(self.current_atoms) == self.observation_space.canvas_space.size or get_formula_size(
             self.current_formula) == 0
 
-    def _is_valid_action(self, current_atoms: Atoms, new_atom: Atom) -> bool:
+    def _new_state(self, atoms: Optional[Union[Atoms, MolecularState]] = None) -> MolecularState:
+        # Room for a full canvas, so that no arrays are reallocated during an episode
+        capacity = self.observation_space.canvas_space.size
+        return MolecularState.from_atoms(atoms, capacity=capacity) if atoms is not None else MolecularState(capacity)
+
+    def _is_valid_action(self, current_atoms: MolecularState, new_atom: Atom) -> bool:
         if self._is_too_close(current_atoms, new_atom):
             return False
 
-        return self._all_covered(current_atoms, new_atom)
+        if not self._all_covered(current_atoms, new_atom):
+            return False
 
-    def _is_too_close(self, existing_atoms: Atoms, new_atom: Atom) -> bool:
+        return self.prescreen is None or self.prescreen.check(self._get_reward_atoms(current_atoms), new_atom) is None
+
+    def _is_too_close(self, existing_atoms: MolecularState, new_atom: Atom) -> bool:
         # Check distances between new and old atoms
-        for existing_atom in existing_atoms:
-            if np.linalg.norm(existing_atom.position - new_atom.position) < self.min_atomic_distance:
-                logging.debug('Atoms are too close')
-                return True
+        indices, _ = self.neighbor_index.query(existing_atoms, new_atom.position, radius=self.min_atomic_distance)
+        if len(indices) > 0:
+            logging.debug('Atoms are too close')
+            return True
 
         return False
 
     def _calculate_reward(self, new_atom: Atom) -> Tuple[float, dict]:
-        reward, info = self.reward.calculate(self.current_atoms, new_atom)
-        if reward == 42.0: # then it has failed
+        reward, info = self.reward.calculate(self._get_reward_atoms(self.current_atoms), new_atom)
+        if info['status'] != STATUS_OK:
             return self.min_reward, info
         return reward, info
 
-    def _all_covered(self, existing_atoms: Atoms, new_atom: Atom) -> bool:
+    def _get_initial_atoms(self) -> Union[Atoms, MolecularState]:
+        # Atoms on the canvas after a reset
+        return Atoms()
+
+    def _get_reward_atoms(self, atoms: MolecularState) -> MolecularState:
+        # Atoms taken into account by the reward
+        return atoms
+
+    def _calculate_terminal_reward(self, offset=0.0) -> Tuple[float, dict]:
+        initial_atoms = self._get_reward_atoms(self._new_state(self._get_initial_atoms()))
+        atoms = self._get_reward_atoms(self.current_atoms).copy()
+        if self.deferred_reward:
+            return self._defer_reward(initial_atoms, atoms, offset=offset)
+
+        reward, info = self.reward.calculate_terminal(initial_atoms=initial_atoms, atoms=atoms)
+        return PendingReward.to_reward(reward, info, min_reward=self.min_reward) + offset, info
+
+    def _defer_reward(self, initial_atoms: MolecularState, atoms: MolecularState, offset=0.0) -> Tuple[float, dict]:
+        pending = PendingReward(self.reward, initial_atoms=initial_atoms, atoms=atoms, min_reward=self.min_reward,
+                                offset=offset)
+        return 0.0, {'pending_reward': pending}
+
+    def _all_covered(self, existing_atoms: MolecularState, new_atom: Atom) -> bool:
         # Ensure that certain atoms are not too far away from the nearest heavy atom to avoid H2, F2,... formation
-        candidates = ['H', 'F', 'Cl', 'Br']
-        if len(existing_atoms) == 0 or new_atom.symbol not in candidates:
+        candidates = [1, 9, 17, 35]  # H, F, Cl, Br
+        if len(existing_atoms) == 0 or new_atom.number not in candidates:
             return True
 
-        for existing_atom in existing_atoms:
-            if existing_atom.symbol in candidates:
-                continue
-
-            distance = np.linalg.norm(existing_atom.position - new_atom.position)
-            if distance < self.max_solo_distance:
-                return True
+        indices, _ = self.neighbor_index.query(existing_atoms, new_atom.position, radius=self.max_solo_distance)
+        if not np.all(np.isin(existing_atoms.numbers[indices], candidates)):
+            return True
 
         logging.debug('There is a single atom floating around')
         return False
@@ -126,7 +221,7 @@ class AbstractMolecularEnvironment(gym.Env, abc.ABC):
         pass
 
     def seed(self, seed=None) -> int:
-        seed = seed or np.random.randint(int(1e5))
+        seed = seed if seed is not None else np.random.randint(int(1e5))
         self.random_state = np.random.RandomState(seed)
         return seed
 
@@ -140,52 +235,77 @@ class MolecularEnvironment(AbstractMolecularEnvironment):
         self.reset()
 
     def reset(self) -> ObservationType:
-        self.current_atoms = Atoms()
+        self.current_atoms = self._new_state()
         self.current_formula = next(self.formula_cycle)
         return self.observation_space.build(self.current_atoms, self.current_formula)
 
 
+def get_hull_equations(positions: np.ndarray) -> np.ndarray:
+    # Half-spaces (normal, offset) of the facets of the convex hull: n . x + b <= 0 for all points inside
+    return ConvexHull(positions, incremental=False).equations
+
+
+def is_inside_hull(equations: np.ndarray, positions: np.ndarray, tolerance=1e-9) -> np.ndarray:
+    # Checks a batch of positions (num_positions x 3) at once; points on the surface are inside
+    positions = np.atleast_2d(positions)
+    return np.all(positions @ equations[:, :-1].T + equations[:, -1] <= tolerance, axis=-1)
+
+
 class ConstrainedMolecularEnvironment(MolecularEnvironment):
     def __init__(self, scaffold: Atoms, scaffold_z: int, *args, **kwargs):
         self.scaffold = scaffold
         self.scaffold_z = scaffold_z
 
+        # The scaffold is fixed, so its mask and hull are computed once. Placed atoms with the scaffold's number also
+        # count as scaffold (see _get_scaffold_mask); as they have to be placed inside the hull, the hull over all
+        # scaffold atoms is the hull of the initial scaffold.
+        self.scaffold_mask = self.scaffold.numbers == self.scaffold_z
+        self.hull_equations = get_hull_equations(self.scaffold.positions[self.scaffold_mask])
+
         super().__init__(*args, **kwargs)
 
     def reset(self) -> ObservationType:
-        self.current_atoms = self.scaffold.copy()
+        self.current_atoms = self._new_state(self.scaffold)
         self.current_formula = next(self.formula_cycle)
         return self.observation_space.build(self.current_atoms, self.current_formula)
 
-    def _is_valid_action(self, current_atoms: Atoms, new_atom: Atom) -> bool:
-        is_scaffold = list(ase.data.atomic_numbers[symbol] == self.scaffold_z for symbol in current_atoms.symbols)
-        scaffold_atoms = current_atoms[is_scaffold]
+    def _get_initial_atoms(self) -> Atoms:
+        return self.scaffold
 
-        if not self._is_inside_scaffold(scaffold_positions=scaffold_atoms.positions, new_position=new_atom.position):
+    def _get_scaffold_mask(self, atoms: MolecularState) -> np.ndarray:
+        # Atoms start with the scaffold; atoms placed later are only part of it if they have the scaffold's number
+        num_scaffold = len(self.scaffold_mask)
+        return np.concatenate([self.scaffold_mask, atoms.numbers[num_scaffold:] == self.scaffold_z])
+
+    def _get_reward_atoms(self, atoms: MolecularState) -> MolecularState:
+        return atoms[np.logical_not(self._get_scaffold_mask(atoms))]
+
+    def _is_valid_action(self, current_atoms: MolecularState, new_atom: Atom) -> bool:
+        if not self._is_inside_scaffold(new_atom.position):
             logging.debug(f'Atom {new_atom} is not inside scaffold')
             return False
 
         # Make sure atom is not too close to _any_ other atom (also scaffold atoms)
         return super()._is_valid_action(current_atoms=current_atoms, new_atom=new_atom)
 
-    @staticmethod
-    def _is_inside_scaffold(scaffold_positions: np.ndarray, new_position: np.ndarray):
-        hull = ConvexHull(scaffold_positions, incremental=False)
-        vertices = scaffold_positions[hull.vertices]
-        delaunay = Delaunay(vertices)
-        return delaunay.find_simplex(new_position) >= 0
-
-    def _calculate_reward(self, new_atom: Atom) -> Tuple[float, dict]:
-        is_scaffold = list(ase.data.atomic_numbers[symbol] == self.scaffold_z for symbol in self.current_atoms.symbols)
-        return self.reward.calculate(self.current_atoms[np.logical_not(is_scaffold)], new_atom)
+    def _is_inside_scaffold(self, new_position: np.ndarray) -> bool:
+        return bool(is_inside_hull(self.hull_equations, new_position)[0])
 
 
 class RefillableMolecularEnvironment(AbstractMolecularEnvironment):
-    def __init__(self, formulas: List[FormulaType], initial_structure: Atoms, num_refills: int, *args, **kwargs):
+    def __init__(self, formulas: List[FormulaType], initial_structure: Union[Atoms, BaseStructure], num_refills: int,
+                 *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.formulas = formulas
-        self.atoms = initial_structure.copy()
+
+        # The initial structure is shared by all episodes (and all environments, if they are given the same
+        # BaseStructure); every episode only stores the atoms added to it
+        if not isinstance(initial_structure, BaseStructure):
+            initial_structure = BaseStructure(initial_structure)
+        self.base = initial_structure
+        self.neighbor_index.index_base(self.base)
+
         self.num_refills = num_refills
         self.formulas_cycle = itertools.cycle(self.formulas)
 
@@ -207,10 +327,13 @@ class RefillableMolecularEnvironment(AbstractMolecularEnvironment):
 
     def reset(self) -> ObservationType:
         self.current_refill_counter = 0
-        self.current_atoms = self.atoms.copy()
+        self.current_atoms = self._new_state(self._get_initial_atoms())
         self.current_formula = next(self.formulas_cycle)
         return self.observation_space.build(self.current_atoms, self.current_formula)
 
+    def _get_initial_atoms(self) -> MolecularState:
+        return MolecularState(capacity=0, base=self.base)
+
 
 class StochasticEnvironment(AbstractMolecularEnvironment):
     def __init__(self, formula: FormulaType, size_range: Tuple[int, int], *args, **kwargs):
@@ -235,7 +358,7 @@ class StochasticEnvironment(AbstractMolecularEnvironment):
         self.reset()
 
     def reset(self) -> ObservationType:
-        self.current_atoms = Atoms()
+        self.current_atoms = self._new_state()
         self.current_formula = self.sample_formula()
         while not self.is_valid_formula(self.current_formula):
             self.current_formula = self.sample_formula()
@@ -247,7 +370,7 @@ class StochasticEnvironment(AbstractMolecularEnvironment):
             size = self.random_state.randint(low=self.min_size, high=self.max_size, size=1)
         else:
             size = self.max_size
-        zs = np.random.choice(self.zs, size=size, replace=True, p=self.z_probs)
+        zs = self.random_state.choice(self.zs, size=size, replace=True, p=self.z_probs)
         return zs_to_formula(zs)
 
     def is_valid_formula(self, formula: FormulaType) -> bool:
@@ -0,0 +1,101 @@
+import itertools
+from typing import Dict, List, Tuple, Optional, Union
+
+import numpy as np
+from ase import Atoms
+
+from molgym.state import MolecularState, BaseStructure
+
+# Offsets of a cell and its 26 neighbors
+NEIGHBOR_OFFSETS = list(itertools.product((-1, 0, 1), repeat=3))
+
+
+class CellList:
+    """
+    Indices of points sorted into cubic cells, such that all points within cell_size of a position are found in the
+    cell of the position and its 26 neighbors.
+    """
+    def __init__(self, cell_size: float) -> None:
+        assert cell_size > 0.0
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int, int], List[int]] = {}
+
+    def _get_cell(self, position: np.ndarray) -> Tuple[int, int, int]:
+        return tuple(np.floor(np.asarray(position) / self.cell_size).astype(int).tolist())  # type: ignore
+
+    def add(self, index: int, position: np.ndarray) -> None:
+        self.cells.setdefault(self._get_cell(position), []).append(index)
+
+    def get_candidates(self, position: np.ndarray) -> np.ndarray:
+        # Indices of all points in the cell of the position and its neighbors
+        i, j, k = self._get_cell(position)
+        indices = [index for di, dj, dk in NEIGHBOR_OFFSETS for index in self.cells.get((i + di, j + dj, k + dk), ())]
+        return np.array(indices, dtype=int)
+
+
+class NeighborIndex:
+    """
+    Finds the atoms within a radius of a position, e.g., to check the placement of a new atom for clashes.
+
+    For small canvases, the distances to all atoms are calculated in a single vectorized operation. Canvases with more
+    than cell_list_threshold atoms are indexed by a cell list (with cells at least as large as the largest radius)
+    that is updated incrementally: since environments only ever append atoms to their state, atoms added since the
+    last query are indexed, and a new (or shorter) state is indexed from scratch. The base structure of a state is
+    indexed once and shared by all environments (see index_base).
+    """
+    def __init__(self, cell_size: float, cell_list_threshold=64) -> None:
+        self.cell_size = cell_size
+        self.cell_list_threshold = cell_list_threshold
+
+        self.atoms: Optional[Union[Atoms, MolecularState, BaseStructure]] = None
+        self.cell_list: Optional[CellList] = None
+        self.num_indexed = 0
+
+    def index_base(self, base: BaseStructure) -> 'NeighborIndex':
+        # Index the base structure up front (before it is queried by several threads)
+        if base.neighbor_index is None:
+            base.neighbor_index = NeighborIndex(self.cell_size, cell_list_threshold=self.cell_list_threshold)
+            base.neighbor_index._update(base, base.positions)
+        return base.neighbor_index
+
+    def _update(self, atoms: Union[Atoms, MolecularState, BaseStructure], positions: np.ndarray) -> None:
+        if atoms is not self.atoms or len(positions) < self.num_indexed:
+            self.atoms = atoms
+            self.cell_list = None
+            self.num_indexed = 0
+
+        if self.cell_list is None:
+            if len(positions) <= self.cell_list_threshold:
+                return
+            self.cell_list = CellList(self.cell_size)
+            self.num_indexed = 0
+
+        for index in range(self.num_indexed, len(positions)):
+            self.cell_list.add(index, positions[index])
+        self.num_indexed = len(positions)
+
+    def query(self, atoms: Union[Atoms, MolecularState], position: np.ndarray,
+              radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Indices and distances of the atoms closer than radius to the position."""
+        if not isinstance(atoms, MolecularState) or atoms.base is None:
+            return self._query(atoms, atoms.positions, position, radius)
+
+        # Atoms of the base come first
+        base = atoms.base
+        base_index = self.index_base(base)
+        base_indices, base_distances = base_index._query(base, base.positions, position, radius)
+        indices, distances = self._query(atoms, atoms.overlay_positions, position, radius)
+        return np.concatenate([base_indices, indices + len(base)]), np.concatenate([base_distances, distances])
+
+    def _query(self, atoms: Union[Atoms, MolecularState, BaseStructure], positions: np.ndarray, position: np.ndarray,
+               radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        self._update(atoms, positions)
+
+        if self.cell_list is not None and radius <= self.cell_size:
+            candidates = self.cell_list.get_candidates(position)
+        else:
+            candidates = np.arange(len(positions))
+
+        distances = np.linalg.norm(positions[candidates] - np.asarray(position), axis=-1)
+        is_close = distances < radius
+        return candidates[is_close], distances[is_close]
@@ -1,6 +1,7 @@
 # The content of this file is based on: DeepRL https://github.com/ShangtongZhang/DeepRL.
 import logging
 import time
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 from typing import Dict, Optional, Tuple, Sequence, List, Iterator
 
 import numpy as np
@@ -11,8 +12,13 @@ from molgym.agents.base import AbstractActorCritic
 from molgym.buffer import DynamicPPOBuffer
 from molgym.buffer_container import PPOBufferContainer
 from molgym.env_container import VecEnv
+from molgym.prescreen import PreScreen
+from molgym.reward import MolecularReward
+from molgym.tools.autoscaler import EnvAutoscaler
+from molgym.tools.resources import ResourcePlanner
 from molgym.tools.model_util import ModelIO
-from molgym.tools.util import RolloutSaver, to_numpy, InfoSaver, compute_gradient_norm
+from molgym.tools.util import (RolloutSaver, to_numpy, InfoSaver, compute_gradient_norm, get_cpu_time,
+                               get_elapsed_cpu_time, merge_infos)
 
 
 def compute_loss(
@@ -165,9 +171,14 @@ def batch_rollout(ac: AbstractActorCritic,
                   envs: VecEnv,
                   buffer_container: PPOBufferContainer,
                   num_steps: int = None,
-                  num_episodes: int = None) -> dict:
+                  num_episodes: int = None,
+                  asynchronous=False) -> dict:
     assert num_steps is not None or num_episodes is not None
 
+    if asynchronous:
+        assert num_steps is not None and num_episodes is None
+        return async_batch_rollout(ac=ac, envs=envs, buffer_container=buffer_container, num_steps=num_steps)
+
     if num_steps is not None:
         assert num_steps % envs.get_size() == 0
         num_iters = num_steps // envs.get_size()
@@ -180,14 +191,23 @@ def batch_rollout(ac: AbstractActorCritic,
         num_episodes = np.inf
 
     start_time = time.time()
+    start_cpu_time = get_cpu_time()
 
     counter = 0
     observations = envs.reset()
 
+    # Time spent in the policy and in the environments (including rewards)
+    policy_time = 0.0
+    env_time = 0.0
+
     while counter < num_iters and buffer_container.get_num_episodes() < num_episodes:
+        policy_start = time.time()
         predictions = ac.step(observations)
+        env_start = time.time()
 
-        next_observations, rewards, terminals, _ = envs.step(predictions['actions'])
+        next_observations, rewards, terminals, infos = envs.step(predictions['actions'])
+        policy_time += env_start - policy_start
+        env_time += time.time() - env_start
 
         buffer_container.store(observations=observations,
                                actions=to_numpy(predictions['a']),
@@ -195,20 +215,34 @@ def batch_rollout(ac: AbstractActorCritic,
                                next_observations=next_observations,
                                terminals=terminals,
                                values=to_numpy(predictions['v']),
-                               logps=to_numpy(predictions['logp']))
+                               logps=to_numpy(predictions['logp']),
+                               infos=infos)
 
         # Reset environment if state is terminal to get valid next observation
         observations = envs.reset_if_terminal(next_observations, terminals)
 
         if counter == num_iters - 1:
+            # Calculate rewards that were deferred during the rollout
+            env_start = time.time()
+            buffer_container.resolve_rewards()
+            env_time += time.time() - env_start
+
             # Note: finished trajectories will not be affected by this
             predictions = ac.step(observations)
             buffer_container.finish_paths(to_numpy(predictions['v']))
 
         counter += 1
 
+    # Rollouts limited by the number of episodes do not finish their paths
+    env_start = time.time()
+    buffer_container.resolve_rewards()
+    env_time += time.time() - env_start
+
     info = {
         'time': time.time() - start_time,
+        'cpu_time': get_elapsed_cpu_time(start_cpu_time),
+        'policy_time': policy_time,
+        'env_time': env_time,
         'return_mean': np.mean(buffer_container.episodic_returns).item(),
         'return_std': np.std(buffer_container.episodic_returns).item(),
         'episode_length_mean': np.mean(buffer_container.episode_lengths).item(),
@@ -218,6 +252,88 @@ def batch_rollout(ac: AbstractActorCritic,
     return info
 
 
+def async_batch_rollout(ac: AbstractActorCritic, envs: VecEnv, buffer_container: PPOBufferContainer,
+                        num_steps: int) -> dict:
+    """
+    Rollout in which the environments are not stepped in lockstep: the policy is called on whichever environments
+    have finished their previous step (in batches of varying size), and every step is stored as soon as it arrives.
+    Slow steps (e.g., long energy calculations) thus only hold up their own environment. The budget of num_steps is
+    shared by all environments.
+    """
+    start_time = time.time()
+    start_cpu_time = get_cpu_time()
+
+    observations = list(envs.reset())
+
+    # Environments waiting for an action, and the pending steps of the others (with the predictions of the policy)
+    ready = list(range(envs.get_size()))
+    pending: Dict[Future, Tuple[int, dict]] = {}
+    num_submitted = 0
+
+    # Time spent in the policy and waiting for the environments (including rewards)
+    policy_time = 0.0
+    env_time = 0.0
+
+    while pending or (ready and num_submitted < num_steps):
+        if ready and num_submitted < num_steps:
+            batch = ready[:num_steps - num_submitted]
+            ready = ready[len(batch):]
+
+            policy_start = time.time()
+            predictions = ac.step([observations[i] for i in batch])
+            actions = to_numpy(predictions['a'])
+            values = to_numpy(predictions['v'])
+            logps = to_numpy(predictions['logp'])
+            policy_time += time.time() - policy_start
+
+            for k, i in enumerate(batch):
+                prediction = dict(action=actions[k], value=values[k], logp=logps[k])
+                pending[envs.submit_step(i, predictions['actions'][k])] = (i, prediction)
+            num_submitted += len(batch)
+
+        env_start = time.time()
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, prediction = pending.pop(future)
+            next_observation, reward, terminal, info = future.result()
+            buffer_container.store_single(index=i,
+                                          observation=observations[i],
+                                          action=prediction['action'],
+                                          reward=reward,
+                                          next_observation=next_observation,
+                                          terminal=terminal,
+                                          value=prediction['value'],
+                                          logp=prediction['logp'],
+                                          info=info)
+
+            # Reset environment if state is terminal to get valid next observation
+            observations[i] = envs.reset_env(i) if terminal else next_observation
+            ready.append(i)
+        env_time += time.time() - env_start
+
+    # Calculate rewards that were deferred during the rollout
+    env_start = time.time()
+    buffer_container.resolve_rewards()
+    env_time += time.time() - env_start
+
+    # Note: finished trajectories will not be affected by this
+    policy_start = time.time()
+    predictions = ac.step(observations)
+    policy_time += time.time() - policy_start
+    buffer_container.finish_paths(to_numpy(predictions['v']))
+
+    return {
+        'time': time.time() - start_time,
+        'cpu_time': get_elapsed_cpu_time(start_cpu_time),
+        'policy_time': policy_time,
+        'env_time': env_time,
+        'return_mean': np.mean(buffer_container.episodic_returns).item(),
+        'return_std': np.std(buffer_container.episodic_returns).item(),
+        'episode_length_mean': np.mean(buffer_container.episode_lengths).item(),
+        'episode_length_std': np.std(buffer_container.episode_lengths).item(),
+    }
+
+
 def compute_buffer_stats(buffer: DynamicPPOBuffer) -> Dict[str, float]:
     return {
         'value_mean': np.mean(buffer.val_buf).item(),
@@ -252,6 +368,11 @@ def batch_ppo(
     save_train_rollout=False,
     save_eval_rollout=True,
     info_saver: Optional[InfoSaver] = None,
+    reward: Optional[MolecularReward] = None,
+    prescreen: Optional[PreScreen] = None,
+    resource_planner: Optional[ResourcePlanner] = None,
+    async_rollout=False,
+    autoscaler: Optional[EnvAutoscaler] = None,
     device=None,
 ):
     """
@@ -289,6 +410,11 @@ def batch_ppo(
         :param save_train_rollout: Save training rollout
         :param save_eval_rollout: Save evaluation rollout
         :param info_saver: Save statistics
+        :param reward: Reward whose statistics are saved every iteration
+        :param prescreen: Pre-screen of placements whose statistics are saved every iteration
+        :param resource_planner: Re-plans the threads of rewards and policy based on the time spent on each
+        :param async_rollout: Step the training environments independently of each other (see async_batch_rollout)
+        :param autoscaler: Adapts the number of training environments after every training rollout
         :param device: device on which to run the calculations
     """
 
@@ -304,7 +430,11 @@ def batch_ppo(
 
         # Training rollout
         train_container = PPOBufferContainer(size=envs.get_size(), gamma=gamma, lam=lam)
-        train_rollout = batch_rollout(ac=ac, envs=envs, buffer_container=train_container, num_steps=num_steps_per_iter)
+        train_rollout = batch_rollout(ac=ac,
+                                      envs=envs,
+                                      buffer_container=train_container,
+                                      num_steps=num_steps_per_iter,
+                                      asynchronous=async_rollout)
         logging.info(
             f'Training rollout: return={train_rollout["return_mean"]:.3f} ({train_rollout["return_std"]:.1f}), '
             f'episode length={train_rollout["episode_length_mean"]:.1f}')
@@ -324,6 +454,7 @@ def batch_ppo(
         data = train_buffer.get_data()
 
         # Train policy
+        train_start = time.time()
         if train_rollout['return_std'] != 0.0:
             opt_info = train(
                 ac=ac,
@@ -338,11 +469,22 @@ def batch_ppo(
                 max_num_steps=max_num_train_iters,
                 device=device,
             )
+        train_time = time.time() - train_start
 
         if info_saver:
             opt_info['total_num_steps'] = total_num_steps
             info_saver.save(opt_info, name='opt')
 
+        if resource_planner:
+            resource_planner.update(reward_time=train_rollout['env_time'],
+                                    policy_time=train_rollout['policy_time'] + train_time)
+
+        if autoscaler:
+            decision = autoscaler.update(train_rollout)
+            if info_saver:
+                decision['total_num_steps'] = total_num_steps
+                info_saver.save(decision, name='autoscaler')
+
         # Update number of steps taken / trained
         total_num_steps += num_steps_per_iter
 
@@ -373,6 +515,17 @@ def batch_ppo(
             if rollout_saver and save_eval_rollout:
                 rollout_saver.save(eval_buffer, num_steps=total_num_steps, info='eval')
 
+        # Statistics include the copies of the reward and the pre-screen in environment workers (if any)
+        if info_saver and reward:
+            reward_info = merge_infos([reward.get_info()] + envs.get_remote_infos('reward'))
+            reward_info['total_num_steps'] = total_num_steps
+            info_saver.save(reward_info, name='reward')
+
+        if info_saver and prescreen:
+            prescreen_info = merge_infos([prescreen.get_info()] + envs.get_remote_infos('prescreen'))
+            prescreen_info['total_num_steps'] = total_num_steps
+            info_saver.save(prescreen_info, name='prescreen')
+
         # Save model
         if model_handler and ((iteration % save_freq == 0) or (iteration == num_iterations - 1)):
             model_handler.save(ac, num_steps=total_num_steps)
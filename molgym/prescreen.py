@@ -0,0 +1,171 @@
+import logging
+import threading
+from typing import Optional, Dict
+
+import ase.data
+import numpy as np
+from ase import Atoms, Atom
+
+# Reasons for rejecting a placement
+REJECTED_OVERLAP = 'overlap'
+REJECTED_FRAGMENTS = 'fragments'
+REJECTED_VALENCE = 'valence'
+
+# Maximum number of covalent bonds of common elements (hypervalent main-group elements included)
+MAX_VALENCES = {
+    1: 1,
+    5: 4,
+    6: 4,
+    7: 4,
+    8: 3,
+    9: 1,
+    14: 4,
+    15: 5,
+    16: 6,
+    17: 1,
+    35: 1,
+    53: 1,
+}
+
+
+class UnionFind:
+    """Disjoint sets of the integers 0, ..., n - 1 with path compression and union by size."""
+    def __init__(self, n: int) -> None:
+        self.parents = list(range(n))
+        self.sizes = [1] * n
+        self.num_sets = n
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[i] != root:
+            self.parents[i], i = root, self.parents[i]
+        return root
+
+    def union(self, i: int, j: int) -> None:
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return
+        if self.sizes[root_i] < self.sizes[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parents[root_j] = root_i
+        self.sizes[root_i] += self.sizes[root_j]
+        self.num_sets -= 1
+
+
+def get_pair_distance_table(scale: float) -> np.ndarray:
+    # Sums of covalent radii of all pairs of elements times the scale
+    radii = ase.data.covalent_radii
+    return scale * (radii[:, np.newaxis] + radii[np.newaxis, :])
+
+
+class PreScreen:
+    """
+    Cheap geometric checks of placements whose energy calculation is doomed to fail (SCC not converging) or whose
+    reward would be clipped at min_reward anyway. Rejected placements are treated like invalid actions, i.e., they
+    receive min_reward without an energy calculation.
+
+    - Overlap: a distance between the new atom and any other atom is shorter than overlap_scale times the sum of their
+      covalent radii.
+    - Fragments: the molecule consists of more than max_fragments covalently bonded fragments (bonds are distances
+      shorter than bond_scale times the sum of covalent radii).
+    - Valence: the new atom or one of its bonding partners exceeds its maximum number of bonds (see MAX_VALENCES).
+
+    In terminal-reward mode, rejected placements end the episode with a terminal reward calculation as usual, such that
+    no calculations are saved; otherwise, every rejection saves the calculation of the molecule with the new atom and
+    of the remainder (see InteractionReward).
+    """
+    def __init__(
+        self,
+        overlap_scale: Optional[float] = 0.5,
+        bond_scale=1.2,
+        max_fragments: Optional[int] = None,
+        check_valence=False,
+        terminal_reward=False,
+    ) -> None:
+        self.overlap_scale = overlap_scale
+        self.bond_scale = bond_scale
+        self.max_fragments = max_fragments
+        self.check_valence = check_valence
+        self.calls_per_rejection = 0 if terminal_reward else 2
+
+        self.min_distances = get_pair_distance_table(overlap_scale) if overlap_scale is not None else None
+        self.bond_distances = get_pair_distance_table(bond_scale)
+
+        # Statistics since the last call of get_info (shared by environments stepped in several threads)
+        self.lock = threading.Lock()
+        self.num_checks = 0
+        self.rejections: Dict[str, int] = {REJECTED_OVERLAP: 0, REJECTED_FRAGMENTS: 0, REJECTED_VALENCE: 0}
+
+    def check(self, atoms: Atoms, new_atom: Atom) -> Optional[str]:
+        """Reason for rejecting the placement of new_atom, or None if it passes all checks."""
+        reason = self._check(atoms, new_atom)
+        with self.lock:
+            self.num_checks += 1
+            if reason is not None:
+                self.rejections[reason] += 1
+        if reason is not None:
+            logging.debug(f'Placement of {new_atom.symbol} rejected by pre-screen ({reason})')
+        return reason
+
+    def _check(self, atoms: Atoms, new_atom: Atom) -> Optional[str]:
+        z = new_atom.number
+        distances = np.linalg.norm(atoms.positions - new_atom.position, axis=-1)
+
+        if self.min_distances is not None and np.any(distances < self.min_distances[z, atoms.numbers]):
+            return REJECTED_OVERLAP
+
+        partners = np.flatnonzero(distances < self.bond_distances[z, atoms.numbers])
+
+        if self.check_valence and not self._is_valence_valid(atoms, z, partners):
+            return REJECTED_VALENCE
+
+        if self.max_fragments is not None and self._get_num_fragments(atoms, partners) > self.max_fragments:
+            return REJECTED_FRAGMENTS
+
+        return None
+
+    def _get_bonds(self, atoms: Atoms) -> np.ndarray:
+        i, j = np.triu_indices(len(atoms), k=1)
+        distances = np.linalg.norm(atoms.positions[i] - atoms.positions[j], axis=-1)
+        bonded = distances < self.bond_distances[atoms.numbers[i], atoms.numbers[j]]
+        return np.stack([i[bonded], j[bonded]], axis=-1)
+
+    def _get_num_fragments(self, atoms: Atoms, partners: np.ndarray) -> int:
+        # The new atom has index len(atoms)
+        union_find = UnionFind(len(atoms) + 1)
+        for i, j in self._get_bonds(atoms):
+            union_find.union(i, j)
+        for i in partners:
+            union_find.union(i, len(atoms))
+        return union_find.num_sets
+
+    def _is_valence_valid(self, atoms: Atoms, z: int, partners: np.ndarray) -> bool:
+        if len(partners) > MAX_VALENCES.get(z, len(partners)):
+            return False
+
+        num_bonds = np.zeros(len(atoms), dtype=int)
+        for i, j in self._get_bonds(atoms):
+            num_bonds[i] += 1
+            num_bonds[j] += 1
+
+        for i in partners:
+            if num_bonds[i] + 1 > MAX_VALENCES.get(atoms.numbers[i], num_bonds[i] + 1):
+                return False
+
+        return True
+
+    def get_info(self) -> Dict[str, float]:
+        with self.lock:
+            info: Dict[str, float] = {
+                'prescreen_checks': self.num_checks,
+                'prescreen_saved_calls': self.calls_per_rejection * sum(self.rejections.values()),
+                **{'prescreen_' + reason: count
+                   for reason, count in self.rejections.items()},
+            }
+
+            self.num_checks = 0
+            self.rejections = {reason: 0 for reason in self.rejections}
+
+        return info
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+from typing import Dict, Optional, Sequence, Tuple, Any
+
+import ase.data
+from ase import Atoms
+
+from molgym.worker_pool import EnergyPool
+
+# Increase whenever the energies of a method change (e.g., new settings), so that old tables are not used anymore
+REFERENCE_ENERGIES_VERSION = 1
+
+
+def get_reference_key(symbol: str, charge: int, spin: int, method: str) -> str:
+    return f'{method}:{symbol}:{charge}:{spin}'
+
+
+def get_atom_spin(symbol: str, charge: int) -> int:
+    # Number of unpaired electrons of an isolated atom in its lowest spin state
+    return (ase.data.atomic_numbers[symbol] - charge) % 2
+
+
+class ReferenceEnergies:
+    """Versioned table of energies of isolated atoms, keyed by method, charge, and spin."""
+    def __init__(self, energies: Optional[Dict[str, float]] = None) -> None:
+        self.energies: Dict[str, float] = energies or {}
+
+    def get(self, symbol: str, charge: int, spin: int, method: str) -> Optional[float]:
+        return self.energies.get(get_reference_key(symbol, charge=charge, spin=spin, method=method))
+
+    def set(self, symbol: str, charge: int, spin: int, method: str, energy: float) -> None:
+        self.energies[get_reference_key(symbol, charge=charge, spin=spin, method=method)] = energy
+
+    def __len__(self) -> int:
+        return len(self.energies)
+
+    def save(self, path: str) -> None:
+        with open(path, mode='w') as f:
+            json.dump({'version': REFERENCE_ENERGIES_VERSION, 'energies': self.energies}, f, indent=4, sort_keys=True)
+
+    @classmethod
+    def load(cls, path: str) -> 'ReferenceEnergies':
+        with open(path, mode='r') as f:
+            data = json.load(f)
+
+        if data.get('version') != REFERENCE_ENERGIES_VERSION:
+            logging.warning(f'Ignoring reference energies of version {data.get("version")} in {path}')
+            return cls()
+
+        return cls(energies=data['energies'])
+
+
+def compute_reference_energies(
+    table: ReferenceEnergies,
+    symbols: Sequence[str],
+    backend: Any,
+    pool: Optional[EnergyPool] = None,
+    charge=0,
+) -> None:
+    """Add missing energies of the isolated atoms to the table; with a pool, all atoms are calculated in parallel."""
+    jobs: Dict[str, Tuple[Atoms, int, int]] = {}
+    for symbol in symbols:
+        spin = get_atom_spin(symbol, charge=charge)
+        if table.get(symbol, charge=charge, spin=spin, method=backend.method) is None:
+            jobs[symbol] = (Atoms(symbol), charge, spin)
+
+    if not jobs:
+        return
+
+    logging.info(f'Calculating reference energies of {", ".join(jobs.keys())} ({backend.method})')
+    if pool is not None:
+        energies = pool.map(list(jobs.values()))
+    else:
+        energies = [backend.calculate(atoms, charge=c, spin=s) for atoms, c, s in jobs.values()]
+
+    for (symbol, (_, c, s)), energy in zip(jobs.items(), energies):
+        table.set(symbol, charge=c, spin=s, method=backend.method, energy=energy)
+
+
+def get_reference_energies(
+    path: str,
+    symbols: Sequence[str],
+    backend: Any,
+    pool: Optional[EnergyPool] = None,
+    charge=0,
+) -> ReferenceEnergies:
+    # Load the table (if it exists), calculate missing energies, and store it again
+    table = ReferenceEnergies.load(path) if os.path.isfile(path) else ReferenceEnergies()
+
+    num_energies = len(table)
+    compute_reference_energies(table, symbols=symbols, backend=backend, pool=pool, charge=charge)
+
+    if len(table) != num_energies:
+        table.save(path)
+        logging.info(f'Saved reference energies: {path}')
+
+    return table
@@ -1,11 +1,310 @@
 import abc
+import collections
+import logging
+import tempfile
+import threading
 import time
-from typing import Tuple, Dict
+from concurrent.futures import Future
+from typing import Tuple, Dict, Optional, List
 
+import ase.data
 import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
 from ase import Atoms, Atom
+from ase.calculators.calculator import CalculationFailed
 
-from molgym.xtb import XTB
+from molgym import xtb
+from molgym.energy_store import EnergyStore, get_canonical_key, get_geometry_fingerprint
+from molgym.reference_energies import ReferenceEnergies
+from molgym.state import MolecularState, BaseStructure, to_atoms
+from molgym.surrogate import SurrogateEnergyModel
+from molgym.worker_pool import EnergyPool, get_default_scratch_root, get_scratch_directory, get_num_threads
+
+# Outcome of a reward calculation, reported as info['status']
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+
+# Energy (None if the calculation has failed) and status of a calculation
+EnergyResult = Tuple[Optional[float], str]
+
+
+def get_failure_status(error: BaseException) -> str:
+    return STATUS_TIMEOUT if isinstance(error, TimeoutError) else STATUS_FAILED
+
+
+def get_status(results: List[EnergyResult]) -> str:
+    # A reward depending on several energies has failed if any of them has failed
+    for _, status in results:
+        if status != STATUS_OK:
+            return status
+    return STATUS_OK
+
+
+def get_energy(result: EnergyResult) -> float:
+    # Energy of a successful calculation
+    energy, status = result
+    assert status == STATUS_OK and energy is not None, 'Calculation has failed'
+    return energy
+
+
+class EnergyBackend(abc.ABC):
+    """Calculates the energy (in Hartree) of a molecule given its charge and number of unpaired electrons."""
+    method = ''
+
+    @abc.abstractmethod
+    def calculate(self, atoms: Atoms, charge: int, spin: int) -> float:
+        raise NotImplementedError
+
+    def get_restart(self, atoms: Atoms) -> Optional[bytes]:
+        # State of the last calculation of the molecule to warm-start the next step from (None if not supported)
+        return None
+
+    def set_restart(self, atoms: Atoms, restart: bytes) -> None:
+        pass
+
+
+class XTBBackend(EnergyBackend):
+    """
+    Runs GFN2-xTB as a subprocess on files in a scratch directory. Calculations exceeding the timeout are killed and
+    not retried. Failed calculations (e.g., SCC not converging) are retried with relaxed settings: a higher electronic
+    temperature and more SCC iterations.
+
+    With warm_start, the SCC of a molecule starts from the converged charges of the same molecule without its last
+    atom (i.e., the previous step of an episode), if this calculation has been run by the same process before. A
+    WorkerPool passes these restart files between its workers (see get_restart and set_restart).
+
+    With force_field, the much cheaper GFN-FF is used instead of GFN2-xTB.
+
+    num_threads and stacksize set the OpenMP threads of xtb (inside a WorkerPool, the number of threads of the pool
+    takes precedence).
+    """
+    method = 'gfn2-xtb'
+
+    def __init__(
+        self,
+        max_iterations=196,
+        scratch_root: Optional[str] = None,
+        timeout: Optional[float] = None,  # seconds
+        num_retries=1,
+        fallback_temperature=1000.0,  # Kelvin
+        warm_start=False,
+        restart_cache_size=1024,
+        force_field=False,
+        num_threads: Optional[int] = None,
+        stacksize: Optional[str] = None,
+    ) -> None:
+        assert not (warm_start and force_field), 'GFN-FF cannot be warm-started'
+        self.force_field = force_field
+        if self.force_field:
+            self.method = 'gfn-ff'
+
+        self.settings = {
+            'scc': {'maxiterations': max_iterations},
+        }
+        self.fallback_settings = {
+            'scc': {'maxiterations': 2 * max_iterations, 'temp': fallback_temperature},
+        }
+        self.scratch_root = scratch_root
+        self.timeout = timeout
+        self.num_retries = num_retries
+        self.num_threads = num_threads
+        self.stacksize = stacksize
+
+        # Restart files of the last calculations by geometry fingerprint
+        self.warm_start = warm_start
+        self.restart_cache_size = restart_cache_size
+        self.restarts: 'collections.OrderedDict[bytes, bytes]' = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def calculate(self, atoms: Atoms, charge: int, spin: int) -> float:
+        restart = self._get_restart(atoms, spin=spin) if self.warm_start else None
+
+        # Fall back to a cold start if the warm-started calculation fails (a timeout would only repeat itself)
+        if restart is not None:
+            try:
+                return self._calculate(atoms, settings={'chrg': charge, **self.settings, 'spin': spin}, restart=restart)
+            except CalculationFailed as e:
+                logging.warning(f'Warm-started xtb calculation failed ({e}), retrying with cold start')
+
+        for attempt in range(self.num_retries + 1):
+            settings = self.settings if attempt == 0 else self.fallback_settings
+            try:
+                return self._calculate(atoms, settings={'chrg': charge, **settings, 'spin': spin})
+            except CalculationFailed as e:
+                if attempt == self.num_retries:
+                    raise
+                logging.warning(f'xtb calculation failed ({e}), retrying with relaxed settings')
+
+        raise RuntimeError('Unreachable')
+
+    def _calculate(self, atoms: Atoms, settings: dict, restart: Optional[bytes] = None) -> float:
+        # Inside a worker of a WorkerPool, the worker's scratch directory is used
+        directory = get_scratch_directory()
+        if directory is not None:
+            return self._calculate_in_directory(atoms, settings=settings, directory=directory, restart=restart)
+
+        scratch_root = self.scratch_root or get_default_scratch_root()
+        with tempfile.TemporaryDirectory(prefix='molgym-xtb-', dir=scratch_root) as directory:
+            return self._calculate_in_directory(atoms, settings=settings, directory=directory, restart=restart)
+
+    def _calculate_in_directory(self, atoms: Atoms, settings: dict, directory: str, restart: Optional[bytes]) -> float:
+        energy = xtb.calculate_energy(atoms,
+                                      settings=settings,
+                                      directory=directory,
+                                      timeout=self.timeout,
+                                      restart=restart,
+                                      keep_restart=self.warm_start,
+                                      force_field=self.force_field,
+                                      num_threads=get_num_threads() or self.num_threads,
+                                      stacksize=self.stacksize)
+        if self.warm_start:
+            restart = xtb.read_restart(directory)
+            if restart is not None:
+                self.set_restart(atoms, restart)
+        return energy
+
+    def _get_restart(self, atoms: Atoms, spin: int) -> Optional[bytes]:
+        if len(atoms) < 2:
+            return None
+
+        restart = self.get_restart(atoms[:-1])
+        if restart is None:
+            return None
+
+        return xtb.pad_restart(restart, numbers=atoms.numbers[-1:], spin=spin)
+
+    def get_restart(self, atoms: Atoms) -> Optional[bytes]:
+        if not self.warm_start:
+            return None
+
+        with self.lock:
+            return self.restarts.get(get_geometry_fingerprint(atoms))
+
+    def set_restart(self, atoms: Atoms, restart: bytes) -> None:
+        if not self.warm_start:
+            return
+
+        with self.lock:
+            self.restarts[get_geometry_fingerprint(atoms)] = restart
+            while len(self.restarts) > self.restart_cache_size:
+                self.restarts.popitem(last=False)
+
+    def __getstate__(self) -> dict:
+        # Locks cannot be pickled; every process creates its own
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+class SparrowBackend(EnergyBackend):
+    """
+    Runs a semi-empirical method (e.g., PM6 or DFTB3) of SCINE Sparrow in-process. A calculation is a sequence of calls
+    that change the state of the calculator, so every thread (e.g., of a ThreadedEnvContainer) has its own calculator.
+    """
+    def __init__(self, method='PM6') -> None:
+        self.sparrow_method = method
+        self.method = 'sparrow-' + method.lower()
+        self.local = threading.local()
+
+    def _create_calculator(self):
+        # Imported here as scine_sparrow is an optional dependency
+        from molgym.calculator import Sparrow
+        return Sparrow(self.sparrow_method)
+
+    def _get_calculator(self):
+        calculator = getattr(self.local, 'calculator', None)
+        if calculator is None:
+            calculator = self.local.calculator = self._create_calculator()
+        return calculator
+
+    def calculate(self, atoms: Atoms, charge: int, spin: int) -> float:
+        calculator = self._get_calculator()
+        calculator.set_elements(list(atoms.symbols))
+        calculator.set_positions(atoms.positions)
+        calculator.set_settings({'molecular_charge': charge, 'spin_multiplicity': spin + 1})
+        return calculator.calculate_energy()
+
+    def __getstate__(self) -> dict:
+        # Calculators cannot be pickled; every process creates its own
+        state = self.__dict__.copy()
+        del state['local']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+
+class MorseBackend(EnergyBackend):
+    """
+    Deterministic, analytic Morse pair potential for testing and benchmarking without a quantum chemistry program.
+    Equilibrium distances are sums of covalent radii, well depths are geometric means of per-element values.
+    Latency, timeouts, and failures can be injected to emulate a real backend.
+    """
+    method = 'morse'
+
+    # Well depths (in Hartree) roughly on the order of homonuclear bond energies
+    well_depths = {
+        1: 0.165,
+        5: 0.110,
+        6: 0.135,
+        7: 0.150,
+        8: 0.190,
+        9: 0.060,
+        15: 0.080,
+        16: 0.100,
+        17: 0.090,
+        35: 0.075,
+    }
+    default_well_depth = 0.1
+
+    def __init__(
+        self,
+        width=1.8,
+        latency=0.0,
+        latency_jitter=0.0,
+        failure_rate=0.0,
+        timeout: Optional[float] = None,
+        seed=0,
+    ) -> None:
+        self.width = width  # 1/Angstrom
+
+        self.latency = latency  # seconds
+        self.latency_jitter = latency_jitter  # seconds
+        self.failure_rate = failure_rate
+        self.timeout = timeout  # seconds
+        self.random_state = np.random.RandomState(seed=seed)
+
+    def calculate(self, atoms: Atoms, charge: int, spin: int) -> float:
+        if self.latency > 0 or self.latency_jitter > 0:
+            latency = self.latency + self.latency_jitter * self.random_state.rand()
+            if self.timeout is not None and latency > self.timeout:
+                time.sleep(self.timeout)
+                raise TimeoutError(f'Simulated energy calculation did not finish within {self.timeout} s')
+            time.sleep(latency)
+
+        if self.failure_rate > 0 and self.random_state.rand() < self.failure_rate:
+            raise RuntimeError('Simulated failure of energy calculation')
+
+        return self.get_energy(atoms.numbers, atoms.positions)
+
+    def get_energy(self, numbers: np.ndarray, positions: np.ndarray) -> float:
+        i, j = np.triu_indices(len(numbers), k=1)
+        distances = np.linalg.norm(positions[i] - positions[j], axis=-1)
+
+        depths = np.array([self.well_depths.get(z, self.default_well_depth) for z in numbers])
+        radii = ase.data.covalent_radii[numbers]
+
+        well_depth = np.sqrt(depths[i] * depths[j])
+        equilibrium = radii[i] + radii[j]
+        repulsion = np.square(1.0 - np.exp(-self.width * (distances - equilibrium)))
+        return float(np.sum(well_depth * (repulsion - 1.0)))
 
 
 class MolecularReward(abc.ABC):
@@ -13,6 +312,18 @@ class MolecularReward(abc.ABC):
     def calculate(self, atoms: Atoms, new_atom: Atom) -> Tuple[float, dict]:
         raise NotImplementedError
 
+    def calculate_terminal(self, initial_atoms: Atoms, atoms: Atoms) -> Tuple[float, dict]:
+        # Sum of the rewards of adding atoms[len(initial_atoms):] one by one to initial_atoms
+        return self.calculate_batch([(initial_atoms, atoms)])[0]
+
+    def calculate_batch(self, transitions: List[Tuple[Atoms, Atoms]]) -> List[Tuple[float, dict]]:
+        # Same as calculate_terminal for every (initial_atoms, atoms) pair
+        raise NotImplementedError
+
+    def get_info(self) -> Dict[str, float]:
+        # Statistics of the reward calculations so far
+        return {}
+
     @staticmethod
     def get_minimum_spin_multiplicity(atoms: Atoms) -> int:
         return atoms.numbers.sum() % 2 + 1
@@ -23,84 +334,496 @@ class MolecularReward(abc.ABC):
 
 
 class InteractionReward(MolecularReward):
-    def __init__(self) -> None:
-        self.calculator = XTB()
+    def __init__(
+        self,
+        backend: Optional[EnergyBackend] = None,
+        pool: Optional[EnergyPool] = None,
+        incremental=False,
+        incremental_cache_size=1024,
+        store: Optional[EnergyStore] = None,
+        reference_energies: Optional[ReferenceEnergies] = None,
+        surrogate: Optional[SurrogateEnergyModel] = None,
+    ) -> None:
+        self.backend = backend if backend is not None else XTBBackend()
 
-        self.settings = {
-            'chrg': 0,
-            'scc': {'maxiterations': 196},
-        }
+        # If a pool is given, energies are calculated by its workers instead of in this process
+        self.pool = pool
+        assert self.pool is None or self.pool.backend.method == self.backend.method, 'Pool uses a different method'
+
+        # Energies that have been calculated before (possibly by another run) are taken from the store
+        self.store = store
 
+        # In incremental mode, the total energy of a step is reused as the energy of the unchanged part in the next
+        # step of the same episode. Several environments can share this reward, so the last energies are looked up by
+        # geometry fingerprint.
+        self.incremental = incremental
+        self.incremental_cache_size = incremental_cache_size
+        self.last_energies: 'collections.OrderedDict[bytes, float]' = collections.OrderedDict()
+
+        # Energies of isolated atoms are taken from the (precomputed) reference energies if available
+        self.reference_energies = reference_energies
+
+        # Confident predictions of the surrogate model replace calculations; all calculated energies train it
+        self.surrogate = surrogate
+
+        self.charge = 0
         self.atom_energies: Dict[str, float] = {}
 
+        # Environments stepped by several threads share this reward: the lock guards the caches, store, and surrogate,
+        # but not the calculations (or the training of the surrogate) themselves
+        self.lock = threading.RLock()
+
     def calculate(self, atoms: Atoms, new_atom: Atom) -> Tuple[float, dict]:
         start = time.time()
 
-        all_atoms = atoms.copy()
+        # Atoms may be an ase.Atoms object or a MolecularState
+        all_atoms = MolecularState.from_atoms(atoms, capacity=len(atoms) + 1)
         all_atoms.append(new_atom)
 
-        e_tot = self._calculate_energy(all_atoms)
-        e_parts = self._calculate_energy(atoms) + self._calculate_atomic_energy(new_atom)
-        delta_e = e_tot - e_parts
-        print(f'e_tot: {e_tot},   delta_e: {delta_e}')
-        elapsed = time.time() - start
-
-        reward = -1 * delta_e
+        (e_tot, e_atoms), reused = self._calculate_total_and_remainder(all_atoms, atoms)
+        e_new_atom = self._calculate_atomic_energy(new_atom)
+        status = get_status([e_tot, e_atoms, e_new_atom])
 
         info = {
-            'elapsed_time': elapsed,
+            'elapsed_time': time.time() - start,
+            'energy_reused': reused,
+            'status': status,
         }
 
-        if e_tot == 42.0:
-            return 42.0, info
+        if status != STATUS_OK:
+            return 0.0, info
+
+        delta_e = get_energy(e_tot) - (get_energy(e_atoms) + get_energy(e_new_atom))
+        print(f'e_tot: {e_tot[0]},   delta_e: {delta_e}')
 
-        return reward, info
+        return -1 * delta_e, info
+
+    def calculate_batch(self, transitions: List[Tuple[Atoms, Atoms]]) -> List[Tuple[float, dict]]:
+        # The interaction rewards telescope: only the first and the last energy of every transition are needed.
+        # Structures shared between transitions (e.g., consecutive steps of an episode) are calculated once.
+        start = time.time()
 
-    def _calculate_atomic_energy(self, atom: Atom) -> float:
+        structures: 'collections.OrderedDict[bytes, Atoms]' = collections.OrderedDict()
+        for initial_atoms, atoms in transitions:
+            structures.setdefault(get_geometry_fingerprint(initial_atoms), initial_atoms)
+            structures.setdefault(get_geometry_fingerprint(atoms), atoms)
+
+        energies = dict(zip(structures.keys(), self._calculate_energies(list(structures.values()))))
+        elapsed = time.time() - start
+
+        results = []
+        for initial_atoms, atoms in transitions:
+            e_tot = energies[get_geometry_fingerprint(atoms)]
+            e_initial = energies[get_geometry_fingerprint(initial_atoms)]
+            e_new_atoms = [self._calculate_atomic_energy(atom) for atom in atoms[len(initial_atoms):]]
+            status = get_status([e_tot, e_initial] + e_new_atoms)
+
+            info = {
+                'elapsed_time': elapsed,
+                'energy_reused': False,
+                'status': status,
+            }
+
+            if status != STATUS_OK:
+                results.append((0.0, info))
+                continue
+
+            delta_e = get_energy(e_tot) - (get_energy(e_initial) + sum(get_energy(result) for result in e_new_atoms))
+            results.append((-1 * delta_e, info))
+
+        return results
+
+    def _calculate_atomic_energy(self, atom: Atom) -> EnergyResult:
         if atom.symbol not in self.atom_energies:
             atoms = Atoms()
             atoms.append(atom)
-            self.atom_energies[atom.symbol] = self._calculate_energy(atoms)
-        return self.atom_energies[atom.symbol]
+            energy = None
+            if self.reference_energies is not None:
+                energy = self.reference_energies.get(atom.symbol,
+                                                     charge=self.charge,
+                                                     spin=self.get_spin(atoms),
+                                                     method=self.backend.method)
+            if energy is None:
+                result = self._calculate_energy(atoms)
+                if result[1] != STATUS_OK:
+                    return result
+                energy = get_energy(result)
+            with self.lock:
+                self.atom_energies[atom.symbol] = energy
+        return self.atom_energies[atom.symbol], STATUS_OK
+
+    def _calculate_total_and_remainder(self, all_atoms: Atoms, atoms: Atoms) -> Tuple[List[EnergyResult], bool]:
+        e_atoms = self._get_last_energy(atoms) if self.incremental else None
+        reused = e_atoms is not None
+
+        if e_atoms is None:
+            e_tot, remainder = self._calculate_energies([all_atoms, atoms])
+        else:
+            e_tot, remainder = self._calculate_energy(all_atoms), (e_atoms, STATUS_OK)
 
-    def _calculate_energy(self, atoms: Atoms) -> float:
+        if self.incremental and e_tot[1] == STATUS_OK:
+            self._set_last_energy(all_atoms, get_energy(e_tot))
+
+        return [e_tot, remainder], reused
+
+    def _get_last_energy(self, atoms: Atoms) -> Optional[float]:
         if len(atoms) == 0:
             return 0.0
-        self.calculator = XTB()
-        self.settings['spin'] = self.get_spin(atoms)
-        self.calculator.set(**self.settings)
-        self.calculator.atoms = atoms
-        try:
-            energy = self.calculator.get_potential_energy()
-        except:
-            print('XTB calculation has FAILED!')
-            energy = 42.0
+
+        key = get_geometry_fingerprint(atoms)
+        with self.lock:
+            energy = self.last_energies.get(key)
+            if energy is not None:
+                self.last_energies.move_to_end(key)
         return energy
 
+    def _set_last_energy(self, atoms: Atoms, energy: float) -> None:
+        with self.lock:
+            self.last_energies[get_geometry_fingerprint(atoms)] = energy
+            while len(self.last_energies) > self.incremental_cache_size:
+                self.last_energies.popitem(last=False)
+
+    def _calculate_energy(self, atoms: Atoms) -> EnergyResult:
+        return self._calculate_energies([atoms])[0]
+
+    def get_info(self) -> Dict[str, float]:
+        info = {}
+        with self.lock:
+            if self.store is not None:
+                info.update(self.store.get_info())
+            if self.surrogate is not None:
+                info.update(self.surrogate.get_info())
+        return info
+
+    def _get_store_key(self, atoms: Atoms) -> str:
+        return get_canonical_key(atoms, charge=self.charge, spin=self.get_spin(atoms), method=self.backend.method)
+
+    def _calculate_energies(self, atoms_list: List[Atoms]) -> List[EnergyResult]:
+        # The energy of a base structure shared by several environments is only calculated once (per method)
+        results: List[Optional[EnergyResult]] = [self._get_base_energy(atoms) for atoms in atoms_list]
+        missing = [i for i, result in enumerate(results) if result is None]
+        for i, result in zip(missing, self._lookup_or_compute_energies([atoms_list[i] for i in missing])):
+            results[i] = result
+            base = self._get_base(atoms_list[i])
+            if result[1] == STATUS_OK and base is not None:
+                base.energies[self.backend.method] = get_energy(result)
+
+        return results  # type: ignore
+
+    def _get_base_energy(self, atoms: Atoms) -> Optional[EnergyResult]:
+        base = self._get_base(atoms)
+        if base is not None and self.backend.method in base.energies:
+            return base.energies[self.backend.method], STATUS_OK
+        return None
+
+    @staticmethod
+    def _get_base(atoms: Atoms) -> Optional[BaseStructure]:
+        # Base structure if the atoms consist of it only
+        if isinstance(atoms, MolecularState) and atoms.is_base():
+            return atoms.base
+        return None
+
+    def _lookup_or_compute_energies(self, atoms_list: List[Atoms]) -> List[EnergyResult]:
+        if self.store is None and self.surrogate is None:
+            return self._compute_energies(atoms_list)
+
+        # The surrogate model takes ase.Atoms objects
+        if self.surrogate is not None:
+            atoms_list = [to_atoms(atoms) for atoms in atoms_list]
+
+        results: List[Optional[EnergyResult]] = []
+        with self.lock:
+            for atoms in atoms_list:
+                if len(atoms) == 0:
+                    results.append((0.0, STATUS_OK))
+                    continue
+                energy = self.store.get(self._get_store_key(atoms)) if self.store is not None else None
+                results.append((energy, STATUS_OK) if energy is not None else None)
+
+            if self.surrogate is not None:
+                # Isolated atoms are always calculated
+                candidates = [i for i, result in enumerate(results) if result is None and len(atoms_list[i]) > 1]
+                for i, energy in zip(candidates, self.surrogate.get_confident([atoms_list[i] for i in candidates])):
+                    if energy is not None:
+                        results[i] = (energy, STATUS_OK)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        computed = self._compute_energies([atoms_list[i] for i in missing])
+
+        with self.lock:
+            for i, result in zip(missing, computed):
+                results[i] = result
+                if result[1] != STATUS_OK:
+                    if self.surrogate is not None:
+                        self.surrogate.discard(atoms_list[i])
+                    continue
+                energy = get_energy(result)
+                if self.store is not None:
+                    self.store.put(self._get_store_key(atoms_list[i]), energy)
+                if self.surrogate is not None and len(atoms_list[i]) > 1:
+                    self.surrogate.add(atoms_list[i], energy, train=False)
+
+        if self.surrogate is not None:
+            self._train_surrogate(self.surrogate)
+
+        return results  # type: ignore
+
+    def _train_surrogate(self, surrogate: SurrogateEnergyModel) -> None:
+        # Only one thread trains at a time; the others keep using the current models meanwhile
+        with self.lock:
+            if not surrogate.is_due():
+                return
+            data = surrogate.start_training()
+
+        trained = surrogate.fit(data)
+
+        with self.lock:
+            surrogate.finish_training(trained)
+
+    def _compute_energies(self, atoms_list: List[Atoms]) -> List[EnergyResult]:
+        if self.pool is None:
+            return [self._calculate_energy_in_process(atoms) for atoms in atoms_list]
+
+        # Submit all calculations first so that they run concurrently
+        futures: List[Optional[Future]] = [
+            self.pool.submit(to_atoms(atoms), charge=self.charge, spin=self.get_spin(atoms)) if len(atoms) > 0 else None
+            for atoms in atoms_list
+        ]
+        return [self._get_result(future) for future in futures]
+
+    def _calculate_energy_in_process(self, atoms: Atoms) -> EnergyResult:
+        if len(atoms) == 0:
+            return 0.0, STATUS_OK
+        try:
+            return self.backend.calculate(to_atoms(atoms), charge=self.charge, spin=self.get_spin(atoms)), STATUS_OK
+        except Exception as e:
+            print('Energy calculation has FAILED!')
+            return None, get_failure_status(e)
+
+    @staticmethod
+    def _get_result(future: Optional[Future]) -> EnergyResult:
+        if future is None:
+            return 0.0, STATUS_OK
+        try:
+            return future.result(), STATUS_OK
+        except Exception as e:
+            print('Energy calculation has FAILED!')
+            return None, get_failure_status(e)
+
+
+def get_fragments(atoms: Atoms, bond_scale=1.2) -> np.ndarray:
+    # Label of the covalently bonded fragment (e.g., solvent molecule) of every atom
+    if len(atoms) == 0:
+        return np.zeros(0, dtype=int)
+
+    radii = ase.data.covalent_radii[atoms.numbers]
+    distances = np.linalg.norm(atoms.positions[:, np.newaxis] - atoms.positions[np.newaxis, :], axis=-1)
+    bonded = distances < bond_scale * (radii[:, np.newaxis] + radii[np.newaxis, :])
+    _, labels = scipy.sparse.csgraph.connected_components(scipy.sparse.csr_matrix(bonded), directed=False)
+    return labels
+
+
+def get_local_region(atoms: Atoms, centers: np.ndarray, cutoff: float) -> np.ndarray:
+    """
+    Indices of all atoms of the fragments with at least one atom within the cutoff of any of the centers.
+    Only whole fragments are included, so that no bonds are cut and neutral fragments stay neutral.
+    """
+    if len(atoms) == 0:
+        return np.zeros(0, dtype=int)
+
+    distances = np.linalg.norm(atoms.positions[:, np.newaxis] - np.asarray(centers)[np.newaxis, :], axis=-1)
+    is_close = np.any(distances < cutoff, axis=-1)
+
+    labels = get_fragments(atoms)
+    return np.flatnonzero(np.isin(labels, labels[is_close]))
+
 
 class SolvationReward(InteractionReward):
-    def __init__(self, distance_penalty=0.01) -> None:
-        super().__init__()
+    """
+    Interaction reward with a penalty for the distance of new atoms from the origin.
+
+    If a cutoff is given, the interaction energy of new atoms is calculated with the local region of the cluster only,
+    i.e., all fragments with an atom within the cutoff of a new atom. Every full_check_interval calls, the reward of the
+    full cluster is calculated as well (and returned) to monitor the truncation error.
+    """
+    def __init__(
+        self,
+        distance_penalty=0.01,
+        backend: Optional[EnergyBackend] = None,
+        pool: Optional[EnergyPool] = None,
+        incremental=False,
+        store: Optional[EnergyStore] = None,
+        reference_energies: Optional[ReferenceEnergies] = None,
+        surrogate: Optional[SurrogateEnergyModel] = None,
+        cutoff: Optional[float] = None,  # Angstrom
+        full_check_interval=0,
+    ) -> None:
+        super().__init__(backend=backend,
+                         pool=pool,
+                         incremental=incremental,
+                         store=store,
+                         reference_energies=reference_energies,
+                         surrogate=surrogate)
 
         self.distance_penalty = distance_penalty
 
-    def calculate(self, atoms: Atoms, new_atom: Atom) -> Tuple[float, dict]:
-        start_time = time.time()
-        self.calculator = XTB()
+        self.cutoff = cutoff
+        self.full_check_interval = full_check_interval
+        self.num_calls = 0
 
-        all_atoms = atoms.copy()
+        # Statistics since the last call of get_info
+        self.region_sizes: List[int] = []
+        self.truncation_errors: List[float] = []
+
+    def calculate(self, atoms: Atoms, new_atom: Atom) -> Tuple[float, dict]:
+        all_atoms = MolecularState.from_atoms(atoms, capacity=len(atoms) + 1)
         all_atoms.append(new_atom)
+        return self.calculate_batch([(atoms, all_atoms)])[0]
+
+    def calculate_batch(self, transitions: List[Tuple[Atoms, Atoms]]) -> List[Tuple[float, dict]]:
+        if self.cutoff is None:
+            return self._calculate_penalized(transitions)
+
+        regions = [self._truncate(initial_atoms, atoms, cutoff=self.cutoff) for initial_atoms, atoms in transitions]
+        results = self._calculate_penalized(regions)
+
+        checks = []
+        with self.lock:
+            for i, (initial_atoms, _) in enumerate(regions):
+                self.region_sizes.append(len(initial_atoms))
+                self.num_calls += 1
+                if self.full_check_interval > 0 and self.num_calls % self.full_check_interval == 0:
+                    checks.append(i)
+
+        for i, (reward, info) in zip(checks, self._calculate_penalized([transitions[i] for i in checks])):
+            truncated_reward, truncated_info = results[i]
+            if info['status'] == STATUS_OK and truncated_info['status'] == STATUS_OK:
+                self.truncation_errors.append(truncated_reward - reward)
+            results[i] = reward, {**info, 'truncation_error': truncated_reward - reward}
 
-        e_tot = self._calculate_energy(all_atoms)
-        e_parts = self._calculate_energy(atoms) + self._calculate_atomic_energy(new_atom)
-        delta_e = e_tot - e_parts
+        return results
 
-        distance = np.linalg.norm(new_atom.position)
+    @staticmethod
+    def _truncate(initial_atoms: Atoms, atoms: Atoms, cutoff: float) -> Tuple[Atoms, Atoms]:
+        new_atoms = atoms[len(initial_atoms):]
+        region = MolecularState.from_atoms(
+            initial_atoms[get_local_region(initial_atoms, centers=new_atoms.positions, cutoff=cutoff)])
+        return region, region + new_atoms
+
+    def _calculate_penalized(self, transitions: List[Tuple[Atoms, Atoms]]) -> List[Tuple[float, dict]]:
+        if len(transitions) == 1 and len(transitions[0][1]) == len(transitions[0][0]) + 1:
+            # Single steps can reuse the energy of the previous step (in incremental mode)
+            initial_atoms, atoms = transitions[0]
+            results = [super().calculate(initial_atoms, atoms[-1])]
+        else:
+            results = super().calculate_batch(transitions)
+
+        penalized = []
+        for (initial_atoms, atoms), (reward, info) in zip(transitions, results):
+            if info['status'] == STATUS_OK:
+                distances = np.linalg.norm(atoms.positions[len(initial_atoms):], axis=-1)
+                reward -= self.distance_penalty * float(np.sum(distances))
+            penalized.append((reward, info))
+        return penalized
+
+    def get_info(self) -> Dict[str, float]:
+        info = super().get_info()
+        if self.region_sizes:
+            info['region_size_mean'] = float(np.mean(self.region_sizes))
+        if self.truncation_errors:
+            info['truncation_mae'] = float(np.mean(np.abs(self.truncation_errors)))
+            info['truncation_count'] = len(self.truncation_errors)
+
+        self.region_sizes = []
+        self.truncation_errors = []
 
-        reward = -1 * (delta_e + self.distance_penalty * distance)
+        return info
+
+
+class TieredReward(MolecularReward):
+    """
+    Scores every placement with a cheap reward (e.g., GFN-FF or a pair potential) first. Only placements scoring at
+    least the threshold, and a random fraction of all placements for calibration, are calculated with the expensive
+    reward; the others receive the cheap reward.
+    """
+    def __init__(
+        self,
+        cheap: MolecularReward,
+        expensive: MolecularReward,
+        threshold: float,
+        calibration_fraction=0.05,
+        seed=0,
+    ) -> None:
+        self.cheap = cheap
+        self.expensive = expensive
+        self.threshold = threshold
+        self.calibration_fraction = calibration_fraction
+        self.random_state = np.random.RandomState(seed=seed)
+        self.lock = threading.Lock()
+
+        # Statistics since the last call of get_info
+        self.num_cheap = 0
+        self.num_expensive = 0
+        self.calibration_errors: List[float] = []
+
+    def calculate(self, atoms: Atoms, new_atom: Atom) -> Tuple[float, dict]:
+        cheap_result = self.cheap.calculate(atoms, new_atom)
+        calibrate = self.random_state.rand() < self.calibration_fraction
+        if not self._is_promising(cheap_result, calibrate):
+            with self.lock:
+                self.num_cheap += 1
+            return cheap_result[0], {**cheap_result[1], 'tier': 'cheap'}
 
+        with self.lock:
+            self.num_expensive += 1
+        reward, info = self.expensive.calculate(atoms, new_atom)
+        self._calibrate(cheap_result, (reward, info), calibrate)
+        return reward, {**info, 'tier': 'expensive'}
+
+    def calculate_batch(self, transitions: List[Tuple[Atoms, Atoms]]) -> List[Tuple[float, dict]]:
+        cheap_results = self.cheap.calculate_batch(transitions)
+        calibrate = self.random_state.rand(len(transitions)) < self.calibration_fraction
+
+        results = [(reward, {**info, 'tier': 'cheap'}) for reward, info in cheap_results]
+        selected = [i for i, result in enumerate(cheap_results) if self._is_promising(result, calibrate[i])]
+        for i, (reward, info) in zip(selected, self.expensive.calculate_batch([transitions[i] for i in selected])):
+            self._calibrate(cheap_results[i], (reward, info), calibrate[i])
+            results[i] = reward, {**info, 'tier': 'expensive'}
+
+        with self.lock:
+            self.num_expensive += len(selected)
+            self.num_cheap += len(transitions) - len(selected)
+
+        return results
+
+    def _is_promising(self, cheap_result: Tuple[float, dict], calibrate: bool) -> bool:
+        reward, info = cheap_result
+        return calibrate or info['status'] != STATUS_OK or reward >= self.threshold
+
+    def _calibrate(self, cheap_result: Tuple[float, dict], result: Tuple[float, dict], calibrate: bool) -> None:
+        if calibrate and cheap_result[1]['status'] == STATUS_OK and result[1]['status'] == STATUS_OK:
+            with self.lock:
+                self.calibration_errors.append(cheap_result[0] - result[0])
+
+    def get_info(self) -> Dict[str, float]:
+        with self.lock:
+            num_cheap, num_expensive, calibration_errors = self.num_cheap, self.num_expensive, self.calibration_errors
+            self.num_cheap = 0
+            self.num_expensive = 0
+            self.calibration_errors = []
+
+        num_calculations = num_cheap + num_expensive
         info = {
-            'elapsed_time': time.time() - start_time,
+            **self.expensive.get_info(),
+            'tier_cheap': num_cheap,
+            'tier_expensive': num_expensive,
+            'tier_expensive_fraction': num_expensive / num_calculations if num_calculations > 0 else 0.0,
+            'calibration_count': len(calibration_errors),
         }
 
-        return reward, info
+        if calibration_errors:
+            errors = np.array(calibration_errors)
+            info['calibration_mae'] = float(np.mean(np.abs(errors)))
+            info['calibration_bias'] = float(np.mean(errors))
+
+        return info
@@ -0,0 +1,303 @@
+import functools
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, Connection
+from typing import Optional, Dict, Tuple, Union
+
+import numpy as np
+from ase import Atoms
+
+from molgym.energy_store import EnergyStore, get_canonical_key
+from molgym.reward import EnergyBackend, STATUS_OK, STATUS_TIMEOUT, get_failure_status
+from molgym.worker_pool import EnergyPool, WorkerPool, get_scratch_directory
+
+AUTHKEY_VARIABLE = 'MOLGYM_REWARD_AUTHKEY'
+AUTHKEY_FILE_VARIABLE = 'MOLGYM_REWARD_AUTHKEY_FILE'
+MIN_AUTHKEY_LENGTH = 16
+
+Address = Union[str, Tuple[str, int]]
+
+
+def get_authkey() -> bytes:
+    """
+    Secret key shared by the reward server and its clients: the content of the file named by MOLGYM_REWARD_AUTHKEY_FILE
+    or the value of MOLGYM_REWARD_AUTHKEY. Both sides unpickle the messages they receive, so anyone knowing the key can
+    run code on the server; there is no default key.
+    """
+    path = os.environ.get(AUTHKEY_FILE_VARIABLE)
+    if path:
+        with open(path, mode='rb') as f:
+            authkey = f.read().strip()
+    else:
+        authkey = os.environ.get(AUTHKEY_VARIABLE, '').encode()
+
+    if not authkey:
+        raise RuntimeError(f'No secret key for the reward server: set {AUTHKEY_VARIABLE} or {AUTHKEY_FILE_VARIABLE}')
+    return authkey
+
+
+def _check_authkey(authkey: bytes) -> None:
+    if len(authkey) < MIN_AUTHKEY_LENGTH:
+        raise ValueError(f'Secret key of the reward server must have at least {MIN_AUTHKEY_LENGTH} bytes')
+
+
+def parse_address(address: str) -> Address:
+    # 'host:port' is a TCP address, anything else is the path of a Unix socket
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return host or 'localhost', int(port)
+    return address
+
+
+def _to_future(energy: float) -> Future:
+    future: Future = Future()
+    future.set_result(energy)
+    return future
+
+
+class RewardServer:
+    """
+    Calculates energies for any number of clients (e.g., training runs with different seeds) that connect over a Unix
+    socket or a TCP connection. Requests are queued for a fixed-size pool of workers; identical geometries requested
+    while being calculated are calculated only once, and all calculated energies are kept in a shared store.
+
+    Clients are authenticated with a secret key (see get_authkey), which is required as requests are unpickled.
+    """
+    def __init__(
+        self,
+        backend: EnergyBackend,
+        address: Address,
+        authkey: bytes,
+        num_workers: Optional[int] = None,
+        store: Optional[EnergyStore] = None,
+        scratch_root: Optional[str] = None,
+    ) -> None:
+        _check_authkey(authkey)
+        self.backend = backend
+        self.store = store if store is not None else EnergyStore()
+        self.pool = WorkerPool(num_workers=num_workers or os.cpu_count() or 1,
+                               backend=self.backend,
+                               scratch_root=scratch_root)
+
+        # Start the workers before accepting connections, so that forked workers do not inherit (and keep open) the
+        # sockets of clients
+        self.pool.executor.submit(get_scratch_directory).result()
+
+        self.authkey = authkey
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.serving = False
+        self.closed = False
+
+        # Calculations currently queued or running by canonical key; guards the store as well
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, Future] = {}
+
+        # Statistics since the last call of get_info
+        self.num_requests = 0
+        self.num_deduplicated = 0
+        self.num_calculated = 0
+
+    def serve_forever(self) -> None:
+        logging.info(f'Reward server listening on {self.address} ({self.backend.method}, '
+                     f'{self.pool.num_workers} workers)')
+        self.serving = True
+        try:
+            while not self.closed:
+                try:
+                    connection = self.listener.accept()
+                except (OSError, EOFError, AuthenticationError) as e:
+                    logging.warning(f'Could not accept connection: {e}')
+                    continue
+                if self.closed:
+                    connection.close()
+                    break
+                threading.Thread(target=self._serve_client, args=(connection, ), daemon=True).start()
+        finally:
+            self.serving = False
+
+    def _serve_client(self, connection: Connection) -> None:
+        send_lock = threading.Lock()
+
+        def send(message: tuple) -> None:
+            with send_lock:
+                try:
+                    connection.send(message)
+                except OSError:
+                    logging.warning('Could not send message to disconnected client')
+
+        def respond(request_id: int, future: Future) -> None:
+            send(self._get_response(request_id, future))
+
+        try:
+            while True:
+                message = connection.recv()
+                kind = message[0]
+                if kind == 'method':
+                    send(('method', self.backend.method))
+                elif kind == 'info':
+                    send(('info', self.get_info()))
+                elif kind == 'close':
+                    break
+                elif kind == 'calculate':
+                    _, request_id, numbers, positions, charge, spin = message
+                    future = self.submit(Atoms(numbers=numbers, positions=positions), charge=charge, spin=spin)
+                    future.add_done_callback(functools.partial(respond, request_id))
+                else:
+                    logging.warning(f'Unknown request: {kind}')
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def submit(self, atoms: Atoms, charge: int, spin: int) -> Future:
+        key = get_canonical_key(atoms, charge=charge, spin=spin, method=self.backend.method)
+        with self.lock:
+            self.num_requests += 1
+
+            energy = self.store.get(key)
+            if energy is not None:
+                return _to_future(energy)
+
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.num_deduplicated += 1
+                return future
+
+            future = self.pool.submit(atoms, charge=charge, spin=spin)
+            self.in_flight[key] = future
+            self.num_calculated += 1
+
+        future.add_done_callback(functools.partial(self._finish, key))
+        return future
+
+    def _finish(self, key: str, future: Future) -> None:
+        with self.lock:
+            del self.in_flight[key]
+            if future.exception() is None:
+                self.store.put(key, future.result())
+
+    @staticmethod
+    def _get_response(request_id: int, future: Future) -> tuple:
+        error = future.exception()
+        if error is not None:
+            return 'result', request_id, None, get_failure_status(error), str(error)
+        return 'result', request_id, future.result(), STATUS_OK, ''
+
+    def get_info(self) -> Dict[str, float]:
+        with self.lock:
+            info = {
+                'server_requests': self.num_requests,
+                'server_deduplicated': self.num_deduplicated,
+                'server_calculated': self.num_calculated,
+                'server_in_flight': len(self.in_flight),
+                **self.store.get_info(),
+            }
+            self.num_requests = 0
+            self.num_deduplicated = 0
+            self.num_calculated = 0
+        return info
+
+    def close(self) -> None:
+        # Wake up serve_forever (if running in another thread) with a last connection
+        self.closed = True
+        if self.serving:
+            Client(self.address, authkey=self.authkey).close()
+        self.listener.close()
+        self.pool.close()
+
+
+class RemoteBackend(EnergyBackend):
+    """Calculates energies on a reward server (see RewardClient)."""
+    def __init__(self, client: 'RewardClient', method: str) -> None:
+        self.client = client
+        self.method = method
+
+    def calculate(self, atoms: Atoms, charge: int, spin: int) -> float:
+        return self.client.submit(atoms, charge=charge, spin=spin).result()
+
+    def __getstate__(self) -> dict:
+        raise TypeError('RemoteBackend cannot be sent to other processes, use a RewardClient instead')
+
+
+class RewardClient(EnergyPool):
+    """
+    Connection to a RewardServer with the interface of a WorkerPool, such that it can be passed to InteractionReward
+    as the pool (together with its backend).
+    """
+    def __init__(self, address: Address, authkey: bytes) -> None:
+        _check_authkey(authkey)
+        self.connection = Client(address, authkey=authkey)
+        self.send_lock = threading.Lock()
+
+        self.connection.send(('method', ))
+        _, method = self.connection.recv()
+        self.backend = RemoteBackend(self, method=method)
+
+        # Requests awaiting a response by request ID
+        self.lock = threading.Lock()
+        self.futures: Dict[int, Future] = {}
+        self.request_ids = itertools.count()
+        self.info: Optional[Future] = None
+
+        self.receiver = threading.Thread(target=self._receive, daemon=True)
+        self.receiver.start()
+        logging.info(f'Connected to reward server at {address} ({method})')
+
+    def _send(self, message: tuple) -> None:
+        with self.send_lock:
+            self.connection.send(message)
+
+    def _receive(self) -> None:
+        try:
+            while True:
+                message = self.connection.recv()
+                if message[0] == 'result':
+                    _, request_id, energy, status, error = message
+                    with self.lock:
+                        future = self.futures.pop(request_id)
+                    if status == STATUS_OK:
+                        future.set_result(energy)
+                    elif status == STATUS_TIMEOUT:
+                        future.set_exception(TimeoutError(error))
+                    else:
+                        future.set_exception(RuntimeError(error))
+                elif message[0] == 'info' and self.info is not None:
+                    self.info.set_result(message[1])
+        except (EOFError, OSError):
+            pass
+
+        # Fail all pending requests if the connection is lost
+        with self.lock:
+            futures, self.futures = self.futures, {}
+        for future in futures.values():
+            future.set_exception(RuntimeError('Connection to reward server lost'))
+
+    def submit(self, atoms: Atoms, charge: int, spin: int) -> Future:
+        future: Future = Future()
+        with self.lock:
+            request_id = next(self.request_ids)
+            self.futures[request_id] = future
+        self._send(('calculate', request_id, np.asarray(atoms.numbers), np.asarray(atoms.positions), charge, spin))
+        return future
+
+    def get_server_info(self) -> Dict[str, float]:
+        self.info = Future()
+        self._send(('info', ))
+        return self.info.result()
+
+    def close(self) -> None:
+        # The server closes its end of the connection, which stops the receiver
+        self._send(('close', ))
+        self.receiver.join()
+        self.connection.close()
+
+    def __enter__(self) -> 'RewardClient':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -1,6 +1,6 @@
 import sys
 from collections import defaultdict
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Union
 
 import ase.data
 import gym
@@ -11,7 +11,7 @@ CanvasItemType = Tuple[int, Tuple[float, float, float]]
 ActionType = CanvasItemType
 CanvasType = Tuple[CanvasItemType, ...]
 BagType = Tuple[int, ...]
-ObservationType = Tuple[CanvasType, BagType]
+TupleObservationType = Tuple[CanvasType, BagType]
 
 FormulaType = Tuple[Tuple[int, int], ...]
 
@@ -61,17 +61,16 @@ class CanvasSpace(gym.spaces.Tuple):
         return atoms
 
     def from_atoms(self, atoms: Atoms) -> CanvasType:
+        # Only the numbers and positions are used, such that a MolecularState can be passed as well
         if len(atoms) > self.size:
             raise RuntimeError(f'Too many atoms: {len(atoms)} > {self.size}')
 
-        elif len(atoms) < self.size:
-            atoms = atoms.copy()
+        labels = [self.zs.index(z) for z in atoms.numbers.tolist()]
+        canvas = tuple(zip(labels, map(tuple, atoms.positions.tolist())))
 
-            dummy = Atom(symbol=NULL_SYMBOL, position=(0, 0, 0))
-            while len(atoms) < self.size:
-                atoms.append(dummy)
-
-        return tuple(self.canvas_item_space.from_atom(atom) for atom in atoms)
+        # Fill up with dummy atoms at the origin
+        dummy = (self.zs.index(0), (0.0, 0.0, 0.0))
+        return canvas + (dummy, ) * (self.size - len(atoms))  # type: ignore
 
 
 class BagSpace(gym.spaces.Tuple):
@@ -93,15 +92,94 @@ class BagSpace(gym.spaces.Tuple):
         return tuple(formula_dict[z] for z in self.zs)
 
 
+class ArrayObservation:
+    """
+    Observation in array form: a (canvas_size, 4) array with the atomic number and position (x, y, z) of the atoms on
+    the canvas in its first num_atoms rows (the remaining rows are zero), and the counts of the bag in the order of zs.
+    The numbers and positions attributes are slices of the canvas, such that agents can read an observation without
+    going through it atom by atom.
+    """
+    __slots__ = ('canvas', 'num_atoms', 'bag')
+
+    def __init__(self, canvas: np.ndarray, num_atoms: int, bag: np.ndarray) -> None:
+        self.canvas = canvas
+        self.num_atoms = num_atoms
+        self.bag = bag
+
+    @property
+    def numbers(self) -> np.ndarray:
+        return self.canvas[:self.num_atoms, 0].astype(int)
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self.canvas[:self.num_atoms, 1:]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ArrayObservation):
+            return NotImplemented
+        return (self.num_atoms == other.num_atoms and np.array_equal(self.canvas, other.canvas)
+                and np.array_equal(self.bag, other.bag))
+
+    def __repr__(self) -> str:
+        return f'ArrayObservation(num_atoms={self.num_atoms}, bag={self.bag.tolist()})'
+
+
+ObservationType = Union[ArrayObservation, TupleObservationType]
+
+
 class ObservationSpace(gym.spaces.Tuple):
+    """
+    Observations are built in array form (see ArrayObservation), samples of the space are in tuple form. Both forms
+    are accepted by parse and can be converted into each other with to_tuple and from_tuple.
+    """
     def __init__(self, canvas_size: int, zs: List[int]):
         self.zs = zs
         self.canvas_space = CanvasSpace(size=canvas_size, zs=zs)
         self.bag_space = BagSpace(zs=zs)
         super().__init__((self.canvas_space, self.bag_space))
 
-    def build(self, atoms: Atoms, formula: FormulaType) -> ObservationType:
-        return self.canvas_space.from_atoms(atoms), self.bag_space.from_formula(formula)
+        # Atomic numbers of the labels and labels of the atomic numbers (-1 if not in zs)
+        self.label_numbers = np.array(zs, dtype=int)
+        self.number_labels = np.full(max(zs) + 1, -1, dtype=int)
+        self.number_labels[self.label_numbers] = np.arange(len(zs))
+
+    def build(self, atoms: Atoms, formula: FormulaType) -> ArrayObservation:
+        # Only the numbers and positions are used, such that a MolecularState can be passed as well
+        if len(atoms) > self.canvas_space.size:
+            raise RuntimeError(f'Too many atoms: {len(atoms)} > {self.canvas_space.size}')
+
+        numbers = np.asarray(atoms.numbers)
+        if np.any(numbers >= len(self.number_labels)) or np.any(self.number_labels[numbers] < 0):
+            raise ValueError(f'Atomic numbers not in {self.zs}: {numbers.tolist()}')
+
+        canvas = np.zeros((self.canvas_space.size, 4), dtype=float)
+        canvas[:len(numbers), 0] = numbers
+        canvas[:len(numbers), 1:] = atoms.positions
+        return ArrayObservation(canvas, num_atoms=len(numbers), bag=np.array(self.bag_space.from_formula(formula)))
+
+    def parse_arrays(self, observation: ObservationType) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Atomic numbers, positions, and bag counts of an observation."""
+        if not isinstance(observation, ArrayObservation):
+            observation = self.from_tuple(observation)
+        return observation.numbers, observation.positions, observation.bag
 
     def parse(self, observation: ObservationType) -> Tuple[Atoms, FormulaType]:
-        return self.canvas_space.to_atoms(observation[0]), self.bag_space.to_formula(observation[1])
+        numbers, positions, bag = self.parse_arrays(observation)
+        return Atoms(numbers=numbers, positions=positions), self.bag_space.to_formula(tuple(bag.tolist()))
+
+    def to_tuple(self, observation: ArrayObservation) -> TupleObservationType:
+        atoms = Atoms(numbers=observation.numbers, positions=observation.positions)
+        return self.canvas_space.from_atoms(atoms), tuple(observation.bag.tolist())
+
+    def from_tuple(self, observation: TupleObservationType) -> ArrayObservation:
+        canvas, bag = observation
+        labels = np.array([label for label, _ in canvas], dtype=int)
+        if np.any(labels < 0):
+            raise RuntimeError(f'Invalid labels: {labels.tolist()}')
+        numbers = self.label_numbers[labels]
+        positions = np.array([position for _, position in canvas], dtype=float)
+
+        # Canvas items with the null symbol are dropped
+        is_atom = numbers != 0
+        atoms = Atoms(numbers=numbers[is_atom], positions=positions[is_atom])
+        return self.build(atoms, formula=self.bag_space.to_formula(bag))
@@ -0,0 +1,144 @@
+from typing import Iterator, Union, Optional, Dict, Any
+
+import numpy as np
+from ase import Atoms, Atom
+
+
+class BaseStructure:
+    """
+    Immutable atoms (e.g., a solvent box) shared by the states of all environments, together with quantities that are
+    computed once: the neighbor index (see NeighborIndex) and the total energy for every method it has been calculated
+    with.
+    """
+    def __init__(self, atoms: Union[Atoms, 'MolecularState']) -> None:
+        self.numbers = np.array(atoms.numbers, dtype=int)
+        self.positions = np.array(atoms.positions, dtype=float)
+        self.numbers.flags.writeable = False
+        self.positions.flags.writeable = False
+
+        self.neighbor_index: Optional[Any] = None
+        self.energies: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __repr__(self) -> str:
+        return f'BaseStructure(size={len(self)})'
+
+
+class MolecularState:
+    """
+    Atomic numbers and positions of the atoms on the canvas in preallocated arrays with a fill counter, such that
+    adding an atom takes constant time (ase.Atoms reallocates all per-atom arrays on every append). The numbers and
+    positions attributes are views of the filled part, so the state can be used in place of an ase.Atoms object
+    wherever only these are needed; an ase.Atoms object is built by to_atoms where required (e.g., to write input files
+    for xtb).
+
+    A state can start from a shared base structure, in which case it only stores the atoms appended to the base (the
+    overlay). Creating and copying such a state does not depend on the size of the base.
+    """
+    def __init__(self, capacity: int, base: Optional[BaseStructure] = None) -> None:
+        self.base = base
+
+        # Overlay of appended atoms (all atoms if there is no base)
+        self._numbers = np.zeros(capacity, dtype=int)
+        self._positions = np.zeros((capacity, 3), dtype=float)
+        self.size = 0
+
+    @classmethod
+    def from_arrays(cls, numbers: np.ndarray, positions: np.ndarray, capacity=0) -> 'MolecularState':
+        state = cls(capacity=max(capacity, len(numbers)))
+        state.size = len(numbers)
+        state._numbers[:state.size] = numbers
+        state._positions[:state.size] = positions
+        return state
+
+    @classmethod
+    def from_atoms(cls, atoms: Union[Atoms, 'MolecularState'], capacity=0) -> 'MolecularState':
+        # States keep their base (capacity is the total number of atoms)
+        if isinstance(atoms, MolecularState):
+            return atoms.copy(capacity=capacity)
+        return cls.from_arrays(atoms.numbers, atoms.positions, capacity=capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self.get_base_size() + len(self._numbers)
+
+    def get_base_size(self) -> int:
+        return len(self.base) if self.base is not None else 0
+
+    def is_base(self) -> bool:
+        # True if the state consists of the base structure only
+        return self.base is not None and self.size == 0
+
+    @property
+    def overlay_numbers(self) -> np.ndarray:
+        return self._numbers[:self.size]
+
+    @property
+    def overlay_positions(self) -> np.ndarray:
+        return self._positions[:self.size]
+
+    @property
+    def numbers(self) -> np.ndarray:
+        if self.base is None:
+            return self.overlay_numbers
+        return np.concatenate([self.base.numbers, self.overlay_numbers])
+
+    @property
+    def positions(self) -> np.ndarray:
+        if self.base is None:
+            return self.overlay_positions
+        return np.concatenate([self.base.positions, self.overlay_positions])
+
+    def __len__(self) -> int:
+        return self.get_base_size() + self.size
+
+    def append(self, atom: Atom) -> None:
+        # The arrays only grow if more atoms than expected are added
+        if self.size == len(self._numbers):
+            self._grow(max(2 * len(self._numbers), 1))
+
+        self._numbers[self.size] = atom.number
+        self._positions[self.size] = atom.position
+        self.size += 1
+
+    def _grow(self, capacity: int) -> None:
+        numbers, positions = self.overlay_numbers, self.overlay_positions
+        self._numbers = np.zeros(capacity, dtype=int)
+        self._positions = np.zeros((capacity, 3), dtype=float)
+        self._numbers[:self.size] = numbers
+        self._positions[:self.size] = positions
+
+    def copy(self, capacity=0) -> 'MolecularState':
+        # The base is shared, only the overlay is copied
+        state = MolecularState(capacity=max(capacity, self.capacity, len(self)) - self.get_base_size(),
+                               base=self.base)
+        state.size = self.size
+        state._numbers[:state.size] = self.overlay_numbers
+        state._positions[:state.size] = self.overlay_positions
+        return state
+
+    def __getitem__(self, item) -> Union[Atom, 'MolecularState']:
+        # As for ase.Atoms, an index selects an atom; slices, index arrays, and boolean masks select a new state
+        if isinstance(item, (int, np.integer)):
+            return Atom(self.numbers[item], position=self.positions[item])
+        return MolecularState.from_arrays(self.numbers[item], self.positions[item])
+
+    def __add__(self, other: Union[Atoms, 'MolecularState']) -> 'MolecularState':
+        return MolecularState.from_arrays(np.concatenate([self.numbers, other.numbers]),
+                                          np.concatenate([self.positions, other.positions]))
+
+    def __iter__(self) -> Iterator[Atom]:
+        for number, position in zip(self.numbers, self.positions):
+            yield Atom(number, position=position)
+
+    def to_atoms(self) -> Atoms:
+        return Atoms(numbers=self.numbers, positions=self.positions)
+
+    def __repr__(self) -> str:
+        return f'MolecularState(size={len(self)}, capacity={self.capacity}, base={self.base})'
+
+
+def to_atoms(atoms: Union[Atoms, MolecularState]) -> Atoms:
+    return atoms.to_atoms() if isinstance(atoms, MolecularState) else atoms
@@ -0,0 +1,264 @@
+import collections
+import copy
+import logging
+from typing import List, Optional, Tuple, Dict
+
+import numpy as np
+import torch
+from ase import Atoms
+from torch import nn
+
+from molgym.agents.painn import data_painn
+from molgym.agents.painn import layer_painn as layer
+from molgym.energy_store import get_geometry_fingerprint
+
+# Snapshot of graphs, compositions, and energies (and a seed) to train on, and the resulting models, optimizers, energies
+# of the elements, and scale
+TrainingData = Tuple[List[dict], List[np.ndarray], np.ndarray, int]
+TrainedModels = Tuple[List['PainnEnergyModel'], List[torch.optim.Optimizer], np.ndarray, float]
+
+
+class PainnEnergyModel(nn.Module):
+    """PaiNN network predicting the energy of a molecule as a sum of atomic contributions."""
+    def __init__(self, hidden_state_size=64, num_interactions=3, cutoff=5.0, distance_embedding_size=20) -> None:
+        super().__init__()
+
+        self.hidden_state_size = hidden_state_size
+        self.cutoff = cutoff
+        self.distance_embedding_size = distance_embedding_size
+
+        num_embeddings = 119  # atomic numbers + 1
+        self.atom_embeddings = nn.Embedding(num_embeddings, self.hidden_state_size)
+
+        self.interactions = nn.ModuleList([
+            layer.PaiNNInteraction(self.hidden_state_size, self.distance_embedding_size, self.cutoff)
+            for _ in range(num_interactions)
+        ])
+        self.scalar_vector_update = nn.ModuleList(
+            [layer.PaiNNUpdate(self.hidden_state_size) for _ in range(num_interactions)])
+
+        self.readout = nn.Sequential(
+            nn.Linear(self.hidden_state_size, self.hidden_state_size),
+            nn.SiLU(),
+            nn.Linear(self.hidden_state_size, 1),
+        )
+
+    def forward(self, input_dict: Dict[str, torch.Tensor]) -> torch.Tensor:
+        # Unpad and concatenate edges and nodes of all graphs into batch (0th) dimension
+        edges_displacement = layer.unpad_and_cat(input_dict['edges_displacement'], input_dict['num_edges'])
+        edge_offset = torch.cumsum(torch.cat((torch.tensor([0]), input_dict['num_nodes'][:-1])), dim=0)
+        edges = input_dict['edges'] + edge_offset[:, None, None]
+        edges = layer.unpad_and_cat(edges, input_dict['num_edges'])
+
+        nodes_xyz = layer.unpad_and_cat(input_dict['nodes_xyz'], input_dict['num_nodes'])
+        nodes_scalar = self.atom_embeddings(layer.unpad_and_cat(input_dict['nodes'], input_dict['num_nodes']))
+        nodes_vector = torch.zeros((nodes_scalar.shape[0], 3, self.hidden_state_size), dtype=nodes_scalar.dtype)
+
+        edges_distance, edges_diff = layer.calc_distance(nodes_xyz,
+                                                         input_dict['cell'],
+                                                         edges,
+                                                         edges_displacement,
+                                                         input_dict['num_edges'],
+                                                         return_diff=True)
+        edge_state = layer.sinc_expansion(edges_distance, [(self.distance_embedding_size, self.cutoff)])
+
+        for int_layer, update_layer in zip(self.interactions, self.scalar_vector_update):
+            nodes_scalar, nodes_vector = int_layer(nodes_scalar, nodes_vector, edge_state, edges_diff,
+                                                   edges_distance, edges)
+            nodes_scalar, nodes_vector = update_layer(nodes_scalar, nodes_vector)
+
+        atomic_energies = self.readout(nodes_scalar)  # num_nodes, 1
+        return layer.sum_splits(atomic_energies, input_dict['num_nodes']).squeeze(1)  # num_graphs
+
+
+class SurrogateEnergyModel:
+    """
+    Ensemble of PaiNN networks trained online on calculated energies (in Hartree). The networks learn the residual of
+    a linear model of the composition (fitted by least squares). The standard deviation of the ensemble estimates the
+    uncertainty of a prediction; only confident predictions are used, and a fraction of those is spot-checked.
+    """
+    def __init__(
+        self,
+        num_models=4,
+        hidden_state_size=32,
+        num_interactions=2,
+        cutoff=5.0,
+        uncertainty_threshold=0.005,  # Hartree
+        spot_check_fraction=0.05,
+        min_train_size=64,
+        train_interval=64,
+        num_train_steps=50,
+        batch_size=32,
+        learning_rate=1e-3,
+        max_size=20000,
+        seed=0,
+    ) -> None:
+        self.uncertainty_threshold = uncertainty_threshold
+        self.spot_check_fraction = spot_check_fraction
+        self.min_train_size = min_train_size
+        self.train_interval = train_interval
+        self.num_train_steps = num_train_steps
+        self.batch_size = batch_size
+        self.max_size = max_size
+
+        self.random_state = np.random.RandomState(seed=seed)
+        self.transformer = data_painn.TransformAtomsObjectsToGraphXyz(cutoff=cutoff)
+
+        # Do not interfere with the random state of the agent
+        with torch.random.fork_rng():
+            torch.manual_seed(seed)
+            self.models = [
+                PainnEnergyModel(hidden_state_size=hidden_state_size, num_interactions=num_interactions, cutoff=cutoff)
+                for _ in range(num_models)
+            ]
+        self.optimizers: List[torch.optim.Optimizer] = [
+            torch.optim.Adam(model.parameters(), lr=learning_rate) for model in self.models
+        ]
+
+        # Training data: graphs, compositions, and energies
+        self.graphs: 'collections.deque[dict]' = collections.deque(maxlen=self.max_size)
+        self.numbers: 'collections.deque[np.ndarray]' = collections.deque(maxlen=self.max_size)
+        self.energies: 'collections.deque[float]' = collections.deque(maxlen=self.max_size)
+        self.num_new = 0
+        self.is_training = False
+        self.is_trained = False
+
+        # Linear model of the composition and scale of the residuals
+        self.element_energies = np.zeros(119)
+        self.scale = 1.0
+
+        # Predictions to be compared to the calculated energies, by geometry fingerprint
+        self.spot_checks: Dict[bytes, float] = {}
+
+        # Statistics since the last call of get_info
+        self.num_requests = 0
+        self.num_hits = 0
+        self.spot_check_errors: List[float] = []
+
+    def predict(self, atoms_list: List[Atoms]) -> Tuple[np.ndarray, np.ndarray]:
+        # Mean and standard deviation of the predictions of the ensemble
+        batch = data_painn.collate_atomsdata([self.transformer(atoms) for atoms in atoms_list], pin_memory=False)
+        with torch.no_grad():
+            residuals = np.stack([model(batch).numpy() for model in self.models])  # num_models, num_atoms
+
+        baseline = np.array([self.element_energies[atoms.numbers].sum() for atoms in atoms_list])
+        predictions = baseline + self.scale * residuals
+        return np.mean(predictions, axis=0), np.std(predictions, axis=0)
+
+    def get_confident(self, atoms_list: List[Atoms]) -> List[Optional[float]]:
+        """Predicted energies of the molecules, or None if the prediction is not confident enough."""
+        # Spot checks are resolved by add (or discard if the calculation fails)
+        self.num_requests += len(atoms_list)
+        if not self.is_trained or not atoms_list:
+            return [None] * len(atoms_list)
+
+        means, stds = self.predict(atoms_list)
+        results: List[Optional[float]] = []
+        for atoms, mean, std in zip(atoms_list, means, stds):
+            if std > self.uncertainty_threshold:
+                results.append(None)
+            elif self.random_state.rand() < self.spot_check_fraction:
+                self.spot_checks[get_geometry_fingerprint(atoms)] = float(mean)
+                results.append(None)
+            else:
+                self.num_hits += 1
+                results.append(float(mean))
+
+        return results
+
+    def add(self, atoms: Atoms, energy: float, train=True) -> None:
+        # With train=False, the caller trains the model once it is due (see start_training)
+        prediction = self.spot_checks.pop(get_geometry_fingerprint(atoms), None)
+        if prediction is not None:
+            self.spot_check_errors.append(prediction - energy)
+
+        self.graphs.append(self.transformer(atoms))
+        self.numbers.append(atoms.numbers.copy())
+        self.energies.append(energy)
+        self.num_new += 1
+
+        if train and self.is_due():
+            self.train()
+
+    def discard(self, atoms: Atoms) -> None:
+        self.spot_checks.pop(get_geometry_fingerprint(atoms), None)
+
+    def is_due(self) -> bool:
+        return not self.is_training and len(self.energies) >= self.min_train_size and self.num_new >= self.train_interval
+
+    def train(self) -> None:
+        self.finish_training(self.fit(self.start_training()))
+
+    def start_training(self) -> TrainingData:
+        """
+        Snapshot of the training data for fit. Training takes a while, so callers sharing the model between threads
+        only need to hold their lock for start_training and finish_training; the current models are used meanwhile.
+        """
+        self.is_training = True
+        self.num_new = 0
+        seed = self.random_state.randint(np.iinfo(np.int32).max)
+        return list(self.graphs), list(self.numbers), np.array(self.energies), seed
+
+    def fit(self, data: TrainingData) -> TrainedModels:
+        # Trains copies of the models (and of their optimizers)
+        graphs, numbers_list, energies, seed = data
+        random_state = np.random.RandomState(seed=seed)
+        element_energies, scale = self._fit_baseline(numbers_list, energies)
+
+        baseline = np.array([element_energies[numbers].sum() for numbers in numbers_list])
+        targets = torch.tensor((energies - baseline) / scale, dtype=torch.get_default_dtype())
+
+        models = copy.deepcopy(self.models)
+        optimizers: List[torch.optim.Optimizer] = []
+        losses = []
+        for model, current_optimizer in zip(models, self.optimizers):
+            optimizer = torch.optim.Adam(model.parameters())
+            optimizer.load_state_dict(current_optimizer.state_dict())
+            optimizers.append(optimizer)
+
+            model.train()
+            for _ in range(self.num_train_steps):
+                indices = random_state.choice(len(graphs), size=min(self.batch_size, len(graphs)))
+                batch = data_painn.collate_atomsdata([graphs[i] for i in indices], pin_memory=False)
+
+                optimizer.zero_grad()
+                loss = torch.mean(torch.square(model(batch) - targets[indices]))
+                loss.backward()
+                optimizer.step()
+            model.eval()
+            losses.append(loss.item())
+
+        logging.debug(f'Trained surrogate on {len(energies)} energies: loss={np.mean(losses):.4f}')
+        return models, optimizers, element_energies, scale
+
+    def finish_training(self, trained: TrainedModels) -> None:
+        self.models, self.optimizers, self.element_energies, self.scale = trained
+        self.is_training = False
+        self.is_trained = True
+
+    @staticmethod
+    def _fit_baseline(numbers_list: List[np.ndarray], energies: np.ndarray) -> Tuple[np.ndarray, float]:
+        # Energies of the elements and scale of the residuals
+        zs = np.unique(np.concatenate(numbers_list))
+        counts = np.array([[np.sum(numbers == z) for z in zs] for numbers in numbers_list], dtype=float)
+        coefficients, _, _, _ = np.linalg.lstsq(counts, energies, rcond=None)
+
+        element_energies = np.zeros(119)
+        element_energies[zs] = coefficients
+        scale = max(float(np.std(energies - counts @ coefficients)), 1e-3)
+        return element_energies, scale
+
+    def get_info(self) -> Dict[str, float]:
+        info = {
+            'surrogate_hit_rate': self.num_hits / self.num_requests if self.num_requests > 0 else 0.0,
+            'surrogate_size': len(self.energies),
+            'surrogate_spot_checks': len(self.spot_check_errors),
+        }
+        if self.spot_check_errors:
+            info['surrogate_mae'] = float(np.mean(np.abs(self.spot_check_errors)))
+
+        self.num_requests = 0
+        self.num_hits = 0
+        self.spot_check_errors = []
+
+        return info
@@ -43,6 +43,113 @@ def build_default_argparser() -> argparse.ArgumentParser:
                         type=float,
                         default=2.0)
     parser.add_argument('--min_reward', help='minimum reward given by environment', type=float, default=-0.6)
+    parser.add_argument('--prescreen',
+                        help='reject placements with overlapping atoms (and optionally disconnected fragments or '
+                        'exceeded valences) without calculating their reward',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--overlap_scale',
+                        help='minimum distance of atoms in units of the sum of their covalent radii',
+                        type=float,
+                        default=0.5)
+    parser.add_argument('--bond_scale',
+                        help='maximum bond length in units of the sum of covalent radii',
+                        type=float,
+                        default=1.2)
+    parser.add_argument('--max_fragments',
+                        help='maximum number of covalently bonded fragments (default: no limit)',
+                        type=int,
+                        default=None)
+    parser.add_argument('--check_valence',
+                        help='reject placements exceeding the maximum number of bonds of an atom',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--terminal_reward',
+                        help='reward only the terminal step with the sum of all rewards of the episode',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--deferred_reward',
+                        help='calculate all rewards of a rollout in one batch after the rollout',
+                        action='store_true',
+                        default=False)
+
+    # Reward
+    add_energy_backend_arguments(parser)
+    parser.add_argument('--screening_backend',
+                        help='cheap method scoring placements before the reward is calculated',
+                        type=str,
+                        default='none',
+                        choices=['none', 'gfnff', 'pair'])
+    parser.add_argument('--screening_threshold',
+                        help='minimum cheap reward of placements whose reward is calculated (default: min_reward)',
+                        type=float,
+                        default=None)
+    parser.add_argument('--calibration_fraction',
+                        help='fraction of placements always calculated with both methods for calibration',
+                        type=float,
+                        default=0.05)
+    parser.add_argument('--surrogate',
+                        help='replace confident energy calculations by predictions of an online-trained PaiNN ensemble',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--surrogate_threshold',
+                        help='maximum standard deviation (in Hartree) of the ensemble for a prediction to be used',
+                        type=float,
+                        default=0.005)
+    parser.add_argument('--surrogate_spot_check',
+                        help='fraction of confident predictions that are checked by a calculation',
+                        type=float,
+                        default=0.05)
+    parser.add_argument('--surrogate_ensemble_size', help='number of networks in the ensemble', type=int, default=4)
+    parser.add_argument('--num_env_threads',
+                        help='number of threads stepping the training environments concurrently (0: sequentially)',
+                        type=int,
+                        default=0)
+    parser.add_argument('--num_env_workers',
+                        help='number of worker processes running the training environments (0: in main process)',
+                        type=int,
+                        default=0)
+    parser.add_argument('--async_rollout',
+                        help='step training environments independently instead of in lockstep',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--num_reward_workers',
+                        help='number of worker processes calculating rewards (0: calculate in main process)',
+                        type=int,
+                        default=0)
+    parser.add_argument('--reward_server',
+                        help='address of a reward server (host:port or path of a Unix socket) calculating the energies; '
+                        'authenticated with the secret key in $MOLGYM_REWARD_AUTHKEY or $MOLGYM_REWARD_AUTHKEY_FILE',
+                        type=str,
+                        default=None)
+    parser.add_argument('--incremental_reward',
+                        help='reuse the total energy of the previous step instead of recalculating it',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--energy_store',
+                        help='path to SQLite file storing calculated energies (shared between runs)',
+                        type=str,
+                        default=None)
+    parser.add_argument('--energy_store_capacity',
+                        help='maximum number of energies kept in memory',
+                        type=int,
+                        default=100000)
+
+    # Resources
+    parser.add_argument('--plan_resources',
+                        help='assign cores to the threads of xtb and torch to avoid oversubscription',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--num_cores', help='number of cores to use (default: all available)', type=int, default=None)
+    parser.add_argument('--omp_stacksize', help='OpenMP stack size per xtb thread', type=str, default='1G')
+    parser.add_argument('--pin_workers',
+                        help='pin reward workers and learner to disjoint sets of cores',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--replan_tolerance',
+                        help='re-plan when the fraction of time spent on rewards changes by more than this',
+                        type=float,
+                        default=0.1)
 
     # Model
     parser.add_argument('--model',
@@ -83,6 +190,24 @@ def build_default_argparser() -> argparse.ArgumentParser:
                         default=128)
     parser.add_argument('--mini_batch_size', help='mini batch size for training', type=int, default=64)
     parser.add_argument('--num_envs', help='number of environment copies', type=int, default=8)
+    parser.add_argument('--autoscale_envs',
+                        help='adapt the number of training environments between iterations',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--min_envs', help='minimum number of environments when autoscaling', type=int, default=1)
+    parser.add_argument('--max_envs', help='maximum number of environments when autoscaling', type=int, default=32)
+    parser.add_argument('--min_utilization',
+                        help='add environments while the cores are utilized less than this',
+                        type=float,
+                        default=0.8)
+    parser.add_argument('--max_utilization',
+                        help='remove environments if the cores are utilized at least this much and the throughput drops',
+                        type=float,
+                        default=0.95)
+    parser.add_argument('--autoscale_tolerance',
+                        help='revert a change if the throughput drops by more than this fraction',
+                        type=float,
+                        default=0.1)
     parser.add_argument('--clip_ratio', help='PPO clip ratio', type=float, default=0.2)
     parser.add_argument('--learning_rate', help='Learning rate of Adam optimizer', type=float, default=3e-4)
     parser.add_argument('--vf_coef', help='Coefficient for value function loss', type=float, default=0.5)
@@ -105,3 +230,44 @@ def build_default_argparser() -> argparse.ArgumentParser:
                         choices=['none', 'train', 'eval', 'all'])
 
     return parser
+
+
+def add_energy_backend_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--reward_backend',
+                        help='program calculating the energies of the reward',
+                        type=str,
+                        default='xtb',
+                        choices=['xtb', 'sparrow', 'mock'])
+    parser.add_argument('--sparrow_method',
+                        help='semi-empirical method used by the Sparrow backend',
+                        type=str,
+                        default='PM6',
+                        choices=['PM6', 'PM3', 'AM1', 'MNDO', 'DFTB0', 'DFTB2', 'DFTB3'])
+    parser.add_argument('--mock_latency',
+                        help='artificial latency of the mock backend in seconds',
+                        type=float,
+                        default=0.0)
+    parser.add_argument('--mock_latency_jitter',
+                        help='maximum random latency added by the mock backend in seconds',
+                        type=float,
+                        default=0.0)
+    parser.add_argument('--mock_failure_rate',
+                        help='fraction of calculations failed by the mock backend',
+                        type=float,
+                        default=0.0)
+    parser.add_argument('--reward_timeout',
+                        help='wall-clock time limit of a single energy calculation in seconds',
+                        type=float,
+                        default=None)
+    parser.add_argument('--reward_retries',
+                        help='number of retries of failed xtb calculations with relaxed settings',
+                        type=int,
+                        default=1)
+    parser.add_argument('--warm_start',
+                        help='start the SCC of xtb from the charges of the previous step',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--scratch_dir',
+                        help='directory for scratch files of reward workers (default: /dev/shm if available)',
+                        type=str,
+                        default=None)
@@ -0,0 +1,136 @@
+import logging
+from typing import Optional, List, Dict
+
+from molgym.env_container import VecEnv, ScalableEnvContainer
+from molgym.tools.resources import get_available_cpus
+
+
+def get_allowed_sizes(num_steps_per_iter: int, min_envs: int, max_envs: int) -> List[int]:
+    # Every rollout has to take the same number of steps in each environment
+    return [size for size in range(min_envs, max_envs + 1) if num_steps_per_iter % size == 0]
+
+
+class EnvAutoscaler:
+    """
+    Grows or shrinks the set of active training environments between iterations based on the timing of the training
+    rollouts. While cores are idle (e.g., the policy waits for single-threaded reward calculations), more
+    environments are added, which increases the number of concurrent calculations and the batch size of the policy.
+    If the throughput (steps per second) drops by more than the tolerance after a change (e.g., since the reward
+    calculations compete for cores), the environments are shrunk to the previous number and not grown again for the
+    next cooldown iterations. If the cores are saturated (utilization of at least max_utilization) and the throughput
+    stays below the one last measured with fewer environments for patience iterations in a row, the cores are
+    over-subscribed and the environments are shrunk as well.
+
+    Core utilization is the CPU time of this process and its worker processes (see molgym.tools.util.get_cpu_time) per
+    wall time and core. If the CPU time of the workers cannot be measured, the environments are never grown.
+    """
+    def __init__(
+        self,
+        envs: ScalableEnvContainer,
+        num_steps_per_iter: int,
+        min_envs: int,
+        max_envs: int,
+        num_cores: int,
+        min_utilization=0.8,
+        max_utilization=0.95,
+        tolerance=0.1,
+        cooldown=5,
+        patience=3,
+    ) -> None:
+        self.envs = envs
+        self.num_steps_per_iter = num_steps_per_iter
+        self.sizes = get_allowed_sizes(num_steps_per_iter, min_envs=min_envs, max_envs=max_envs)
+        assert self.envs.get_size() in self.sizes, 'Number of environments has to divide the number of steps'
+        assert max_envs <= self.envs.max_size
+
+        self.num_cores = num_cores
+        self.min_utilization = min_utilization
+        self.max_utilization = max_utilization
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.patience = patience
+
+        # Number of environments and throughput before the last change
+        self.previous_size: Optional[int] = None
+        self.previous_throughput: Optional[float] = None
+        self.num_blocked = 0
+
+        # Last throughput measured with every number of environments, and number of over-subscribed iterations in a row
+        self.throughputs: Dict[int, float] = {}
+        self.num_oversubscribed = 0
+
+    def update(self, rollout_info: dict) -> dict:
+        """Apply a decision based on the info of a training rollout, and return the decision."""
+        num_envs = self.envs.get_size()
+        rollout_time = max(rollout_info['time'], 1e-6)
+        throughput = self.num_steps_per_iter / rollout_time
+        cpu_time = rollout_info['cpu_time']
+        utilization = cpu_time / (rollout_time * self.num_cores) if cpu_time is not None else None
+
+        index = self.sizes.index(num_envs)
+        reason = 'keep'
+        new_size = num_envs
+
+        smaller_size = self.sizes[index - 1] if index > 0 else None
+        if (utilization is not None and utilization >= self.max_utilization and smaller_size in self.throughputs
+                and throughput < (1.0 - self.tolerance) * self.throughputs[smaller_size]):
+            self.num_oversubscribed += 1
+        else:
+            self.num_oversubscribed = 0
+        self.throughputs[num_envs] = throughput
+
+        if (self.previous_throughput is not None and self.previous_size is not None
+                and throughput < (1.0 - self.tolerance) * self.previous_throughput):
+            reason = 'revert'
+            new_size = self.previous_size
+            self.num_blocked = self.cooldown
+        elif self.num_blocked > 0:
+            reason = 'cooldown'
+            self.num_blocked -= 1
+        elif self.num_oversubscribed >= self.patience and smaller_size is not None:
+            reason = 'shrink'
+            new_size = smaller_size
+            self.num_blocked = self.cooldown
+        elif utilization is not None and utilization < self.min_utilization and index + 1 < len(self.sizes):
+            reason = 'grow'
+            new_size = self.sizes[index + 1]
+
+        if new_size != num_envs:
+            self.num_oversubscribed = 0
+
+        if new_size != num_envs and reason != 'revert':
+            self.previous_size, self.previous_throughput = num_envs, throughput
+        else:
+            self.previous_size = self.previous_throughput = None
+
+        self.envs.set_num_active(new_size)
+
+        decision = {
+            'num_envs': num_envs,
+            'new_num_envs': new_size,
+            'reason': reason,
+            'throughput': throughput,
+            'utilization': utilization,
+            'reward_latency': rollout_info['env_time'] / self.num_steps_per_iter,
+            'policy_latency': rollout_info['policy_time'] / self.num_steps_per_iter,
+        }
+        if new_size != num_envs:
+            utilization_string = f'{utilization:.2f}' if utilization is not None else 'unknown'
+            logging.info(f'Autoscaler: {num_envs} -> {new_size} environments ({reason}, '
+                         f'utilization={utilization_string}, throughput={throughput:.1f} steps/s)')
+        return decision
+
+
+def build_autoscaler(config: dict, envs: VecEnv) -> Optional[EnvAutoscaler]:
+    if not config['autoscale_envs']:
+        return None
+
+    assert isinstance(envs, ScalableEnvContainer)
+    return EnvAutoscaler(envs,
+                         num_steps_per_iter=config['num_steps_per_iter'],
+                         min_envs=config['min_envs'],
+                         max_envs=config['max_envs'],
+                         num_cores=config['num_cores'] or len(get_available_cpus()),
+                         min_utilization=config['min_utilization'],
+                         max_utilization=config['max_utilization'],
+                         tolerance=config['autoscale_tolerance'])
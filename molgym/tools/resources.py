@@ -0,0 +1,188 @@
+import logging
+import os
+from typing import Optional, List, Any
+
+import torch
+
+from molgym.worker_pool import WorkerPool
+
+
+def get_available_cpus() -> List[int]:
+    return sorted(os.sched_getaffinity(0))
+
+
+class ResourcePlan:
+    """Assignment of CPU cores to the OpenMP threads of xtb and the intra-op threads of torch."""
+    def __init__(
+        self,
+        num_cores: int,
+        reward_fraction: float,
+        num_calculations: int,
+        xtb_threads: int,
+        torch_threads: int,
+        omp_stacksize: str,
+        worker_cpu_sets: Optional[List[List[int]]] = None,
+        learner_cpus: Optional[List[int]] = None,
+    ) -> None:
+        self.num_cores = num_cores
+        self.reward_fraction = reward_fraction
+        self.num_calculations = num_calculations
+        self.xtb_threads = xtb_threads
+        self.torch_threads = torch_threads
+        self.omp_stacksize = omp_stacksize
+        self.worker_cpu_sets = worker_cpu_sets
+        self.learner_cpus = learner_cpus
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+    def __repr__(self) -> str:
+        return (f'ResourcePlan(cores={self.num_cores}, reward_fraction={self.reward_fraction:.2f}, '
+                f'xtb={self.num_calculations}x{self.xtb_threads}, torch={self.torch_threads})')
+
+
+def plan_resources(
+    num_cores: int,
+    num_envs: int,
+    num_reward_workers: int,
+    reward_fraction=0.5,
+    omp_stacksize='1G',
+    pin=False,
+    num_concurrent=1,
+) -> ResourcePlan:
+    """
+    Without reward workers, energies are calculated by the environments while the policy is idle, so torch can use all
+    cores and the cores are split between the calculations of the environments stepped concurrently (num_concurrent,
+    e.g., by environment threads or workers). Otherwise, at most one calculation per environment runs in every worker,
+    and the cores are split between these calculations and the learner in proportion to the fraction of time spent on
+    rewards.
+    """
+    assert num_cores > 0 and 0.0 <= reward_fraction <= 1.0 and num_concurrent > 0
+
+    if num_reward_workers == 0:
+        num_calculations = min(num_concurrent, num_envs)
+        return ResourcePlan(num_cores=num_cores,
+                            reward_fraction=reward_fraction,
+                            num_calculations=num_calculations,
+                            xtb_threads=max(num_cores // num_calculations, 1),
+                            torch_threads=num_cores,
+                            omp_stacksize=omp_stacksize)
+
+    num_calculations = min(num_reward_workers, num_envs)
+    reward_cores = min(max(int(round(reward_fraction * num_cores)), num_calculations), max(num_cores - 1, 1))
+    xtb_threads = max(reward_cores // num_calculations, 1)
+    torch_threads = max(num_cores - xtb_threads * num_calculations, 1)
+
+    worker_cpu_sets = learner_cpus = None
+    if pin:
+        cpus = get_available_cpus()[:num_cores]
+        worker_cpu_sets = [
+            cpus[(i * xtb_threads) % len(cpus):(i * xtb_threads) % len(cpus) + xtb_threads]
+            for i in range(num_calculations)
+        ]
+        learner_cpus = cpus[num_calculations * xtb_threads:] or cpus
+
+    return ResourcePlan(num_cores=num_cores,
+                        reward_fraction=reward_fraction,
+                        num_calculations=num_calculations,
+                        xtb_threads=xtb_threads,
+                        torch_threads=torch_threads,
+                        omp_stacksize=omp_stacksize,
+                        worker_cpu_sets=worker_cpu_sets,
+                        learner_cpus=learner_cpus)
+
+
+class ResourcePlanner:
+    """
+    Applies a resource plan to the learner, the energy backend, and the reward workers, and re-plans whenever the
+    measured fraction of time spent on rewards deviates from the planned one by more than the tolerance. CPU pinning
+    is fixed when the workers are started; re-planning only changes the numbers of threads.
+    """
+    def __init__(
+        self,
+        num_cores: int,
+        num_envs: int,
+        num_reward_workers: int,
+        omp_stacksize='1G',
+        pin=False,
+        tolerance: Optional[float] = 0.1,
+        num_concurrent=1,
+    ) -> None:
+        self.num_cores = num_cores
+        self.num_envs = num_envs
+        self.num_reward_workers = num_reward_workers
+        self.num_concurrent = num_concurrent
+        self.omp_stacksize = omp_stacksize
+        self.pin = pin
+        self.tolerance = tolerance
+
+        self.plan = self._plan(reward_fraction=0.5, pin=self.pin)
+
+        self.backend: Any = None
+        self.pool: Any = None
+
+    def _plan(self, reward_fraction: float, pin: bool) -> ResourcePlan:
+        return plan_resources(num_cores=self.num_cores,
+                              num_envs=self.num_envs,
+                              num_reward_workers=self.num_reward_workers,
+                              reward_fraction=reward_fraction,
+                              omp_stacksize=self.omp_stacksize,
+                              pin=pin,
+                              num_concurrent=self.num_concurrent)
+
+    def attach(self, backend: Any, pool: Any = None) -> None:
+        # Apply the plan to the backend and pool (whose workers should be pinned to plan.worker_cpu_sets)
+        self.backend = backend
+        self.pool = pool
+        self.apply()
+
+        if self.plan.learner_cpus is not None:
+            os.sched_setaffinity(0, self.plan.learner_cpus)
+
+    def apply(self) -> None:
+        torch.set_num_threads(self.plan.torch_threads)
+
+        # Backends without OpenMP threads (e.g., the mock backend) are left untouched
+        if hasattr(self.backend, 'num_threads'):
+            self.backend.num_threads = self.plan.xtb_threads
+            self.backend.stacksize = self.plan.omp_stacksize
+        if isinstance(self.pool, WorkerPool):
+            self.pool.set_num_threads(self.plan.xtb_threads)
+
+        logging.info(f'Applied {self.plan}')
+
+    def update(self, reward_time: float, policy_time: float) -> bool:
+        # Returns true if a new plan has been applied
+        if self.tolerance is None or reward_time + policy_time <= 0.0:
+            return False
+
+        reward_fraction = reward_time / (reward_time + policy_time)
+        if abs(reward_fraction - self.plan.reward_fraction) <= self.tolerance:
+            return False
+
+        plan = self._plan(reward_fraction=reward_fraction, pin=False)
+        plan.worker_cpu_sets = self.plan.worker_cpu_sets
+        plan.learner_cpus = self.plan.learner_cpus
+        if plan.worker_cpu_sets is not None:
+            plan.xtb_threads = min(plan.xtb_threads, min(len(cpus) for cpus in plan.worker_cpu_sets))
+        self.plan = plan
+        self.apply()
+        return True
+
+
+def build_resource_planner(config: dict) -> Optional[ResourcePlanner]:
+    if not config['plan_resources']:
+        return None
+
+    return ResourcePlanner(num_cores=config['num_cores'] or len(get_available_cpus()),
+                           num_envs=config['num_envs'],
+                           num_reward_workers=config['num_reward_workers'],
+                           omp_stacksize=config['omp_stacksize'],
+                           pin=config['pin_workers'],
+                           tolerance=config['replan_tolerance'],
+                           num_concurrent=get_num_concurrent_environments(config))
+
+
+def get_num_concurrent_environments(config: dict) -> int:
+    # Environments in worker processes or threads calculate their rewards at the same time
+    return max(config['num_env_workers'], config['num_env_threads'], 1)
@@ -0,0 +1,152 @@
+import os
+from typing import Optional, Sequence, Type
+
+import ase.data
+
+from molgym.energy_store import EnergyStore
+from molgym.prescreen import PreScreen
+from molgym.reference_energies import get_reference_energies
+from molgym.reward import EnergyBackend, XTBBackend, SparrowBackend, MorseBackend, InteractionReward, \
+    MolecularReward, TieredReward
+from molgym.reward_server import RewardClient, parse_address, get_authkey
+from molgym.surrogate import SurrogateEnergyModel
+from molgym.tools.resources import ResourcePlanner
+from molgym.worker_pool import EnergyPool, WorkerPool
+
+
+def build_energy_backend(config: dict) -> EnergyBackend:
+    if config['reward_backend'] == 'xtb':
+        return XTBBackend(scratch_root=config['scratch_dir'],
+                          timeout=config['reward_timeout'],
+                          num_retries=config['reward_retries'],
+                          warm_start=config['warm_start'])
+    elif config['reward_backend'] == 'sparrow':
+        return SparrowBackend(method=config['sparrow_method'])
+    elif config['reward_backend'] == 'mock':
+        return MorseBackend(latency=config['mock_latency'],
+                            latency_jitter=config['mock_latency_jitter'],
+                            failure_rate=config['mock_failure_rate'],
+                            timeout=config['reward_timeout'],
+                            seed=config['seed'])
+    else:
+        raise RuntimeError(f'Reward backend \'{config["reward_backend"]}\' is not available.')
+
+
+def build_surrogate(config: dict) -> Optional[SurrogateEnergyModel]:
+    if not config['surrogate']:
+        return None
+
+    return SurrogateEnergyModel(num_models=config['surrogate_ensemble_size'],
+                                uncertainty_threshold=config['surrogate_threshold'],
+                                spot_check_fraction=config['surrogate_spot_check'],
+                                seed=config['seed'])
+
+
+def build_screening_backend(config: dict) -> Optional[EnergyBackend]:
+    if config['screening_backend'] == 'none':
+        return None
+    elif config['screening_backend'] == 'gfnff':
+        return XTBBackend(scratch_root=config['scratch_dir'], timeout=config['reward_timeout'], force_field=True)
+    elif config['screening_backend'] == 'pair':
+        return MorseBackend()
+    else:
+        raise RuntimeError(f'Screening backend \'{config["screening_backend"]}\' is not available.')
+
+
+def build_tiered_reward(config: dict, reward: InteractionReward, reference_path: str,
+                        symbols: Sequence[str]) -> MolecularReward:
+    # Screen placements with a cheap method before calculating the reward (if a screening backend is configured)
+    backend = build_screening_backend(config)
+    if backend is None:
+        return reward
+
+    cheap = reward.__class__(backend=backend,
+                             reference_energies=get_reference_energies(reference_path, symbols=symbols,
+                                                                       backend=backend))
+    threshold = config['screening_threshold'] if config['screening_threshold'] is not None else config['min_reward']
+    return TieredReward(cheap=cheap,
+                        expensive=reward,
+                        threshold=threshold,
+                        calibration_fraction=config['calibration_fraction'],
+                        seed=config['seed'])
+
+
+def build_prescreen(config: dict) -> Optional[PreScreen]:
+    if not config['prescreen']:
+        return None
+
+    return PreScreen(overlap_scale=config['overlap_scale'],
+                     bond_scale=config['bond_scale'],
+                     max_fragments=config['max_fragments'],
+                     check_valence=config['check_valence'],
+                     terminal_reward=config['terminal_reward'])
+
+
+class RewardStack:
+    """Reward of the environments together with the backend, pool, and store calculating its energies."""
+    def __init__(
+        self,
+        backend: EnergyBackend,
+        pool: Optional[EnergyPool],
+        store: EnergyStore,
+        reward: MolecularReward,
+        prescreen: Optional[PreScreen],
+    ) -> None:
+        self.backend = backend
+        self.pool = pool
+        self.store = store
+        self.reward = reward
+        self.prescreen = prescreen
+
+    def close(self) -> None:
+        self.store.close()
+        if self.pool is not None:
+            self.pool.close()
+
+
+def build_reward_stack(
+    config: dict,
+    model_dir: str,
+    resource_planner: Optional[ResourcePlanner] = None,
+    reward_cls: Type[InteractionReward] = InteractionReward,
+    **kwargs,
+) -> RewardStack:
+    """
+    Energies are calculated by a reward server (if configured), by a pool of reward workers, or by the environments
+    themselves. The reference energies of the atoms are stored in model_dir; further keyword arguments are passed to
+    reward_cls.
+    """
+    pool: Optional[EnergyPool]
+    if config['reward_server'] is not None:
+        pool = RewardClient(address=parse_address(config['reward_server']), authkey=get_authkey())
+        backend = pool.backend
+    else:
+        backend = build_energy_backend(config)
+        if config['num_reward_workers'] > 0:
+            pool = WorkerPool(num_workers=config['num_reward_workers'],
+                              backend=backend,
+                              scratch_root=config['scratch_dir'],
+                              cpu_sets=resource_planner.plan.worker_cpu_sets if resource_planner else None)
+        else:
+            pool = None
+
+    if resource_planner is not None:
+        resource_planner.attach(backend=backend, pool=pool)
+
+    store = EnergyStore(path=config['energy_store'], capacity=config['energy_store_capacity'])
+    reference_path = os.path.join(model_dir, 'reference_energies.json')
+    symbols = [s for s in config['symbols'].split(',') if ase.data.atomic_numbers[s] > 0]
+    reference_energies = get_reference_energies(path=reference_path, symbols=symbols, backend=backend, pool=pool)
+    reward = reward_cls(backend=backend,
+                        pool=pool,
+                        incremental=config['incremental_reward'],
+                        store=store,
+                        reference_energies=reference_energies,
+                        surrogate=build_surrogate(config),
+                        **kwargs)
+
+    return RewardStack(backend=backend,
+                       pool=pool,
+                       store=store,
+                       reward=build_tiered_reward(config, reward=reward, reference_path=reference_path, symbols=symbols),
+                       prescreen=build_prescreen(config))
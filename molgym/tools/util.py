@@ -1,13 +1,15 @@
 import collections
 import json
 import logging
+import multiprocessing
 import os
 import pickle
 import sys
-from typing import Optional, List, Iterable, Tuple, Dict
+from typing import Optional, List, Iterable, Tuple, Dict, Callable, Any
 
 import ase.data
 import ase.formula
+import gym
 import numpy as np
 import scipy.signal
 import torch
@@ -15,7 +17,9 @@ from ase.formula import Formula
 from torch.optim import Adam
 from torch.optim.optimizer import Optimizer
 
-from molgym.spaces import FormulaType
+from molgym.env_container import (VecEnv, SimpleEnvContainer, ThreadedEnvContainer, SubprocEnvContainer,
+                                  ScalableEnvContainer)
+from molgym.spaces import FormulaType, ObservationSpace
 
 
 def string_to_formula(string: str) -> FormulaType:
@@ -183,6 +187,58 @@ class InfoSaver:
             f.write('\n')
 
 
+def get_cpu_time() -> Optional[float]:
+    """
+    CPU time of this process, its terminated child processes (e.g., xtb calculations), and its running worker processes
+    (e.g., of a WorkerPool or SubprocEnvContainer) including their terminated children. Returns None if the CPU time of
+    the workers cannot be measured (i.e., without /proc).
+    """
+    times = os.times()
+    cpu_time = times.user + times.system + times.children_user + times.children_system
+
+    workers = multiprocessing.active_children()
+    if workers and not os.path.isdir('/proc/self'):
+        return None
+
+    for worker in workers:
+        if worker.pid is not None:
+            cpu_time += _get_process_cpu_time(worker.pid)
+    return cpu_time
+
+
+def _get_process_cpu_time(pid: int) -> float:
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the command name (which may contain spaces) start with the state
+            fields = f.read().rsplit(')', maxsplit=1)[1].split()
+    except (OSError, IndexError):
+        # A worker that has just terminated is counted with the terminated children once it is joined
+        return 0.0
+
+    # utime, stime, cutime, and cstime in clock ticks
+    return sum(int(value) for value in fields[11:15]) / os.sysconf('SC_CLK_TCK')
+
+
+def get_elapsed_cpu_time(start: Optional[float]) -> Optional[float]:
+    end = get_cpu_time()
+    return end - start if start is not None and end is not None else None
+
+
+def merge_infos(infos: List[dict]) -> dict:
+    """
+    Merges the statistics of several copies of an object (e.g., the rewards of environment workers): counts (integers)
+    are summed, other values (rates and means) are averaged over the copies reporting them.
+    """
+    merged: Dict[str, Any] = {}
+    for key in dict.fromkeys(key for info in infos for key in info):
+        values = [info[key] for info in infos if key in info]
+        if all(isinstance(value, int) for value in values):
+            merged[key] = sum(values)
+        else:
+            merged[key] = float(np.mean(values))
+    return merged
+
+
 def init_device(device_str: str) -> torch.device:
     if device_str == 'cuda':
         assert (torch.cuda.is_available()), 'No CUDA device available!'
@@ -203,3 +259,34 @@ def get_optimizer(name: str, learning_rate: float, parameters: Iterable[torch.Te
         raise RuntimeError(f"Unknown optimizer '{name}'")
 
     return Adam(parameters, lr=learning_rate, amsgrad=amsgrad)
+
+
+def build_env_container(config: dict, env_fn: Callable[[], gym.Env], observation_space: ObservationSpace) -> VecEnv:
+    # With autoscaling, all environments that may be needed are created up front, and num_envs of them are active
+    if config['autoscale_envs']:
+        envs = _build_env_container(config, env_fn, observation_space, num_envs=config['max_envs'])
+        return ScalableEnvContainer(envs, num_active=config['num_envs'])
+
+    return _build_env_container(config, env_fn, observation_space, num_envs=config['num_envs'])
+
+
+def _build_env_container(config: dict, env_fn: Callable[[], gym.Env], observation_space: ObservationSpace,
+                         num_envs: int) -> VecEnv:
+    # Environments run in worker processes, in threads, or sequentially
+    if config['num_env_workers'] > 0:
+        assert not config['deferred_reward'], 'Rewards of environments in worker processes cannot be deferred'
+        assert config['num_reward_workers'] == 0 and config['reward_server'] is None, \
+            'Environments in worker processes calculate their rewards themselves'
+        assert not config['surrogate'], 'Environment workers would each train their own surrogate'
+        return SubprocEnvContainer([env_fn] * num_envs,
+                                   canvas_size=observation_space.canvas_space.size,
+                                   bag_size=observation_space.bag_space.size,
+                                   num_workers=config['num_env_workers'],
+                                   min_reward=config['min_reward'],
+                                   seed=config['seed'])
+
+    environments = [env_fn() for _ in range(num_envs)]
+    if config['num_env_threads'] > 0:
+        return ThreadedEnvContainer(environments, num_threads=config['num_env_threads'], seed=config['seed'])
+
+    return SimpleEnvContainer(environments)
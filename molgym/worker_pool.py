@@ -0,0 +1,155 @@
+import abc
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, List, Sequence, Tuple, Any
+
+from ase import Atoms
+
+# Energy backend and scratch directory owned by the current worker process
+_backend: Any = None
+_scratch_directory: Optional[str] = None
+
+# Number of threads of a calculation shared by all workers of a pool (0: not set)
+_num_threads: Any = None
+
+
+def get_default_scratch_root() -> str:
+    # Prefer tmpfs so that input and output files of calculations never touch the disk
+    shm = '/dev/shm'
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return shm
+    return tempfile.gettempdir()
+
+
+def _init_worker(backend: Any, scratch_root: str, num_threads: Any, cpu_sets: Optional[List[List[int]]],
+                 worker_counter: Any) -> None:
+    global _backend, _scratch_directory, _num_threads
+    _backend = backend
+    _scratch_directory = tempfile.mkdtemp(prefix=f'molgym-worker-{os.getpid()}-', dir=scratch_root)
+    _num_threads = num_threads
+
+    # Pin the worker (and thus its calculations) to the next set of CPUs
+    if cpu_sets:
+        with worker_counter.get_lock():
+            index = worker_counter.value
+            worker_counter.value += 1
+        os.sched_setaffinity(0, cpu_sets[index % len(cpu_sets)])
+
+    # Finalizers (unlike atexit handlers) are run when a multiprocessing worker shuts down
+    multiprocessing.util.Finalize(None,
+                                  shutil.rmtree,
+                                  args=(_scratch_directory, ),
+                                  kwargs={'ignore_errors': True},
+                                  exitpriority=0)
+
+
+def get_scratch_directory() -> Optional[str]:
+    return _scratch_directory
+
+
+def get_num_threads() -> Optional[int]:
+    # Number of threads of a calculation set by the pool (None outside of workers or if not set)
+    if _num_threads is None or _num_threads.value == 0:
+        return None
+    return _num_threads.value
+
+
+def _calculate_energy(atoms: Atoms, charge: int, spin: int, restart: Optional[bytes]) -> Tuple[float, Optional[bytes]]:
+    # The previous step of the episode may have been calculated by another worker, so its restart is passed in, and the
+    # restart of this calculation is returned
+    assert _backend is not None, 'Worker has not been initialized'
+    if restart is not None:
+        _backend.set_restart(atoms[:-1], restart)
+    energy = _backend.calculate(atoms, charge=charge, spin=spin)
+    return energy, _backend.get_restart(atoms)
+
+
+class EnergyPool(abc.ABC):
+    """Calculates energies with its backend asynchronously (e.g., in worker processes or on a reward server)."""
+    backend: Any
+
+    @abc.abstractmethod
+    def submit(self, atoms: Atoms, charge: int, spin: int) -> Future:
+        raise NotImplementedError
+
+    def map(self, jobs: Sequence[Tuple[Atoms, int, int]]) -> List[float]:
+        # Submit all jobs before waiting for any of them
+        futures = [self.submit(atoms, charge, spin) for atoms, charge, spin in jobs]
+        return [future.result() for future in futures]
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class WorkerPool(EnergyPool):
+    """
+    A pool of persistent worker processes running energy calculations with a copy of the given backend
+    (see molgym.reward.EnergyBackend). Every worker owns a private scratch directory, so that file-based
+    calculations can run concurrently.
+
+    The number of threads per calculation can be changed while the pool is running (see set_num_threads). If cpu_sets
+    are given, the workers are pinned to them in turn.
+
+    Restarts of warm-started backends (see molgym.reward.XTBBackend) are collected in the pool's backend and passed to
+    whichever worker calculates the next step of the same episode.
+    """
+    def __init__(
+        self,
+        num_workers: int,
+        backend: Any,
+        scratch_root: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        cpu_sets: Optional[List[List[int]]] = None,
+    ) -> None:
+        assert num_workers > 0
+
+        self.num_workers = num_workers
+        self.backend = backend
+        self.scratch_root = scratch_root or get_default_scratch_root()
+        os.makedirs(self.scratch_root, exist_ok=True)
+
+        self.num_threads = multiprocessing.Value('i', num_threads or 0)
+        self.cpu_sets = cpu_sets
+
+        logging.info(f'Starting {self.num_workers} reward workers (scratch: {self.scratch_root})')
+        self.executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                            initializer=_init_worker,
+                                            initargs=(self.backend, self.scratch_root, self.num_threads,
+                                                      self.cpu_sets, multiprocessing.Value('i', 0)))
+
+    def set_num_threads(self, num_threads: int) -> None:
+        # Applies to all calculations started afterwards
+        self.num_threads.value = num_threads
+
+    def submit(self, atoms: Atoms, charge: int, spin: int) -> Future:
+        restart = self.backend.get_restart(atoms[:-1]) if len(atoms) > 1 else None
+        calculation = self.executor.submit(_calculate_energy, atoms, charge, spin, restart)
+
+        future: Future = Future()
+        calculation.add_done_callback(lambda f: self._finish(atoms, f, future))
+        return future
+
+    def _finish(self, atoms: Atoms, calculation: Future, future: Future) -> None:
+        if calculation.exception() is not None:
+            future.set_exception(calculation.exception())
+            return
+
+        energy, restart = calculation.result()
+        if restart is not None:
+            self.backend.set_restart(atoms, restart)
+        future.set_result(energy)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self) -> 'WorkerPool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -1,24 +1,101 @@
+import os
+import signal
+import subprocess
 from re import search
-from typing import List
-from ase.calculators.calculator import FileIOCalculator
+from typing import List, Optional, Sequence
+
+import numpy as np
+from ase import Atoms
+from ase.calculators.calculator import FileIOCalculator, Calculator, CalculationFailed, all_changes
 from ase.io import read
 from ase.units import Hartree
 
 
+RESTART_FILE = 'xtbrestart'
+
+# Number of shells of the elements in GFN2-xTB
+gfn2_num_shells = {
+    1: 1,
+    2: 2,
+    5: 2,
+    6: 2,
+    7: 2,
+    8: 2,
+    9: 2,
+    14: 3,
+    15: 3,
+    16: 3,
+    17: 3,
+    35: 3,
+    53: 3,
+}
+
+
+class XTBTimeoutError(TimeoutError):
+    pass
+
+
 class XTB(FileIOCalculator):
     implemented_properties: List[str] = ['energy']
     command = "xtb mol.xyz --input calc.inp --ceasefiles 1> out.xot 2> /dev/null"
+    restart_command = "xtb mol.xyz --input calc.inp 1> out.xot 2> /dev/null"
+    force_field_command = "xtb mol.xyz --input calc.inp --gfnff --ceasefiles 1> out.xot 2> /dev/null"
     discard_results_on_any_change = True
 
     def __init__(self, restart=None,
                  ignore_bad_restart_file=FileIOCalculator._deprecated,
-                 label='xtb', atoms=None, **kwargs):
+                 label='xtb', atoms=None, timeout: Optional[float] = None, num_threads: Optional[int] = None,
+                 stacksize: Optional[str] = None, **kwargs):
         FileIOCalculator.__init__(self, restart, ignore_bad_restart_file, label,
                                   atoms, **kwargs)
         self.calc = None
+        self.timeout = timeout  # seconds
+        self.num_threads = num_threads  # OpenMP threads (default: inherited from the environment)
+        self.stacksize = stacksize  # OpenMP stack size per thread, e.g., '1G'
+
+    def calculate(self, atoms=None, properties=('energy', ), system_changes=all_changes):
+        Calculator.calculate(self, atoms, properties, system_changes)
+        self.write_input(self.atoms, properties, system_changes)
+
+        # xtb runs in a new session (and thus process group), so that the shell and xtb can be killed together
+        proc = subprocess.Popen(self.command,
+                                shell=True,
+                                cwd=self.directory,
+                                env=self._get_environment(),
+                                start_new_session=True)
+        try:
+            errorcode = proc.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired as e:
+            self._kill(proc)
+            raise XTBTimeoutError(f'xtb did not finish within {self.timeout} s in {self.directory}') from e
+        except BaseException:
+            self._kill(proc)
+            raise
+
+        if errorcode:
+            raise CalculationFailed(f'xtb failed in {self.directory} with error code {errorcode}')
+
+        self.read_results()
+
+    def _get_environment(self) -> dict:
+        env = os.environ.copy()
+        if self.num_threads is not None:
+            env['OMP_NUM_THREADS'] = f'{self.num_threads},1'
+            env['MKL_NUM_THREADS'] = str(self.num_threads)
+        if self.stacksize is not None:
+            env['OMP_STACKSIZE'] = self.stacksize
+        return env
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen) -> None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
 
     def _input(self) -> None:
-        with open(self.directory + '/calc.inp', 'w') as fd:
+        with open(os.path.join(self.directory, 'calc.inp'), 'w') as fd:
             lines = []
             for k, v in self.parameters.items():
                 if isinstance(v, dict):
@@ -33,14 +110,109 @@ class XTB(FileIOCalculator):
 
     def write_input(self, atoms, properties=None, system_changes=None):
         FileIOCalculator.write_input(self, atoms, properties, system_changes)
-        atoms.write(self.directory + '/mol.xyz')
+        atoms.write(os.path.join(self.directory, 'mol.xyz'))
         self._input()
-    
+
     def read_results(self):
-        with open('out.xot') as fd:
+        # The command is executed inside self.directory, so the output ends up there as well
+        with open(os.path.join(self.directory, 'out.xot')) as fd:
             lines = fd.read()
-        E = float(search(r"\| TOTAL ENERGY\s+(-?\d+\.\d+) Eh", lines)[1])
+        match = search(r"\| TOTAL ENERGY\s+(-?\d+\.\d+) Eh", lines)
+        if match is None:
+            raise CalculationFailed(f'No total energy found in output of xtb in {self.directory}')
+        E = float(match[1])
         self.results = dict(energy=E)
 
     def read(self, restart):
-        self.atoms = read('mol.xyz')
+        self.atoms = read(os.path.join(self.directory, 'mol.xyz'))
+
+
+def calculate_energy(atoms: Atoms,
+                     settings: dict,
+                     directory: str,
+                     timeout: Optional[float] = None,
+                     restart: Optional[bytes] = None,
+                     keep_restart=False,
+                     force_field=False,
+                     num_threads: Optional[int] = None,
+                     stacksize: Optional[str] = None) -> float:
+    """
+    Run a single xtb calculation inside directory, which must not be shared with concurrent calculations.
+    If given, the SCC starts from the restart file. If keep_restart is true, xtb writes a restart file
+    that can be read with read_restart afterwards. If force_field is true, GFN-FF is used instead of GFN2-xTB.
+    num_threads and stacksize set the OpenMP threads and their stack size of xtb.
+    """
+    assert not (force_field and (restart is not None or keep_restart)), 'GFN-FF does not use restart files'
+    restart_path = os.path.join(directory, RESTART_FILE)
+    if restart is not None:
+        with open(restart_path, 'wb') as f:
+            f.write(restart)
+    elif os.path.exists(restart_path):
+        # Never start from the restart file of an unrelated calculation
+        os.remove(restart_path)
+
+    calculator = XTB(directory=directory, timeout=timeout, num_threads=num_threads, stacksize=stacksize)
+    if force_field:
+        calculator.command = XTB.force_field_command
+    elif keep_restart:
+        calculator.command = XTB.restart_command
+    calculator.set(**settings)
+    calculator.atoms = atoms
+    return calculator.get_potential_energy()
+
+
+def read_restart(directory: str) -> Optional[bytes]:
+    try:
+        with open(os.path.join(directory, RESTART_FILE), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _read_records(data: bytes) -> Optional[List[bytes]]:
+    # Sequential unformatted Fortran file: every record is enclosed by its length (4 bytes)
+    records = []
+    offset = 0
+    while offset < len(data):
+        if offset + 4 > len(data):
+            return None
+        length = int(np.frombuffer(data, dtype=np.int32, count=1, offset=offset)[0])
+        end = offset + 4 + length
+        if end + 4 > len(data) or data[end:end + 4] != data[offset:offset + 4]:
+            return None
+        records.append(data[offset + 4:end])
+        offset = end + 4
+    return records
+
+
+def _write_records(records: Sequence[bytes]) -> bytes:
+    return b''.join(np.int32(len(record)).tobytes() + record + np.int32(len(record)).tobytes() for record in records)
+
+
+def pad_restart(restart: bytes, numbers: Sequence[int], spin: int) -> Optional[bytes]:
+    """
+    Extend the restart file of a molecule by atoms with the given atomic numbers, whose shell charges and
+    multipole moments are initialized with zero. Returns None if the file cannot be extended.
+    """
+    records = _read_records(restart)
+    if records is None or len(records) != 6 or len(records[1]) != 16 or len(records[2]) != 4:
+        return None
+
+    version, dimensions, _, shell_charges, dipoles, quadrupoles = records
+    num_atoms, num_shells = (int(value) for value in np.frombuffer(dimensions, dtype=np.int64))
+    if len(shell_charges) != 8 * num_shells or len(dipoles) != 8 * 3 * num_atoms or len(
+            quadrupoles) != 8 * 6 * num_atoms:
+        return None
+
+    if any(z not in gfn2_num_shells for z in numbers):
+        return None
+
+    num_new_shells = sum(gfn2_num_shells[z] for z in numbers)
+    return _write_records([
+        version,
+        np.array([num_atoms + len(numbers), num_shells + num_new_shells], dtype=np.int64).tobytes(),
+        np.int32(spin).tobytes(),
+        shell_charges + np.zeros(num_new_shells).tobytes(),
+        dipoles + np.zeros(3 * len(numbers)).tobytes(),
+        quadrupoles + np.zeros(6 * len(numbers)).tobytes(),
+    ])
@@ -0,0 +1,62 @@
+import argparse
+import logging
+import signal
+
+from molgym.energy_store import EnergyStore
+from molgym.reward_server import RewardServer, parse_address, get_authkey
+from molgym.tools.arg_parser import add_energy_backend_arguments
+from molgym.tools.reward_util import build_energy_backend
+
+
+def get_config() -> dict:
+    parser = argparse.ArgumentParser(description='Reward server of MolGym shared by several training runs')
+    parser.add_argument('--address',
+                        help='address to listen on (host:port or path of a Unix socket); clients authenticate with '
+                        'the secret key in $MOLGYM_REWARD_AUTHKEY or the file named by $MOLGYM_REWARD_AUTHKEY_FILE',
+                        type=str,
+                        required=True)
+    parser.add_argument('--num_workers',
+                        help='number of worker processes (default: number of cores)',
+                        type=int,
+                        default=None)
+    parser.add_argument('--energy_store',
+                        help='path to SQLite file storing calculated energies',
+                        type=str,
+                        default=None)
+    parser.add_argument('--energy_store_capacity',
+                        help='maximum number of energies kept in memory',
+                        type=int,
+                        default=100000)
+    parser.add_argument('--seed', help='random seed of the mock backend', type=int, default=0)
+    parser.add_argument('--log_level', help='log level', type=str, default='INFO')
+    add_energy_backend_arguments(parser)
+    args = parser.parse_args()
+    return vars(args)
+
+
+def main() -> None:
+    config = get_config()
+    logging.basicConfig(level=config['log_level'], format='%(asctime)s %(levelname)s: %(message)s')
+
+    store = EnergyStore(path=config['energy_store'], capacity=config['energy_store_capacity'])
+    server = RewardServer(backend=build_energy_backend(config),
+                          address=parse_address(config['address']),
+                          authkey=get_authkey(),
+                          num_workers=config['num_workers'],
+                          store=store,
+                          scratch_root=config['scratch_dir'])
+
+    # Shut down cleanly on SIGTERM (e.g., by a job scheduler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,9 +8,13 @@ from molgym.environment import RefillableMolecularEnvironment
 from molgym.ppo import batch_ppo
 from molgym.reward import SolvationReward
 from molgym.spaces import ActionSpace, ObservationSpace
+from molgym.state import BaseStructure
 from molgym.tools import util
 from molgym.tools.arg_parser import build_default_argparser
 from molgym.tools.model_util import ModelIO, build_model
+from molgym.tools.autoscaler import build_autoscaler
+from molgym.tools.resources import build_resource_planner
+from molgym.tools.reward_util import build_reward_stack
 
 
 def get_config() -> dict:
@@ -21,6 +25,16 @@ def get_config() -> dict:
                         required=False,
                         default=0)
     parser.add_argument('--initial_structure', help='path to initial structure', type=str, required=False)
+    parser.add_argument('--solvation_cutoff',
+                        help='only include fragments within this distance (in Angstrom) of the new atom in the reward',
+                        type=float,
+                        required=False,
+                        default=None)
+    parser.add_argument('--full_check_interval',
+                        help='calculate the reward of the full cluster every n steps to monitor truncation errors',
+                        type=int,
+                        required=False,
+                        default=0)
     args = parser.parse_args()
     config = vars(args)
     return config
@@ -29,6 +43,11 @@ def get_config() -> dict:
 def main() -> None:
     config = get_config()
 
+    # Record the resource plan in the saved config
+    resource_planner = build_resource_planner(config)
+    if resource_planner is not None:
+        config['resource_plan'] = resource_planner.plan.to_dict()
+
     util.create_directories([config['log_dir'], config['model_dir'], config['data_dir'], config['results_dir']])
 
     tag = util.get_tag(config)
@@ -69,19 +88,28 @@ def main() -> None:
     var_counts = util.count_vars(model)
     logging.info(f'Number of parameters: {var_counts}')
 
-    reward = SolvationReward()
+    reward_stack = build_reward_stack(config,
+                                      model_dir=config['model_dir'],
+                                      resource_planner=resource_planner,
+                                      reward_cls=SolvationReward,
+                                      cutoff=config['solvation_cutoff'],
+                                      full_check_interval=config['full_check_interval'])
+    reward, prescreen = reward_stack.reward, reward_stack.prescreen
 
     # Number of episodes during evaluation
     if not config['num_eval_episodes']:
         config['num_eval_episodes'] = len(eval_formulas)
 
     if config['initial_structure']:
-        initial_structure = ase.io.read(config['initial_structure'], index=0, format='xyz')
+        atoms = ase.io.read(config['initial_structure'], index=0, format='xyz')
     else:
-        initial_structure = ase.Atoms()
+        atoms = ase.Atoms()
 
-    training_envs = SimpleEnvContainer([
-        RefillableMolecularEnvironment(
+    # All environments share the initial structure (and its neighbor index and energy)
+    initial_structure = BaseStructure(atoms)
+
+    def build_training_env() -> RefillableMolecularEnvironment:
+        return RefillableMolecularEnvironment(
             reward=reward,
             observation_space=observation_space,
             action_space=action_space,
@@ -91,8 +119,15 @@ def main() -> None:
             min_atomic_distance=config['min_atomic_distance'],
             max_solo_distance=config['max_solo_distance'],
             min_reward=config['min_reward'],
-        ) for _ in range(config['num_envs'])
-    ])
+            terminal_reward=config['terminal_reward'],
+            deferred_reward=config['deferred_reward'],
+            prescreen=prescreen,
+        )
+
+    training_envs = util.build_env_container(config,
+                                             env_fn=build_training_env,
+                                             observation_space=observation_space)
+    autoscaler = build_autoscaler(config, training_envs)
 
     eval_envs = SimpleEnvContainer([
         RefillableMolecularEnvironment(
@@ -105,6 +140,9 @@ def main() -> None:
             min_atomic_distance=config['min_atomic_distance'],
             max_solo_distance=config['max_solo_distance'],
             min_reward=config['min_reward'],
+            terminal_reward=config['terminal_reward'],
+            deferred_reward=config['deferred_reward'],
+            prescreen=prescreen,
         )
     ])
 
@@ -135,9 +173,17 @@ def main() -> None:
         save_train_rollout=config['save_rollouts'] == 'train' or config['save_rollouts'] == 'all',
         save_eval_rollout=config['save_rollouts'] == 'eval' or config['save_rollouts'] == 'all',
         info_saver=util.InfoSaver(directory=config['results_dir'], tag=tag),
+        reward=reward,
+        prescreen=prescreen,
+        resource_planner=resource_planner,
+        async_rollout=config['async_rollout'],
+        autoscaler=autoscaler,
         device=device,
     )
 
+    training_envs.close()
+    reward_stack.close()
+
 
 if __name__ == '__main__':
     main()
@@ -6,11 +6,13 @@ import ase.io
 from molgym.env_container import SimpleEnvContainer
 from molgym.environment import StochasticEnvironment, MolecularEnvironment
 from molgym.ppo import batch_ppo
-from molgym.reward import InteractionReward
 from molgym.spaces import ActionSpace, ObservationSpace
 from molgym.tools import util
 from molgym.tools.arg_parser import build_default_argparser
 from molgym.tools.model_util import ModelIO, build_model
+from molgym.tools.autoscaler import build_autoscaler
+from molgym.tools.resources import build_resource_planner
+from molgym.tools.reward_util import build_reward_stack
 
 
 def get_config() -> dict:
@@ -24,6 +26,11 @@ def get_config() -> dict:
 def main() -> None:
     config = get_config()
 
+    # Record the resource plan in the saved config
+    resource_planner = build_resource_planner(config)
+    if resource_planner is not None:
+        config['resource_plan'] = resource_planner.plan.to_dict()
+
     util.create_directories([config['log_dir'], config['model_dir'], config['data_dir'], config['results_dir']])
 
     tag = util.get_tag(config)
@@ -61,14 +68,15 @@ def main() -> None:
     var_counts = util.count_vars(model)
     logging.info(f'Number of parameters: {var_counts}')
 
-    reward = InteractionReward()
+    reward_stack = build_reward_stack(config, model_dir=config['model_dir'], resource_planner=resource_planner)
+    reward, prescreen = reward_stack.reward, reward_stack.prescreen
 
     # Number of episodes during evaluation
     if not config['num_eval_episodes']:
         config['num_eval_episodes'] = len(eval_formulas)
 
-    training_envs = SimpleEnvContainer([
-        StochasticEnvironment(
+    def build_training_env() -> StochasticEnvironment:
+        return StochasticEnvironment(
             reward=reward,
             observation_space=observation_space,
             action_space=action_space,
@@ -77,8 +85,15 @@ def main() -> None:
             min_atomic_distance=config['min_atomic_distance'],
             max_solo_distance=config['max_solo_distance'],
             min_reward=config['min_reward'],
-        ) for _ in range(config['num_envs'])
-    ])
+            terminal_reward=config['terminal_reward'],
+            deferred_reward=config['deferred_reward'],
+            prescreen=prescreen,
+        )
+
+    training_envs = util.build_env_container(config,
+                                             env_fn=build_training_env,
+                                             observation_space=observation_space)
+    autoscaler = build_autoscaler(config, training_envs)
 
     eval_envs = SimpleEnvContainer([
         MolecularEnvironment(
@@ -89,6 +104,9 @@ def main() -> None:
             min_atomic_distance=config['min_atomic_distance'],
             max_solo_distance=config['max_solo_distance'],
             min_reward=config['min_reward'],
+            terminal_reward=config['terminal_reward'],
+            deferred_reward=config['deferred_reward'],
+            prescreen=prescreen,
         )
     ])
 
@@ -119,9 +137,17 @@ def main() -> None:
         save_train_rollout=config['save_rollouts'] == 'train' or config['save_rollouts'] == 'all',
         save_eval_rollout=config['save_rollouts'] == 'eval' or config['save_rollouts'] == 'all',
         info_saver=util.InfoSaver(directory=config['results_dir'], tag=tag),
+        reward=reward,
+        prescreen=prescreen,
+        resource_planner=resource_planner,
+        async_rollout=config['async_rollout'],
+        autoscaler=autoscaler,
         device=device,
     )
 
+    training_envs.close()
+    reward_stack.close()
+
 
 if __name__ == '__main__':
     main()
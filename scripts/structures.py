@@ -6,7 +6,7 @@ from typing import Tuple
 import ase.data
 import ase.io
 
-from molgym.spaces import CanvasSpace
+from molgym.spaces import ObservationSpace
 from molgym.tools.analysis import parse_buffer_filename, collect_buffer_paths
 
 
@@ -39,7 +39,8 @@ def main() -> None:
     paths = collect_buffer_paths(args.dir, mode=args.mode)
     print(f'Parsed paths: {len(paths)}')
 
-    canvas_space = CanvasSpace(size=args.canvas_size, zs=[ase.data.atomic_numbers[s] for s in args.symbols.split(',')])
+    observation_space = ObservationSpace(canvas_size=args.canvas_size,
+                                         zs=[ase.data.atomic_numbers[s] for s in args.symbols.split(',')])
 
     # Sort paths
     paths = sorted(paths, key=path_to_sort_key)
@@ -54,9 +55,10 @@ def main() -> None:
         with open(path, mode='rb') as f:
             buffer = pickle.load(f)
 
+        # Buffers hold array observations (or tuple observations if they were saved by an older version)
         atoms = [
-            canvas_space.to_atoms(obs[0]) for terminal, obs in zip(buffer.term_buf, buffer.next_obs_buf)
-            if obs and terminal
+            observation_space.parse(obs)[0] for terminal, obs in zip(buffer.term_buf, buffer.next_obs_buf)
+            if obs is not None and terminal
         ]
         for atom in atoms:
             atom.info = info
@@ -10,6 +10,11 @@ from cormorant.so3_lib import rotations
 
 from molgym.agents.covariant.agent import CovariantAC
 from molgym.agents.covariant.so3_tools import generate_fibonacci_grid, AtomicScalars
+from molgym.buffer_container import PPOBufferContainer
+from molgym.env_container import SimpleEnvContainer
+from molgym.environment import MolecularEnvironment
+from molgym.ppo import batch_rollout, compute_loss
+from molgym.reward import InteractionReward, MorseBackend
 from molgym.spaces import ActionSpace, ObservationSpace
 from molgym.tools import util
 
@@ -126,3 +131,41 @@ class CovariantAgentTest(TestCase):
         for file in ['h2o.xyz', 'ch3.xyz', 'ch4.xyz']:
             self.verify_invariance(
                 atoms=ase.io.read(filename=os.path.join(self.RESOURCES, file), format='xyz', index=0))
+
+
+class CovariantRolloutTest(TestCase):
+    def setUp(self) -> None:
+        util.set_seeds(0)
+        zs = [0, 1, 6, 8]
+        self.observation_space = ObservationSpace(canvas_size=5, zs=zs)
+        self.action_space = ActionSpace(zs=zs)
+        self.agent = CovariantAC(
+            observation_space=self.observation_space,
+            action_space=self.action_space,
+            min_max_distance=(0.9, 1.8),
+            network_width=64,
+            bag_scale=1,
+            device=torch.device('cpu'),
+            maxl=2,
+            num_cg_levels=2,
+            num_channels_hidden=10,
+            num_channels_per_element=4,
+            num_gaussians=3,
+        )
+        environments = [
+            MolecularEnvironment(reward=InteractionReward(backend=MorseBackend()),
+                                 observation_space=self.observation_space,
+                                 action_space=self.action_space,
+                                 formulas=[util.string_to_formula('H2CO')]) for _ in range(2)
+        ]
+        self.envs = SimpleEnvContainer(environments)
+
+    def test_rollout(self):
+        container = PPOBufferContainer(size=self.envs.get_size(), gamma=0.99, lam=0.97)
+        batch_rollout(self.agent, envs=self.envs, buffer_container=container, num_steps=8)
+
+        data = container.merge().get_data()
+        self.assertEqual(len(data['obs']), 8)
+
+        loss, _ = compute_loss(self.agent, data=data, clip_ratio=0.2, vf_coef=0.5, entropy_coef=0.0)
+        self.assertTrue(torch.isfinite(loss))
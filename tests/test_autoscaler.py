@@ -0,0 +1,116 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from unittest import TestCase
+
+from ase import Atom
+
+from molgym.env_container import SimpleEnvContainer, ScalableEnvContainer
+from molgym.environment import MolecularEnvironment
+from molgym.reward import InteractionReward, MorseBackend
+from molgym.spaces import ObservationSpace, ActionSpace
+from molgym.tools.autoscaler import EnvAutoscaler, get_allowed_sizes
+from molgym.tools.util import string_to_formula, get_cpu_time, get_elapsed_cpu_time
+
+
+def spin(duration: float) -> None:
+    start = time.time()
+    while time.time() - start < duration:
+        pass
+
+
+class TestAutoscaler(TestCase):
+    def setUp(self):
+        self.zs = [0, 1, 6, 8]
+        self.observation_space = ObservationSpace(canvas_size=5, zs=self.zs)
+        self.action_space = ActionSpace(zs=self.zs)
+        self.reward = InteractionReward(backend=MorseBackend())
+
+        environments = [
+            MolecularEnvironment(reward=self.reward,
+                                 observation_space=self.observation_space,
+                                 action_space=self.action_space,
+                                 formulas=[string_to_formula('H2CO')]) for _ in range(8)
+        ]
+        self.envs = ScalableEnvContainer(SimpleEnvContainer(environments), num_active=2)
+
+    @staticmethod
+    def get_rollout_info(time: float, cpu_time: Optional[float]) -> dict:
+        return {'time': time, 'cpu_time': cpu_time, 'env_time': time / 2, 'policy_time': time / 2}
+
+    def test_allowed_sizes(self):
+        self.assertEqual(get_allowed_sizes(num_steps_per_iter=24, min_envs=2, max_envs=8), [2, 3, 4, 6, 8])
+
+    def test_scalable_container(self):
+        self.assertEqual(len(self.envs.reset()), 2)
+
+        action = self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0)))
+        self.envs.set_num_active(4)
+        self.envs.reset()
+        observations, _, _, _ = self.envs.step([action] * 4)
+        self.assertEqual(len(observations), 4)
+        self.assertEqual(self.envs.get_size(), 4)
+
+        with self.assertRaises(AssertionError):
+            self.envs.set_num_active(9)
+
+    def test_decisions(self):
+        autoscaler = EnvAutoscaler(self.envs, num_steps_per_iter=16, min_envs=1, max_envs=8, num_cores=4, cooldown=1)
+
+        # Idle cores
+        decision = autoscaler.update(self.get_rollout_info(time=2.0, cpu_time=2.0))
+        self.assertEqual(decision['reason'], 'grow')
+        self.assertEqual(self.envs.get_size(), 4)
+        self.assertAlmostEqual(decision['utilization'], 0.25)
+        self.assertAlmostEqual(decision['throughput'], 8.0)
+
+        # Throughput improved
+        decision = autoscaler.update(self.get_rollout_info(time=1.0, cpu_time=2.0))
+        self.assertEqual(decision['reason'], 'grow')
+        self.assertEqual(self.envs.get_size(), 8)
+
+        # Throughput dropped
+        decision = autoscaler.update(self.get_rollout_info(time=1.5, cpu_time=6.0))
+        self.assertEqual(decision['reason'], 'revert')
+        self.assertEqual(self.envs.get_size(), 4)
+
+        decision = autoscaler.update(self.get_rollout_info(time=1.0, cpu_time=2.0))
+        self.assertEqual(decision['reason'], 'cooldown')
+        self.assertEqual(self.envs.get_size(), 4)
+
+        # Saturated cores
+        decision = autoscaler.update(self.get_rollout_info(time=1.0, cpu_time=4.0))
+        self.assertEqual(decision['reason'], 'keep')
+        self.assertEqual(self.envs.get_size(), 4)
+
+    def test_oversubscription(self):
+        autoscaler = EnvAutoscaler(self.envs, num_steps_per_iter=16, min_envs=1, max_envs=8, num_cores=4, patience=2)
+        autoscaler.update(self.get_rollout_info(time=2.0, cpu_time=2.0))
+        self.assertEqual(self.envs.get_size(), 4)
+
+        # Saturated cores at a throughput that is only slightly lower than with fewer environments
+        decision = autoscaler.update(self.get_rollout_info(time=2.1, cpu_time=8.4))
+        self.assertEqual(decision['reason'], 'keep')
+
+        # Sustained drop of the throughput
+        for _ in range(2):
+            decision = autoscaler.update(self.get_rollout_info(time=2.5, cpu_time=10.0))
+        self.assertEqual(decision['reason'], 'shrink')
+        self.assertEqual(self.envs.get_size(), 2)
+
+    def test_unmeasured_workers(self):
+        autoscaler = EnvAutoscaler(self.envs, num_steps_per_iter=16, min_envs=1, max_envs=8, num_cores=4)
+        decision = autoscaler.update(self.get_rollout_info(time=2.0, cpu_time=None))
+        self.assertEqual(decision['reason'], 'keep')
+        self.assertIsNone(decision['utilization'])
+        self.assertEqual(self.envs.get_size(), 2)
+
+    def test_worker_cpu_time(self):
+        # CPU time of a running worker process is included
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            executor.submit(time.sleep, 0.0).result()
+            start = get_cpu_time()
+            executor.submit(spin, 0.5).result()
+            elapsed = get_elapsed_cpu_time(start)
+            assert elapsed is not None
+            self.assertGreater(elapsed, 0.3)
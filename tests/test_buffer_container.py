@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+import numpy as np
+from ase import Atoms, Atom
+
+from molgym.buffer_container import PPOBufferContainer
+from molgym.environment import PendingReward
+from molgym.reward import InteractionReward, MorseBackend
+
+
+class TestBufferContainer(TestCase):
+    def setUp(self):
+        self.reward = InteractionReward(backend=MorseBackend())
+
+    def store(self, container: PPOBufferContainer, reward: float, terminal: bool, info: dict) -> None:
+        container.store(observations=[None],
+                        actions=np.zeros((1, 2)),
+                        rewards=np.array([reward]),
+                        next_observations=[None],
+                        terminals=np.array([terminal]),
+                        values=np.zeros(1),
+                        logps=np.zeros(1),
+                        infos=[info])
+
+    def test_deferred_rewards(self):
+        container = PPOBufferContainer(size=1, gamma=1.0, lam=1.0)
+
+        initial_atoms = Atoms()
+        initial_atoms.append(Atom('C', position=(0, 0, 0)))
+        atoms = initial_atoms.copy()
+        atoms.append(Atom('O', position=(1.2, 0, 0)))
+
+        pending = PendingReward(self.reward, initial_atoms=initial_atoms, atoms=atoms, min_reward=-0.6)
+        self.store(container, reward=0.0, terminal=False, info={})
+        self.store(container, reward=0.0, terminal=True, info={'pending_reward': pending})
+        self.store(container, reward=0.0, terminal=False, info={})
+
+        # Episode is counted, but cannot be finished yet
+        self.assertEqual(container.get_num_episodes(), 1)
+        self.assertEqual(len(container.episodic_returns), 0)
+
+        container.finish_paths(np.zeros(1))
+
+        expected, _ = self.reward.calculate(initial_atoms, Atom('O', position=(1.2, 0, 0)))
+        self.assertAlmostEqual(container.buffers[0].rew_buf[1], expected)
+        self.assertEqual(container.episode_lengths, [2])
+        self.assertAlmostEqual(container.episodic_returns[0], expected)
+        self.assertTrue(container.buffers[0].is_finished())
+
+    def test_pending_per_buffer(self):
+        container = PPOBufferContainer(size=2, gamma=1.0, lam=1.0)
+
+        atoms = Atoms('CO', positions=[(0, 0, 0), (1.2, 0, 0)])
+        pending = PendingReward(self.reward, initial_atoms=atoms[:1], atoms=atoms, min_reward=-0.6)
+        container.store_single(index=0,
+                               observation=None,
+                               action=np.zeros(2),
+                               reward=0.0,
+                               next_observation=None,
+                               terminal=True,
+                               value=0.0,
+                               logp=0.0,
+                               info={'pending_reward': pending})
+        self.assertEqual(container.num_pending_rewards, [1, 0])
+
+        # Episodes of other buffers are finished right away
+        container.store_single(index=1,
+                               observation=None,
+                               action=np.zeros(2),
+                               reward=1.0,
+                               next_observation=None,
+                               terminal=True,
+                               value=0.0,
+                               logp=0.0,
+                               info={})
+        self.assertEqual(container.episodic_returns, [1.0])
+
+        container.resolve_rewards()
+        self.assertEqual(container.num_pending_rewards, [0, 0])
+        self.assertEqual(len(container.episodic_returns), 2)
@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from ase import Atoms
+
+from molgym.energy_store import EnergyStore, get_canonical_key
+
+
+class TestCanonicalKey(TestCase):
+    def setUp(self):
+        self.atoms = Atoms(symbols='OHH',
+                           positions=[
+                               (-0.27939703, 0.83823215, 0.00973345),
+                               (-0.52040310, 1.77677325, 0.21391146),
+                               (0.54473632, 0.90669722, -0.53501306),
+                           ])
+        self.key = get_canonical_key(self.atoms, charge=0, spin=0, method='gfn2-xtb')
+
+    def test_invariance(self):
+        transformed = self.atoms.copy()
+        transformed.rotate(37, v='z')
+        transformed.rotate(-71, v='x')
+        transformed.translate((1.0, -2.0, 3.0))
+        self.assertEqual(get_canonical_key(transformed, charge=0, spin=0, method='gfn2-xtb'), self.key)
+
+        permuted = self.atoms[[2, 0, 1]]
+        self.assertEqual(get_canonical_key(permuted, charge=0, spin=0, method='gfn2-xtb'), self.key)
+
+    def test_distinct(self):
+        stretched = self.atoms.copy()
+        stretched.positions[1] += np.array([0.1, 0.0, 0.0])
+        self.assertNotEqual(get_canonical_key(stretched, charge=0, spin=0, method='gfn2-xtb'), self.key)
+
+        self.assertNotEqual(get_canonical_key(self.atoms, charge=1, spin=0, method='gfn2-xtb'), self.key)
+        self.assertNotEqual(get_canonical_key(self.atoms, charge=0, spin=1, method='gfn2-xtb'), self.key)
+        self.assertNotEqual(get_canonical_key(self.atoms, charge=0, spin=0, method='pm6'), self.key)
+
+
+class TestEnergyStore(TestCase):
+    def test_lru(self):
+        store = EnergyStore(capacity=2)
+        store.put('a', 1.0)
+        store.put('b', 2.0)
+        self.assertEqual(store.get('a'), 1.0)
+        store.put('c', 3.0)
+
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('c'), 3.0)
+
+        info = store.get_info()
+        self.assertEqual(info['store_memory_hits'], 2)
+        self.assertEqual(info['store_misses'], 1)
+
+    def test_persistence(self):
+        path = os.path.join(tempfile.mkdtemp(), 'energies.db')
+
+        store = EnergyStore(path=path)
+        store.put('a', -1.5)
+        store.close()
+
+        store = EnergyStore(path=path)
+        self.assertEqual(store.get('a'), -1.5)
+        self.assertEqual(store.get_info()['store_disk_hits'], 1)
+        self.assertEqual(store.get('a'), -1.5)
+        self.assertEqual(store.get_info()['store_memory_hits'], 1)
+        store.close()
+
+    def test_batches(self):
+        path = os.path.join(tempfile.mkdtemp(), 'energies.db')
+        store = EnergyStore(path=path, commit_interval=2)
+        reader = sqlite3.connect(path)
+
+        def count() -> int:
+            return reader.execute('SELECT COUNT(*) FROM energies').fetchone()[0]
+
+        store.put('a', -1.5)
+        self.assertEqual(count(), 0)
+        self.assertEqual(store.get('a'), -1.5)
+        store.put('b', -2.5)
+        self.assertEqual(count(), 2)
+
+        store.put('c', -3.5)
+        self.assertEqual(count(), 2)
+        store.get_info()
+        self.assertEqual(count(), 3)
+
+        store.put('d', -4.5)
+        store.close()
+        self.assertEqual(count(), 4)
+        reader.close()
+
+    def test_fork(self):
+        path = os.path.join(tempfile.mkdtemp(), 'energies.db')
+        store = EnergyStore(path=path)
+        store.put('a', -1.5)
+
+        # A forked process opens its own connection
+        process = multiprocessing.get_context('fork').Process(target=store.put, args=('b', -2.5))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+
+        self.assertEqual(store.get('b'), -2.5)
+        self.assertEqual(store.get_info()['store_disk_hits'], 1)
+        store.close()
@@ -1,11 +1,18 @@
+import os
+import time
 from unittest import TestCase
 
-from ase import Atom
+import numpy as np
+from ase import Atom, Atoms
 
-from molgym.environment import MolecularEnvironment
-from molgym.reward import InteractionReward
+from molgym.energy_store import EnergyStore
+from molgym.env_container import SimpleEnvContainer, ThreadedEnvContainer, SubprocEnvContainer
+from molgym.environment import (MolecularEnvironment, ConstrainedMolecularEnvironment, RefillableMolecularEnvironment,
+                                resolve_rewards, is_inside_hull, get_hull_equations)
+from molgym.reward import InteractionReward, MorseBackend
 from molgym.spaces import ObservationSpace, ActionSpace
-from molgym.tools.util import string_to_formula
+from molgym.state import BaseStructure
+from molgym.tools.util import string_to_formula, merge_infos
 
 
 class TestEnvironment(TestCase):
@@ -65,3 +72,320 @@ class TestEnvironment(TestCase):
         action = self.action_space.from_atom(atom=Atom(symbol='H', position=(0, 1.5, 0)))
         obs, reward, done, info = env.step(action=action)
         self.assertTrue(done)
+
+    def test_mock_backend(self):
+        formula = string_to_formula('H2CO')
+        env = MolecularEnvironment(reward=InteractionReward(backend=MorseBackend()),
+                                   observation_space=self.observation_space,
+                                   action_space=self.action_space,
+                                   formulas=[formula])
+
+        env.step(self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0))))
+        obs, reward, done, info = env.step(self.action_space.from_atom(Atom(symbol='O', position=(1.2, 0.0, 0.0))))
+
+        self.assertGreater(reward, 0.0)
+        self.assertFalse(done)
+
+    def test_terminal_reward(self):
+        formula = string_to_formula('H2CO')
+        atoms = [
+            Atom(symbol='C', position=(0.0, 0.0, 0.0)),
+            Atom(symbol='O', position=(1.2, 0.0, 0.0)),
+            Atom(symbol='H', position=(-0.6, 0.9, 0.0)),
+            Atom(symbol='H', position=(-0.6, -0.9, 0.0)),
+        ]
+
+        rewards = {}
+        for terminal_reward in [False, True]:
+            env = MolecularEnvironment(reward=InteractionReward(backend=MorseBackend()),
+                                       observation_space=self.observation_space,
+                                       action_space=self.action_space,
+                                       formulas=[formula],
+                                       terminal_reward=terminal_reward)
+            rewards[terminal_reward] = [env.step(self.action_space.from_atom(atom))[1] for atom in atoms]
+
+        self.assertEqual(rewards[True][:-1], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(rewards[True][-1], sum(rewards[False]))
+
+    def test_deferred_reward(self):
+        formula = string_to_formula('H2CO')
+        atoms = [
+            Atom(symbol='C', position=(0.0, 0.0, 0.0)),
+            Atom(symbol='O', position=(1.2, 0.0, 0.0)),
+            Atom(symbol='H', position=(-0.6, 0.9, 0.0)),
+        ]
+
+        env = MolecularEnvironment(reward=InteractionReward(backend=MorseBackend()),
+                                   observation_space=self.observation_space,
+                                   action_space=self.action_space,
+                                   formulas=[formula])
+        rewards = [env.step(self.action_space.from_atom(atom))[1] for atom in atoms]
+
+        env = MolecularEnvironment(reward=InteractionReward(backend=MorseBackend()),
+                                   observation_space=self.observation_space,
+                                   action_space=self.action_space,
+                                   formulas=[formula],
+                                   deferred_reward=True)
+        steps = [env.step(self.action_space.from_atom(atom)) for atom in atoms]
+        self.assertTrue(all(reward == 0.0 for _, reward, _, _ in steps))
+
+        deferred_rewards = resolve_rewards([info['pending_reward'] for _, _, _, info in steps])
+        for reward, deferred_reward in zip(rewards, deferred_rewards):
+            self.assertAlmostEqual(reward, deferred_reward)
+
+    def test_threaded_container(self):
+        formula = string_to_formula('H2CO')
+        actions = [
+            self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0))),
+            self.action_space.from_atom(Atom(symbol='O', position=(1.2, 0.0, 0.0))),
+        ]
+
+        results = {}
+        for container_class in [SimpleEnvContainer, ThreadedEnvContainer]:
+            reward = InteractionReward(backend=MorseBackend(latency=0.1))
+            envs = container_class([
+                MolecularEnvironment(reward=reward,
+                                     observation_space=self.observation_space,
+                                     action_space=self.action_space,
+                                     formulas=[formula]) for _ in range(4)
+            ])
+            envs.reset()
+
+            start = time.time()
+            envs.step([actions[0]] * 4)
+            _, rewards, _, _ = envs.step([actions[1]] * 4)
+            results[container_class] = rewards, time.time() - start
+            envs.close()
+
+        simple_rewards, simple_time = results[SimpleEnvContainer]
+        threaded_rewards, threaded_time = results[ThreadedEnvContainer]
+        self.assertTrue(np.allclose(simple_rewards, threaded_rewards))
+        self.assertLess(threaded_time, simple_time)
+
+
+class TestConstrainedEnvironment(TestCase):
+    def setUp(self):
+        self.zs = [0, 1, 6, 8, 10]
+        self.observation_space = ObservationSpace(canvas_size=12, zs=self.zs)
+        self.action_space = ActionSpace(zs=self.zs)
+
+        corners = [(x, y, z) for x in (-3.0, 3.0) for y in (-3.0, 3.0) for z in (-3.0, 3.0)]
+        self.env = ConstrainedMolecularEnvironment(scaffold=Atoms('Ne8', positions=corners),
+                                                   scaffold_z=10,
+                                                   reward=InteractionReward(backend=MorseBackend()),
+                                                   observation_space=self.observation_space,
+                                                   action_space=self.action_space,
+                                                   formulas=[string_to_formula('CO')])
+
+    def test_hull(self):
+        positions = np.array([[0.0, 0.0, 0.0], [3.0, 0.0, 0.0], [3.1, 0.0, 0.0], [0.0, -4.0, 1.0]])
+        self.assertEqual(is_inside_hull(self.env.hull_equations, positions).tolist(), [True, True, False, False])
+
+    def test_step(self):
+        self.env.reset()
+        _, reward, done, _ = self.env.step(self.action_space.from_atom(Atom(symbol='C', position=(5.0, 0.0, 0.0))))
+        self.assertTrue(done)
+        self.assertEqual(reward, self.env.min_reward)
+
+        self.env.reset()
+        _, reward, done, _ = self.env.step(self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0))))
+        self.assertFalse(done)
+        _, reward, done, _ = self.env.step(self.action_space.from_atom(Atom(symbol='O', position=(1.2, 0.0, 0.0))))
+        self.assertTrue(done)
+        self.assertGreater(reward, 0.0)
+
+        # The reward only takes the placed atoms into account
+        reward_atoms = self.env._get_reward_atoms(self.env.current_atoms)
+        self.assertEqual(reward_atoms.numbers.tolist(), [6, 8])
+
+    def test_placed_scaffold_atom(self):
+        env = ConstrainedMolecularEnvironment(scaffold=self.env.scaffold,
+                                              scaffold_z=10,
+                                              reward=InteractionReward(backend=MorseBackend()),
+                                              observation_space=self.observation_space,
+                                              action_space=self.action_space,
+                                              formulas=[string_to_formula('CONe')])
+        env.step(self.action_space.from_atom(Atom(symbol='Ne', position=(2.5, 2.5, 2.5))))
+        _, _, done, _ = env.step(self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0))))
+        self.assertFalse(done)
+
+        # A placed atom with the scaffold's number is part of the scaffold, both for the reward and the hull
+        mask = env._get_scaffold_mask(env.current_atoms)
+        self.assertEqual(mask.tolist(), [True] * 9 + [False])
+        self.assertEqual(env._get_reward_atoms(env.current_atoms).numbers.tolist(), [6])
+
+        positions = np.random.RandomState(0).uniform(low=-3.5, high=3.5, size=(1000, 3))
+        hull_equations = get_hull_equations(env.current_atoms.positions[mask])
+        self.assertEqual(is_inside_hull(env.hull_equations, positions).tolist(),
+                         is_inside_hull(hull_equations, positions).tolist())
+
+
+class TestRefillableEnvironment(TestCase):
+    def setUp(self):
+        self.zs = [0, 1, 8]
+        self.observation_space = ObservationSpace(canvas_size=12, zs=self.zs)
+        self.action_space = ActionSpace(zs=self.zs)
+
+        water = Atoms('OH2', positions=[(0.0, 0.0, 0.0), (0.96, 0.0, 0.0), (-0.24, 0.93, 0.0)])
+        self.base = BaseStructure(water)
+        self.reward = InteractionReward(backend=MorseBackend())
+
+    def build_env(self) -> RefillableMolecularEnvironment:
+        return RefillableMolecularEnvironment(reward=self.reward,
+                                              observation_space=self.observation_space,
+                                              action_space=self.action_space,
+                                              formulas=[string_to_formula('H2O')],
+                                              initial_structure=self.base,
+                                              num_refills=1)
+
+    def test_shared_base(self):
+        envs = [self.build_env() for _ in range(2)]
+        action = self.action_space.from_atom(Atom(symbol='O', position=(2.8, 0.0, 0.0)))
+
+        rewards = []
+        for env in envs:
+            observation = env.reset()
+            atoms, _ = self.observation_space.parse(observation)
+            self.assertEqual(len(atoms), 3)
+            self.assertIs(env.current_atoms.base, self.base)
+
+            _, reward, _, _ = env.step(action)
+            rewards.append(reward)
+            self.assertEqual(len(env.current_atoms), 4)
+            self.assertEqual(env.current_atoms.size, 1)
+
+        # The energy of the base is calculated once
+        self.assertIn('morse', self.base.energies)
+        self.assertAlmostEqual(rewards[0], rewards[1])
+
+        # The base is part of the distance checks
+        env = envs[0]
+        env.reset()
+        _, reward, done, _ = env.step(self.action_space.from_atom(Atom(symbol='O', position=(0.1, 0.0, 0.0))))
+        self.assertTrue(done)
+        self.assertEqual(reward, env.min_reward)
+
+
+class CrashingBackend(MorseBackend):
+    # Emulates a segmentation fault of the worker whenever a nitrogen atom is involved
+    def calculate(self, atoms, charge, spin):
+        if 7 in atoms.numbers:
+            os._exit(1)
+        return super().calculate(atoms, charge=charge, spin=spin)
+
+
+class TestSubprocEnvContainer(TestCase):
+    def setUp(self):
+        self.zs = [0, 1, 6, 7, 8]
+        self.observation_space = ObservationSpace(canvas_size=5, zs=self.zs)
+        self.action_space = ActionSpace(zs=self.zs)
+
+    def build_env(self) -> MolecularEnvironment:
+        return MolecularEnvironment(reward=InteractionReward(backend=CrashingBackend()),
+                                    observation_space=self.observation_space,
+                                    action_space=self.action_space,
+                                    formulas=[string_to_formula('H2CNO')],
+                                    min_reward=-0.6)
+
+    def test_step(self):
+        actions = [
+            self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0))),
+            self.action_space.from_atom(Atom(symbol='O', position=(1.2, 0.0, 0.0))),
+        ]
+
+        envs = SubprocEnvContainer([self.build_env] * 3,
+                                   canvas_size=self.observation_space.canvas_space.size,
+                                   bag_size=self.observation_space.bag_space.size,
+                                   num_workers=2)
+        simple_envs = SimpleEnvContainer([self.build_env() for _ in range(3)])
+
+        self.assertEqual(envs.reset(), simple_envs.reset())
+        for action in actions:
+            observations, rewards, terminals, _ = envs.step([action] * 3)
+            simple_observations, simple_rewards, simple_terminals, _ = simple_envs.step([action] * 3)
+
+            self.assertEqual(list(observations), list(simple_observations))
+            self.assertTrue(np.allclose(rewards, simple_rewards))
+            self.assertTrue(np.all(terminals == simple_terminals))
+
+        envs.close()
+
+    def test_submit_step(self):
+        carbon = self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0)))
+        oxygen = self.action_space.from_atom(Atom(symbol='O', position=(1.2, 0.0, 0.0)))
+
+        envs = SubprocEnvContainer([self.build_env] * 3,
+                                   canvas_size=self.observation_space.canvas_space.size,
+                                   bag_size=self.observation_space.bag_space.size,
+                                   num_workers=2)
+        simple_envs = SimpleEnvContainer([self.build_env() for _ in range(3)])
+        envs.reset()
+        simple_envs.reset()
+
+        # Environments are stepped independently, i.e., some of them are ahead of the others
+        envs.submit_step(0, carbon).result()
+        for index in range(3):
+            simple_envs.submit_step(index, carbon).result()
+        futures = [envs.submit_step(1, carbon), envs.submit_step(2, carbon), envs.submit_step(0, oxygen)]
+        observations, rewards, terminals, _ = zip(*[future.result() for future in futures])
+        simple_observation, simple_reward, _, _ = simple_envs.submit_step(0, oxygen).result()
+
+        self.assertEqual(observations[2], simple_observation)
+        self.assertAlmostEqual(rewards[2], simple_reward)
+        self.assertEqual(observations[0], observations[1])
+        self.assertFalse(any(terminals))
+
+        self.assertEqual(envs.reset_env(0), simple_envs.reset_env(0))
+        envs.close()
+
+    def test_remote_infos(self):
+        reward = InteractionReward(backend=MorseBackend(), store=EnergyStore())
+
+        def build_env() -> MolecularEnvironment:
+            return MolecularEnvironment(reward=reward,
+                                        observation_space=self.observation_space,
+                                        action_space=self.action_space,
+                                        formulas=[string_to_formula('H2CO')])
+
+        envs = SubprocEnvContainer([build_env] * 3,
+                                   canvas_size=self.observation_space.canvas_space.size,
+                                   bag_size=self.observation_space.bag_space.size,
+                                   num_workers=2)
+        envs.reset()
+        envs.step([self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0)))] * 3)
+
+        # One copy of the reward per worker, the copy of this process is unused
+        infos = envs.get_remote_infos('reward')
+        self.assertEqual(len(infos), 2)
+        self.assertGreater(merge_infos(infos)['store_misses'], 0)
+        self.assertEqual(reward.get_info()['store_misses'], 0)
+        self.assertEqual(envs.get_remote_infos('prescreen'), [])
+
+        envs.close()
+
+    def test_restart(self):
+        envs = SubprocEnvContainer([self.build_env] * 2,
+                                   canvas_size=self.observation_space.canvas_space.size,
+                                   bag_size=self.observation_space.bag_space.size,
+                                   min_reward=-0.6)
+        envs.reset()
+
+        carbon = self.action_space.from_atom(Atom(symbol='C', position=(0.0, 0.0, 0.0)))
+        nitrogen = self.action_space.from_atom(Atom(symbol='N', position=(0.0, 0.0, 0.0)))
+        observations, rewards, terminals, infos = envs.step([nitrogen, carbon])
+
+        self.assertEqual(envs.num_restarts, 1)
+        self.assertEqual(rewards[0], -0.6)
+        self.assertTrue(terminals[0])
+        self.assertTrue(infos[0]['worker_crashed'])
+        self.assertFalse(terminals[1])
+
+        # Restarted environment has been reset
+        atoms, _ = self.observation_space.parse(observations[0])
+        self.assertEqual(len(atoms), 0)
+
+        # Restarted worker keeps working
+        _, _, terminals, infos = envs.step([carbon, carbon])
+        self.assertFalse(terminals[0])
+
+        envs.close()
@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+import numpy as np
+from ase import Atom
+
+from molgym.neighbors import NeighborIndex, CellList
+from molgym.state import MolecularState
+
+
+class TestNeighborIndex(TestCase):
+    def setUp(self):
+        self.random_state = np.random.RandomState(0)
+
+    def build_state(self, num_atoms: int) -> MolecularState:
+        state = MolecularState(capacity=num_atoms)
+        for position in self.random_state.uniform(-6.0, 6.0, size=(num_atoms, 3)):
+            state.append(Atom('O', position=position))
+        return state
+
+    def test_cell_list(self):
+        cell_list = CellList(cell_size=2.0)
+        positions = self.random_state.uniform(-6.0, 6.0, size=(200, 3))
+        for index, position in enumerate(positions):
+            cell_list.add(index, position)
+
+        center = np.array([0.5, -1.0, 3.9])
+        candidates = set(cell_list.get_candidates(center).tolist())
+        close = np.flatnonzero(np.linalg.norm(positions - center, axis=-1) < 2.0)
+        self.assertTrue(set(close.tolist()) <= candidates)
+        self.assertLess(len(candidates), len(positions))
+
+    def test_query(self):
+        state = self.build_state(150)
+        index = NeighborIndex(cell_size=2.0, cell_list_threshold=100)
+
+        # Atoms are added incrementally, and the cell list is used once the threshold is exceeded
+        small_state = state[:50]
+        for position in self.random_state.uniform(-6.0, 6.0, size=(10, 3)):
+            for atoms in [small_state, state]:
+                for radius in [0.6, 2.0, 3.0]:
+                    indices, distances = index.query(atoms, position, radius=radius)
+                    expected = np.flatnonzero(np.linalg.norm(atoms.positions - position, axis=-1) < radius)
+                    self.assertEqual(sorted(indices.tolist()), expected.tolist())
+                    self.assertTrue(np.all(distances < radius))
+
+        self.assertIsNotNone(index.cell_list)
+
+    def test_incremental(self):
+        state = self.build_state(80)
+        index = NeighborIndex(cell_size=2.0, cell_list_threshold=64)
+        index.query(state, np.zeros(3), radius=1.0)
+        self.assertEqual(index.num_indexed, 80)
+
+        state.append(Atom('H', position=(0.1, 0.0, 0.0)))
+        indices, _ = index.query(state, np.zeros(3), radius=0.5)
+        self.assertIn(80, indices.tolist())
+        self.assertEqual(index.num_indexed, 81)
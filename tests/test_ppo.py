@@ -0,0 +1,76 @@
+import time
+from typing import List, Tuple
+from unittest import TestCase
+
+import torch
+from ase import Atoms
+
+from molgym.buffer_container import PPOBufferContainer
+from molgym.env_container import SimpleEnvContainer
+from molgym.environment import MolecularEnvironment
+from molgym.ppo import batch_rollout
+from molgym.reward import InteractionReward, MorseBackend
+from molgym.spaces import ObservationSpace, ActionSpace
+from molgym.tools.util import string_to_formula
+
+
+class SlowReward(InteractionReward):
+    """Takes at least the given delay to calculate a batch of rewards."""
+    def __init__(self, delay: float) -> None:
+        super().__init__(backend=MorseBackend())
+        self.delay = delay
+
+    def calculate_batch(self, transitions: List[Tuple[Atoms, Atoms]]) -> List[Tuple[float, dict]]:
+        time.sleep(self.delay)
+        return super().calculate_batch(transitions)
+
+
+class FixedActorCritic:
+    """Builds CO by placing C at the origin and O next to it."""
+    def __init__(self, observation_space: ObservationSpace, action_space: ActionSpace) -> None:
+        self.observation_space = observation_space
+        self.action_space = action_space
+
+    def step(self, observations) -> dict:
+        actions = []
+        for observation in observations:
+            atoms, _ = self.observation_space.parse(observation)
+            if len(atoms) == 0:
+                actions.append((self.action_space.zs.index(6), (0.0, 0.0, 0.0)))
+            else:
+                actions.append((self.action_space.zs.index(8), (1.2, 0.0, 0.0)))
+
+        num_observations = len(observations)
+        return {
+            'actions': actions,
+            'a': torch.zeros((num_observations, 2)),
+            'v': torch.zeros(num_observations),
+            'logp': torch.zeros(num_observations),
+        }
+
+
+class TestBatchRollout(TestCase):
+    def setUp(self):
+        zs = [0, 1, 6, 8]
+        self.observation_space = ObservationSpace(canvas_size=5, zs=zs)
+        self.action_space = ActionSpace(zs=zs)
+        self.ac = FixedActorCritic(self.observation_space, self.action_space)
+
+    def test_deferred_reward_time(self):
+        delay = 0.5
+        envs = SimpleEnvContainer([
+            MolecularEnvironment(reward=SlowReward(delay=delay),
+                                 observation_space=self.observation_space,
+                                 action_space=self.action_space,
+                                 formulas=[string_to_formula('CO')],
+                                 deferred_reward=True) for _ in range(2)
+        ])
+
+        for asynchronous in [False, True]:
+            container = PPOBufferContainer(size=envs.get_size(), gamma=1.0, lam=1.0)
+            info = batch_rollout(self.ac, envs=envs, buffer_container=container, num_steps=4, asynchronous=asynchronous)
+
+            # The rewards of both episodes are calculated in one batch after the rollout
+            self.assertEqual(len(container.episodic_returns), 2)
+            self.assertTrue(all(ret != 0.0 for ret in container.episodic_returns))
+            self.assertGreaterEqual(info['env_time'], delay)
@@ -0,0 +1,83 @@
+from unittest import TestCase
+
+from ase import Atoms, Atom
+
+from molgym.environment import MolecularEnvironment
+from molgym.prescreen import PreScreen, UnionFind, REJECTED_OVERLAP, REJECTED_FRAGMENTS, REJECTED_VALENCE
+from molgym.reward import InteractionReward, MorseBackend
+from molgym.spaces import ObservationSpace, ActionSpace
+from molgym.tools.util import string_to_formula
+
+
+class TestUnionFind(TestCase):
+    def test_union(self):
+        union_find = UnionFind(5)
+        union_find.union(0, 1)
+        union_find.union(3, 4)
+        union_find.union(1, 0)
+        self.assertEqual(union_find.num_sets, 3)
+        self.assertEqual(union_find.find(0), union_find.find(1))
+        self.assertNotEqual(union_find.find(0), union_find.find(3))
+
+
+class TestPreScreen(TestCase):
+    def setUp(self):
+        self.atoms = Atoms(symbols='CH', positions=[(0, 0, 0), (1.09, 0, 0)])
+
+    def test_overlap(self):
+        prescreen = PreScreen()
+        self.assertEqual(prescreen.check(self.atoms, Atom('O', position=(0, 0.5, 0))), REJECTED_OVERLAP)
+        self.assertIsNone(prescreen.check(self.atoms, Atom('O', position=(0, 1.2, 0))))
+
+    def test_fragments(self):
+        prescreen = PreScreen(max_fragments=1)
+        self.assertEqual(prescreen.check(self.atoms, Atom('O', position=(0, 3.0, 0))), REJECTED_FRAGMENTS)
+        self.assertIsNone(prescreen.check(self.atoms, Atom('O', position=(0, 1.4, 0))))
+
+        # Disconnected fragments are allowed by default
+        self.assertIsNone(PreScreen().check(self.atoms, Atom('O', position=(0, 3.0, 0))))
+
+    def test_valence(self):
+        prescreen = PreScreen(check_valence=True)
+
+        # Second bond of the hydrogen atom
+        self.assertEqual(prescreen.check(self.atoms, Atom('H', position=(1.09, 0.6, 0))), REJECTED_VALENCE)
+        self.assertIsNone(prescreen.check(self.atoms, Atom('H', position=(-0.5, 0.9, 0))))
+
+    def test_info(self):
+        prescreen = PreScreen()
+        prescreen.check(self.atoms, Atom('O', position=(0, 0.5, 0)))
+        prescreen.check(self.atoms, Atom('O', position=(0, 1.2, 0)))
+
+        info = prescreen.get_info()
+        self.assertEqual(info['prescreen_checks'], 2)
+        self.assertEqual(info['prescreen_saved_calls'], 2)
+        self.assertEqual(info['prescreen_' + REJECTED_OVERLAP], 1)
+
+        self.assertEqual(prescreen.get_info()['prescreen_checks'], 0)
+
+    def test_environment(self):
+        zs = [0, 1, 6, 7, 8]
+        action_space = ActionSpace(zs=zs)
+        prescreen = PreScreen(max_fragments=1)
+        env = MolecularEnvironment(reward=InteractionReward(backend=MorseBackend()),
+                                   observation_space=ObservationSpace(canvas_size=5, zs=zs),
+                                   action_space=action_space,
+                                   formulas=[string_to_formula('CH2O')],
+                                   min_reward=-0.6,
+                                   prescreen=prescreen)
+
+        env.step(action_space.from_atom(Atom('C', position=(0, 0, 0))))
+        _, reward, done, info = env.step(action_space.from_atom(Atom('O', position=(0, 3.0, 0))))
+        self.assertEqual(reward, -0.6)
+        self.assertTrue(done)
+        self.assertEqual(prescreen.get_info()['prescreen_saved_calls'], 2)
+
+    def test_terminal_reward(self):
+        # Rejections in terminal-reward mode are followed by the terminal reward calculation
+        prescreen = PreScreen(terminal_reward=True)
+        prescreen.check(self.atoms, Atom('O', position=(0, 0.5, 0)))
+
+        info = prescreen.get_info()
+        self.assertEqual(info['prescreen_' + REJECTED_OVERLAP], 1)
+        self.assertEqual(info['prescreen_saved_calls'], 0)
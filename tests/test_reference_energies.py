@@ -0,0 +1,38 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from ase import Atoms, Atom
+
+from molgym.reference_energies import ReferenceEnergies, get_reference_energies
+from molgym.reward import InteractionReward, MorseBackend
+
+
+class TestReferenceEnergies(TestCase):
+    def setUp(self):
+        self.backend = MorseBackend()
+        self.path = os.path.join(tempfile.mkdtemp(), 'reference_energies.json')
+
+    def test_persistence(self):
+        table = get_reference_energies(self.path, symbols=['H', 'C'], backend=self.backend)
+        self.assertEqual(table.get('H', charge=0, spin=1, method='morse'), 0.0)
+        self.assertEqual(table.get('C', charge=0, spin=0, method='morse'), 0.0)
+        self.assertIsNone(table.get('C', charge=0, spin=0, method='gfn2-xtb'))
+
+        table = get_reference_energies(self.path, symbols=['H', 'C', 'O'], backend=self.backend)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(len(ReferenceEnergies.load(self.path)), 3)
+
+    def test_version(self):
+        with open(self.path, mode='w') as f:
+            json.dump({'version': 0, 'energies': {'morse:H:0:1': 1.0}}, f)
+        self.assertEqual(len(ReferenceEnergies.load(self.path)), 0)
+
+    def test_reward(self):
+        table = ReferenceEnergies()
+        table.set('H', charge=0, spin=1, method='morse', energy=-0.5)
+        reward = InteractionReward(backend=self.backend, reference_energies=table)
+
+        value, info = reward.calculate(Atoms(), Atom('H'))
+        self.assertAlmostEqual(value, -0.5)
@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+import torch
+
+from molgym import worker_pool
+from molgym.reward import XTBBackend, MorseBackend
+from molgym.tools.resources import plan_resources, ResourcePlanner, get_num_concurrent_environments
+from molgym.worker_pool import WorkerPool
+from molgym.xtb import XTB
+
+
+class TestResourcePlan(TestCase):
+    def test_in_process(self):
+        plan = plan_resources(num_cores=16, num_envs=4, num_reward_workers=0)
+        self.assertEqual(plan.xtb_threads, 16)
+        self.assertEqual(plan.torch_threads, 16)
+
+    def test_concurrent_environments(self):
+        plan = plan_resources(num_cores=16, num_envs=8, num_reward_workers=0, num_concurrent=4)
+        self.assertEqual(plan.num_calculations, 4)
+        self.assertEqual(plan.xtb_threads, 4)
+        self.assertEqual(plan.torch_threads, 16)
+
+        # More threads than environments
+        plan = plan_resources(num_cores=16, num_envs=2, num_reward_workers=0, num_concurrent=4)
+        self.assertEqual(plan.xtb_threads, 8)
+
+        # More calculations than cores
+        plan = plan_resources(num_cores=2, num_envs=8, num_reward_workers=0, num_concurrent=8)
+        self.assertEqual(plan.xtb_threads, 1)
+
+        config = {'num_env_workers': 0, 'num_env_threads': 4}
+        self.assertEqual(get_num_concurrent_environments(config), 4)
+        config = {'num_env_workers': 0, 'num_env_threads': 0}
+        self.assertEqual(get_num_concurrent_environments(config), 1)
+
+    def test_workers(self):
+        plan = plan_resources(num_cores=16, num_envs=4, num_reward_workers=8, reward_fraction=0.5)
+        self.assertEqual(plan.num_calculations, 4)
+        self.assertEqual(plan.xtb_threads, 2)
+        self.assertEqual(plan.torch_threads, 8)
+
+        plan = plan_resources(num_cores=16, num_envs=4, num_reward_workers=4, reward_fraction=1.0)
+        self.assertEqual(plan.xtb_threads, 3)
+        self.assertEqual(plan.torch_threads, 4)
+
+        # More calculations than cores
+        plan = plan_resources(num_cores=2, num_envs=8, num_reward_workers=8)
+        self.assertEqual(plan.xtb_threads, 1)
+        self.assertEqual(plan.torch_threads, 1)
+
+    def test_xtb_environment(self):
+        env = XTB(num_threads=3, stacksize='2G')._get_environment()
+        self.assertEqual(env['OMP_NUM_THREADS'], '3,1')
+        self.assertEqual(env['OMP_STACKSIZE'], '2G')
+
+
+class TestResourcePlanner(TestCase):
+    def setUp(self):
+        self.num_threads = torch.get_num_threads()
+
+    def tearDown(self):
+        torch.set_num_threads(self.num_threads)
+
+    def test_replan(self):
+        backend = XTBBackend()
+        with WorkerPool(num_workers=2, backend=MorseBackend()) as pool:
+            planner = ResourcePlanner(num_cores=8, num_envs=2, num_reward_workers=2, tolerance=0.1)
+            planner.attach(backend=backend, pool=pool)
+            self.assertEqual(backend.num_threads, 2)
+            self.assertEqual(torch.get_num_threads(), 4)
+            self.assertEqual(pool.executor.submit(worker_pool.get_num_threads).result(), 2)
+
+            self.assertFalse(planner.update(reward_time=1.1, policy_time=1.0))
+            self.assertTrue(planner.update(reward_time=3.0, policy_time=1.0))
+            self.assertEqual(backend.num_threads, 3)
+            self.assertEqual(pool.executor.submit(worker_pool.get_num_threads).result(), 3)
@@ -1,9 +1,17 @@
-from unittest import TestCase
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+import ase.data
+import numpy as np
 
 import pkg_resources
 from ase import Atoms, Atom
+from ase.calculators.calculator import CalculationFailed
 
-from molgym.reward import InteractionReward
+from molgym.reward import InteractionReward, MorseBackend, TieredReward, SolvationReward, get_geometry_fingerprint, \
+    get_local_region, STATUS_FAILED, STATUS_TIMEOUT, SparrowBackend, XTBBackend
 
 RESOURCES_FOLDER = 'resources'
 
@@ -44,3 +52,199 @@ class TestReward(TestCase):
         atoms.append(atom3)
 
         self.assertAlmostEqual(reward1 + reward2, 0.2141968)
+
+    def test_incremental(self):
+        reward = InteractionReward(incremental=True)
+
+        atom1 = Atom('H', position=(0, 0, 0))
+        atom2 = Atom('H', position=(1, 0, 0))
+        atom3 = Atom('H', position=(2, 0, 0))
+
+        atoms = Atoms()
+        atoms.append(atom1)
+
+        reward1, _ = reward.calculate(atoms, atom2)
+        atoms.append(atom2)
+
+        reward2, info = reward.calculate(atoms, atom3)
+        atoms.append(atom3)
+
+        self.assertTrue(info['energy_reused'])
+        self.assertAlmostEqual(reward1 + reward2, 0.2141968)
+
+    def test_fingerprint(self):
+        atoms = Atoms(symbols='OH', positions=[(0, 0, 0), (1, 0, 0)])
+        self.assertEqual(get_geometry_fingerprint(atoms), get_geometry_fingerprint(atoms.copy()))
+
+        moved = atoms.copy()
+        moved.positions[1, 0] = 1.1
+        self.assertNotEqual(get_geometry_fingerprint(atoms), get_geometry_fingerprint(moved))
+
+        swapped = Atoms(symbols='HO', positions=[(0, 0, 0), (1, 0, 0)])
+        self.assertNotEqual(get_geometry_fingerprint(atoms), get_geometry_fingerprint(swapped))
+
+
+class TestMorseBackend(TestCase):
+    def setUp(self):
+        self.backend = MorseBackend()
+        self.reward = InteractionReward(backend=self.backend)
+
+    def test_energy(self):
+        self.assertEqual(self.backend.calculate(Atoms('H'), charge=0, spin=1), 0.0)
+
+        distance = 2 * ase.data.covalent_radii[1]
+        h2 = Atoms('H2', positions=[(0, 0, 0), (distance, 0, 0)])
+        self.assertAlmostEqual(self.backend.calculate(h2, charge=0, spin=0), -MorseBackend.well_depths[1])
+
+        moved = h2.copy()
+        moved.rotate(45, v='y')
+        moved.translate((1.0, 2.0, 3.0))
+        self.assertAlmostEqual(self.backend.calculate(moved, charge=0, spin=0), -MorseBackend.well_depths[1])
+
+    def test_addition(self):
+        atoms = Atoms()
+        atoms.append(Atom('C', position=(0, 0, 0)))
+
+        reward1, _ = self.reward.calculate(atoms, Atom('H', position=(1.1, 0, 0)))
+        atoms.append(Atom('H', position=(1.1, 0, 0)))
+
+        reward2, _ = self.reward.calculate(atoms, Atom('H', position=(-1.1, 0, 0)))
+        atoms.append(Atom('H', position=(-1.1, 0, 0)))
+
+        # Isolated atoms have zero energy
+        self.assertGreater(reward1, 0.0)
+        self.assertAlmostEqual(reward1 + reward2, -self.backend.calculate(atoms, charge=0, spin=0))
+
+    def test_failure(self):
+        reward = InteractionReward(backend=MorseBackend(failure_rate=1.0))
+        value, info = reward.calculate(Atoms('H', positions=[(0, 0, 0)]), Atom('H', position=(1, 0, 0)))
+        self.assertEqual(info['status'], STATUS_FAILED)
+
+    def test_timeout(self):
+        reward = InteractionReward(backend=MorseBackend(latency=1.0, timeout=0.01))
+        value, info = reward.calculate(Atoms('H', positions=[(0, 0, 0)]), Atom('H', position=(1, 0, 0)))
+        self.assertEqual(info['status'], STATUS_TIMEOUT)
+
+
+class FakeSparrow:
+    # Stateful calculator like Sparrow, with a delay to expose interleaved calls of several threads
+    def __init__(self) -> None:
+        self.backend = MorseBackend()
+        self.elements: list = []
+        self.positions = np.zeros((0, 3))
+
+    def set_elements(self, elements: list) -> None:
+        self.elements = elements
+
+    def set_positions(self, positions: np.ndarray) -> None:
+        self.positions = np.array(positions)
+        time.sleep(0.01)
+
+    def set_settings(self, settings: dict) -> None:
+        pass
+
+    def calculate_energy(self) -> float:
+        return self.backend.calculate(Atoms(symbols=self.elements, positions=self.positions), charge=0, spin=0)
+
+
+class FakeSparrowBackend(SparrowBackend):
+    def _create_calculator(self):
+        return FakeSparrow()
+
+
+class TestSparrowBackend(TestCase):
+    def test_threads(self):
+        backend = FakeSparrowBackend()
+        molecules = [Atoms('H2', positions=[(0, 0, 0), (0.5 + 0.1 * i, 0, 0)]) for i in range(8)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            energies = list(executor.map(lambda atoms: backend.calculate(atoms, charge=0, spin=0), molecules))
+
+        expected = [MorseBackend().calculate(atoms, charge=0, spin=0) for atoms in molecules]
+        self.assertTrue(np.allclose(energies, expected))
+
+        # Calculators are not pickled
+        copy = pickle.loads(pickle.dumps(backend))
+        self.assertAlmostEqual(copy.calculate(molecules[0], charge=0, spin=0), expected[0])
+
+
+class TestXTBBackend(TestCase):
+    def setUp(self):
+        self.backend = XTBBackend(timeout=1.0, num_retries=1)
+        self.atoms = Atoms('H2', positions=[(0, 0, 0), (0.7, 0, 0)])
+
+    def test_retry(self):
+        with mock.patch('molgym.xtb.calculate_energy', side_effect=[CalculationFailed('SCC'), -1.0]) as calculate:
+            self.assertEqual(self.backend.calculate(self.atoms, charge=0, spin=0), -1.0)
+
+        # Retried with the fallback settings
+        self.assertEqual(calculate.call_count, 2)
+        self.assertEqual(calculate.call_args.kwargs['settings']['scc'], self.backend.fallback_settings['scc'])
+
+    def test_timeout(self):
+        with mock.patch('molgym.xtb.calculate_energy', side_effect=TimeoutError('xtb')) as calculate:
+            with self.assertRaises(TimeoutError):
+                self.backend.calculate(self.atoms, charge=0, spin=0)
+
+        self.assertEqual(calculate.call_count, 1)
+
+
+class TestTieredReward(TestCase):
+    def setUp(self):
+        self.cheap = InteractionReward(backend=MorseBackend(width=1.0))
+        self.expensive = InteractionReward(backend=MorseBackend(width=2.0))
+        self.atoms = Atoms('C', positions=[(0, 0, 0)])
+        self.new_atom = Atom('H', position=(1.5, 0, 0))
+
+    def test_screening(self):
+        reward = TieredReward(cheap=self.cheap, expensive=self.expensive, threshold=10.0, calibration_fraction=0.0)
+        value, info = reward.calculate(self.atoms, self.new_atom)
+        self.assertEqual(info['tier'], 'cheap')
+        self.assertAlmostEqual(value, self.cheap.calculate(self.atoms, self.new_atom)[0])
+
+        reward = TieredReward(cheap=self.cheap, expensive=self.expensive, threshold=-10.0, calibration_fraction=0.0)
+        value, info = reward.calculate(self.atoms, self.new_atom)
+        self.assertEqual(info['tier'], 'expensive')
+        self.assertAlmostEqual(value, self.expensive.calculate(self.atoms, self.new_atom)[0])
+
+    def test_calibration(self):
+        reward = TieredReward(cheap=self.cheap, expensive=self.expensive, threshold=10.0, calibration_fraction=1.0)
+        all_atoms = self.atoms.copy()
+        all_atoms.append(self.new_atom)
+        results = reward.calculate_batch([(self.atoms, all_atoms)] * 2)
+        self.assertTrue(all(info['tier'] == 'expensive' for _, info in results))
+
+        info = reward.get_info()
+        self.assertEqual(info['tier_expensive'], 2)
+        self.assertEqual(info['calibration_count'], 2)
+        self.assertGreater(info['calibration_mae'], 0.0)
+        self.assertEqual(reward.get_info()['calibration_count'], 0)
+
+
+class TestSolvationReward(TestCase):
+    def setUp(self):
+        water = Atoms(symbols='OHH', positions=[(0.0, 0.0, 0.0), (0.96, 0.0, 0.0), (-0.24, 0.93, 0.0)])
+        far_water = water.copy()
+        far_water.translate((20.0, 0.0, 0.0))
+        self.cluster = water + far_water
+        self.new_atom = Atom('O', position=(-2.0, 0.0, 0.0))
+
+    def test_local_region(self):
+        indices = get_local_region(self.cluster, centers=np.array([self.new_atom.position]), cutoff=1.5)
+        self.assertEqual(indices.tolist(), [])
+
+        # Whole fragment is included even though only the oxygen atom is within the cutoff
+        indices = get_local_region(self.cluster, centers=np.array([self.new_atom.position]), cutoff=2.5)
+        self.assertEqual(indices.tolist(), [0, 1, 2])
+
+    def test_truncation(self):
+        full = SolvationReward(backend=MorseBackend())
+        truncated = SolvationReward(backend=MorseBackend(), cutoff=5.0, full_check_interval=1)
+
+        reward, _ = full.calculate(self.cluster, self.new_atom)
+        truncated_reward, info = truncated.calculate(self.cluster, self.new_atom)
+        self.assertAlmostEqual(reward, truncated_reward)
+        self.assertAlmostEqual(info['truncation_error'], 0.0)
+
+        info = truncated.get_info()
+        self.assertEqual(info['region_size_mean'], 3)
+        self.assertEqual(info['truncation_count'], 1)
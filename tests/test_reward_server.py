@@ -0,0 +1,102 @@
+import os
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from unittest import TestCase, mock
+
+from ase import Atoms, Atom
+
+from molgym.reward import InteractionReward, MorseBackend, STATUS_FAILED
+from molgym.reward_server import (RewardServer, RewardClient, parse_address, get_authkey, AUTHKEY_VARIABLE,
+                                  AUTHKEY_FILE_VARIABLE)
+
+
+class TestRewardServer(TestCase):
+    def setUp(self):
+        self.address = os.path.join(tempfile.mkdtemp(), 'reward.sock')
+        self.backend = MorseBackend(latency=0.2)
+        self.authkey = os.urandom(16)
+        self.server = RewardServer(backend=self.backend, address=self.address, authkey=self.authkey, num_workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = RewardClient(address=self.address, authkey=self.authkey)
+
+        self.atoms = Atoms(symbols='HH', positions=[(0, 0, 0), (0.8, 0, 0)])
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.thread.join()
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('localhost:8000'), ('localhost', 8000))
+        self.assertEqual(parse_address(':8000'), ('localhost', 8000))
+        self.assertEqual(parse_address('/tmp/reward.sock'), '/tmp/reward.sock')
+
+    def test_authkey(self):
+        with mock.patch.dict(os.environ, {AUTHKEY_VARIABLE: 'secret-key-of-the-server'}):
+            self.assertEqual(get_authkey(), b'secret-key-of-the-server')
+
+        path = os.path.join(tempfile.mkdtemp(), 'authkey')
+        with open(path, mode='wb') as f:
+            f.write(b'secret-key-from-a-file\n')
+        with mock.patch.dict(os.environ, {AUTHKEY_FILE_VARIABLE: path}):
+            self.assertEqual(get_authkey(), b'secret-key-from-a-file')
+
+        # There is no default key
+        with mock.patch.dict(os.environ, clear=True):
+            with self.assertRaises(RuntimeError):
+                get_authkey()
+
+        with self.assertRaises(ValueError):
+            RewardClient(address=self.address, authkey=b'molgym')
+
+        with self.assertRaises(AuthenticationError):
+            RewardClient(address=self.address, authkey=os.urandom(16))
+
+        # The server keeps accepting clients
+        with RewardClient(address=self.address, authkey=self.authkey) as client:
+            self.assertEqual(client.backend.method, self.backend.method)
+
+    def test_calculate(self):
+        self.assertEqual(self.client.backend.method, self.backend.method)
+        energy = self.client.backend.calculate(self.atoms, charge=0, spin=0)
+        self.assertAlmostEqual(energy, self.backend.get_energy(self.atoms.numbers, self.atoms.positions))
+
+    def test_deduplication(self):
+        # Same geometry with permuted atoms
+        permuted = self.atoms[::-1]
+        energies = self.client.map([(self.atoms, 0, 0), (permuted, 0, 0)])
+        self.assertAlmostEqual(energies[0], energies[1])
+
+        info = self.client.get_server_info()
+        self.assertEqual(info['server_requests'], 2)
+        self.assertEqual(info['server_deduplicated'], 1)
+        self.assertEqual(info['server_calculated'], 1)
+
+        # Shared energy cache
+        self.client.map([(self.atoms, 0, 0)])
+        info = self.client.get_server_info()
+        self.assertEqual(info['server_calculated'], 0)
+
+    def test_reward(self):
+        reward = InteractionReward(backend=self.client.backend, pool=self.client)
+        value, info = reward.calculate(Atoms(symbols='H', positions=[(0, 0, 0)]), Atom('H', position=(0.8, 0, 0)))
+        self.assertAlmostEqual(value, -self.backend.get_energy(self.atoms.numbers, self.atoms.positions))
+
+    def test_failure(self):
+        server_address = os.path.join(tempfile.mkdtemp(), 'failing.sock')
+        server = RewardServer(backend=MorseBackend(failure_rate=1.0),
+                              address=server_address,
+                              authkey=self.authkey,
+                              num_workers=1)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        with RewardClient(address=server_address, authkey=self.authkey) as client:
+            reward = InteractionReward(backend=client.backend, pool=client)
+            value, info = reward.calculate(Atoms(symbols='H', positions=[(0, 0, 0)]), Atom('H', position=(0.8, 0, 0)))
+            self.assertEqual(info['status'], STATUS_FAILED)
+
+        server.close()
+        thread.join()
@@ -3,7 +3,7 @@ from unittest import TestCase
 import numpy as np
 from ase import Atoms, Atom
 
-from molgym.spaces import ObservationSpace, CanvasItemSpace, ActionSpace, CanvasSpace, BagSpace
+from molgym.spaces import ObservationSpace, CanvasItemSpace, ActionSpace, CanvasSpace, BagSpace, ArrayObservation
 
 
 class TestAtomicSpace(TestCase):
@@ -105,3 +105,40 @@ class TestObservationSpace(TestCase):
 
         self.assertEqual(len(canvas), 5)
         self.assertEqual(len(bag), len(self.atomic_numbers))
+
+    def test_array_observation(self):
+        space = ObservationSpace(canvas_size=5, zs=self.atomic_numbers)
+        atoms = Atoms(symbols='CH', positions=[(0.0, 0.0, 0.0), (1.1, 0.0, 0.0)])
+        observation = space.build(atoms, formula=((1, 2), (7, 1)))
+
+        self.assertIsInstance(observation, ArrayObservation)
+        self.assertEqual(observation.canvas.shape, (5, 4))
+        self.assertEqual(observation.num_atoms, 2)
+        self.assertEqual(observation.bag.tolist(), [0, 2, 0, 1])
+
+        numbers, positions, bag = space.parse_arrays(observation)
+        self.assertEqual(numbers.tolist(), [6, 1])
+        self.assertTrue(np.allclose(positions, atoms.positions))
+
+        parsed, formula = space.parse(observation)
+        self.assertEqual(parsed.get_chemical_formula(), 'CH')
+        self.assertEqual(formula, ((0, 0), (1, 2), (6, 0), (7, 1)))
+
+        with self.assertRaises(RuntimeError):
+            space.build(Atoms(symbols='H6'), formula=())
+
+        with self.assertRaises(ValueError):
+            space.build(Atoms(symbols='O'), formula=())
+
+    def test_tuple_adapter(self):
+        space = ObservationSpace(canvas_size=5, zs=self.atomic_numbers)
+        observation = space.build(Atoms(symbols='NH', positions=[(0.0, 0.0, 0.0), (1.0, 0.0, 0.0)]), formula=((6, 1), ))
+
+        tup = space.to_tuple(observation)
+        self.assertEqual(len(tup[0]), 5)
+        self.assertEqual(tup[0][0], (3, (0.0, 0.0, 0.0)))
+        self.assertEqual(tup[1], (0, 0, 1, 0))
+        self.assertEqual(space.from_tuple(tup), observation)
+
+        atoms, _ = space.parse(space.sample())
+        self.assertLessEqual(len(atoms), 5)
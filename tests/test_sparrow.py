@@ -4,9 +4,10 @@ from unittest import TestCase
 import ase.io
 import numpy as np
 import pkg_resources
-from ase import Atoms
+from ase import Atoms, Atom
 
 from molgym.calculator import Sparrow
+from molgym.reward import InteractionReward, SparrowBackend
 
 RESOURCES_FOLDER = 'resources'
 
@@ -64,3 +65,12 @@ class TestSparrow(TestCase):
         gradients_file = os.path.join(self.RESOURCES, 'gradients.dat')
         expected_gradients = np.genfromtxt(gradients_file)
         self.assertTrue(np.allclose(gradients, expected_gradients))
+
+    def test_reward_backend(self):
+        reward = InteractionReward(backend=SparrowBackend('PM6'))
+
+        atoms = Atoms()
+        atoms.append(Atom('H', position=(0, 0, 0)))
+
+        value, info = reward.calculate(atoms, Atom('H', position=(1.2, 0, 0)))
+        self.assertAlmostEqual(value, 0.1113491286)
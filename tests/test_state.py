@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+import numpy as np
+from ase import Atoms, Atom
+
+from molgym.energy_store import get_canonical_key
+from molgym.state import MolecularState, BaseStructure, to_atoms
+
+
+class TestMolecularState(TestCase):
+    def setUp(self):
+        self.atoms = Atoms(symbols='OCH', positions=[(0.0, 0.0, 0.0), (1.2, 0.0, 0.0), (1.8, 0.9, 0.0)])
+
+    def test_append(self):
+        state = MolecularState(capacity=2)
+        for atom in self.atoms:
+            state.append(atom)
+
+        self.assertEqual(len(state), 3)
+        self.assertGreaterEqual(state.capacity, 3)
+        self.assertTrue(np.all(state.numbers == self.atoms.numbers))
+        self.assertTrue(np.allclose(state.positions, self.atoms.positions))
+
+        atoms = to_atoms(state)
+        self.assertEqual(atoms.get_chemical_formula(), self.atoms.get_chemical_formula())
+        self.assertTrue(np.allclose(atoms.positions, self.atoms.positions))
+
+    def test_copy(self):
+        state = MolecularState.from_atoms(self.atoms, capacity=5)
+        copy = state.copy()
+        copy.append(Atom('H', position=(-1.0, 0.0, 0.0)))
+
+        self.assertEqual(len(state), 3)
+        self.assertEqual(len(copy), 4)
+        self.assertEqual(copy.capacity, 5)
+
+    def test_indexing(self):
+        state = MolecularState.from_atoms(self.atoms)
+
+        self.assertEqual(state[-1].symbol, 'H')
+        self.assertEqual(len(state[1:]), 2)
+        self.assertTrue(np.all(state[state.numbers != 6].numbers == [8, 1]))
+        self.assertEqual(len(state[:1] + self.atoms[1:]), 3)
+        self.assertEqual([atom.symbol for atom in state], ['O', 'C', 'H'])
+
+    def test_key(self):
+        state = MolecularState.from_atoms(self.atoms)
+        key = get_canonical_key(state, charge=0, spin=1, method='morse')
+        self.assertEqual(key, get_canonical_key(self.atoms, charge=0, spin=1, method='morse'))
+
+    def test_base(self):
+        base = BaseStructure(self.atoms)
+        state = MolecularState(capacity=2, base=base)
+        self.assertTrue(state.is_base())
+
+        state.append(Atom('H', position=(-1.0, 0.0, 0.0)))
+        copy = state.copy()
+        copy.append(Atom('H', position=(-2.0, 0.0, 0.0)))
+
+        self.assertEqual(len(state), 4)
+        self.assertEqual(len(copy), 5)
+        self.assertIs(copy.base, base)
+        self.assertEqual(copy.numbers.tolist(), [8, 6, 1, 1, 1])
+        self.assertEqual(len(to_atoms(copy)), 5)
+
+        with self.assertRaises(ValueError):
+            base.positions[0] = 0.0
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+import numpy as np
+from ase import Atoms
+
+from molgym.reward import InteractionReward, MorseBackend
+from molgym.surrogate import SurrogateEnergyModel
+
+
+class TestSurrogate(TestCase):
+    def setUp(self):
+        self.backend = MorseBackend()
+        self.random_state = np.random.RandomState(0)
+
+    def get_molecule(self) -> Atoms:
+        atoms = Atoms('CH2O', positions=[(0, 0, 0), (1.1, 0, 0), (-0.5, 0.9, 0), (0, 0, 1.2)])
+        atoms.positions += self.random_state.normal(scale=0.05, size=(4, 3))
+        return atoms
+
+    def test_gating(self):
+        surrogate = SurrogateEnergyModel(num_models=2, min_train_size=8, train_interval=8, num_train_steps=5)
+        molecules = [self.get_molecule() for _ in range(8)]
+        self.assertEqual(surrogate.get_confident(molecules), [None] * 8)
+
+        for atoms in molecules:
+            surrogate.add(atoms, self.backend.calculate(atoms, charge=0, spin=0))
+        self.assertTrue(surrogate.is_trained)
+
+        means, stds = surrogate.predict(molecules)
+        self.assertEqual(means.shape, (8, ))
+        self.assertTrue(np.all(stds >= 0))
+
+        surrogate.uncertainty_threshold = np.inf
+        self.assertTrue(all(energy is not None for energy in surrogate.get_confident(molecules)))
+        surrogate.uncertainty_threshold = 0.0
+        self.assertTrue(all(energy is None for energy in surrogate.get_confident(molecules)))
+
+    def test_spot_checks(self):
+        surrogate = SurrogateEnergyModel(num_models=2,
+                                         min_train_size=4,
+                                         train_interval=4,
+                                         num_train_steps=5,
+                                         uncertainty_threshold=np.inf,
+                                         spot_check_fraction=1.0)
+        for _ in range(4):
+            atoms = self.get_molecule()
+            surrogate.add(atoms, self.backend.calculate(atoms, charge=0, spin=0))
+
+        # Spot checks are matched by geometry, not by object
+        atoms = self.get_molecule()
+        self.assertEqual(surrogate.get_confident([atoms]), [None])
+        surrogate.add(self.get_molecule(), 0.0)
+        surrogate.add(atoms.copy(), self.backend.calculate(atoms, charge=0, spin=0))
+        self.assertEqual(surrogate.get_info()['surrogate_spot_checks'], 1)
+
+    def test_reward(self):
+        surrogate = SurrogateEnergyModel(num_models=2,
+                                         min_train_size=4,
+                                         train_interval=4,
+                                         num_train_steps=5,
+                                         uncertainty_threshold=np.inf,
+                                         spot_check_fraction=0.0)
+        reward = InteractionReward(backend=self.backend, surrogate=surrogate)
+
+        for _ in range(4):
+            atoms = self.get_molecule()
+            reward.calculate(atoms[:-1], atoms[-1])
+        self.assertTrue(surrogate.is_trained)
+        self.assertLess(reward.get_info()['surrogate_hit_rate'], 1.0)
+
+        atoms = self.get_molecule()
+        reward.calculate(atoms[:-1], atoms[-1])
+        self.assertEqual(reward.get_info()['surrogate_hit_rate'], 1.0)
+
+    def test_train_outside_lock(self):
+        surrogate = SurrogateEnergyModel(num_models=2, min_train_size=4, train_interval=4, num_train_steps=5)
+        reward = InteractionReward(backend=self.backend, surrogate=surrogate)
+
+        # Other threads can use the reward while the surrogate is trained
+        lock_free = []
+        fit = surrogate.fit
+
+        def try_lock():
+            acquired = reward.lock.acquire(blocking=False)
+            if acquired:
+                reward.lock.release()
+            return acquired
+
+        def checked_fit(data):
+            self.assertTrue(surrogate.is_training)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                lock_free.append(executor.submit(try_lock).result())
+            return fit(data)
+
+        with mock.patch.object(surrogate, 'fit', side_effect=checked_fit):
+            for _ in range(4):
+                atoms = self.get_molecule()
+                reward.calculate(atoms[:-1], atoms[-1])
+
+        self.assertEqual(lock_free, [True])
+        self.assertTrue(surrogate.is_trained)
+        self.assertFalse(surrogate.is_training)
@@ -1,8 +1,13 @@
+import os
+import tempfile
 from unittest import TestCase
 
 import numpy as np
 
-from molgym.tools.util import discount_cumsum, split_formula_strings, zs_to_formula
+from molgym.reward import SolvationReward
+from molgym.tools.arg_parser import build_default_argparser
+from molgym.tools.reward_util import build_reward_stack
+from molgym.tools.util import discount_cumsum, split_formula_strings, zs_to_formula, merge_infos
 
 
 class TestTools(TestCase):
@@ -24,3 +29,26 @@ class TestTools(TestCase):
         self.assertAlmostEqual(y[0], x[0] + discount * x[1] + discount**2 * x[2])
         self.assertAlmostEqual(y[1], x[1] + discount * x[2])
         self.assertAlmostEqual(y[2], x[2])
+
+    def test_merge_infos(self):
+        merged = merge_infos([{'count': 2, 'rate': 0.5}, {'count': 3, 'rate': 1.0, 'mae': 0.1}])
+        self.assertEqual(merged, {'count': 5, 'rate': 0.75, 'mae': 0.1})
+
+
+class TestRewardStack(TestCase):
+    def setUp(self):
+        parser = build_default_argparser()
+        args = ['--name=test', '--symbols=X,H,O', '--formulas=H2O', '--bag_scale=1', '--reward_backend=mock', '--prescreen']
+        self.config = vars(parser.parse_args(args))
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as directory:
+            reward_stack = build_reward_stack(self.config,
+                                              model_dir=directory,
+                                              reward_cls=SolvationReward,
+                                              cutoff=4.0)
+            self.assertIsNone(reward_stack.pool)
+            self.assertIsNotNone(reward_stack.prescreen)
+            self.assertIsInstance(reward_stack.reward, SolvationReward)
+            self.assertTrue(os.path.isfile(os.path.join(directory, 'reference_energies.json')))
+            reward_stack.close()
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+import numpy as np
+from ase import Atoms, Atom
+
+from molgym import worker_pool
+from molgym.reward import InteractionReward, XTBBackend
+from molgym.worker_pool import WorkerPool
+from molgym.xtb import gfn2_num_shells, _write_records
+
+
+def get_pid_after(delay: float) -> int:
+    time.sleep(delay)
+    return os.getpid()
+
+
+class WarmStartBackend(XTBBackend):
+    """Returns 1.0 for warm-started calculations and 0.0 otherwise instead of running xtb."""
+    def __init__(self):
+        super().__init__(warm_start=True)
+
+    def _calculate(self, atoms, settings, restart=None):
+        num_shells = sum(gfn2_num_shells[z] for z in atoms.numbers)
+        self.set_restart(
+            atoms,
+            _write_records([
+                np.array([1, 2], dtype=np.int64).tobytes(),
+                np.array([len(atoms), num_shells], dtype=np.int64).tobytes(),
+                np.int32(settings['spin']).tobytes(),
+                np.zeros(num_shells).tobytes(),
+                np.zeros(3 * len(atoms)).tobytes(),
+                np.zeros(6 * len(atoms)).tobytes(),
+            ]))
+        return 1.0 if restart is not None else 0.0
+
+
+class TestWorkerPool(TestCase):
+    def setUp(self):
+        self.scratch_root = tempfile.mkdtemp()
+        self.pool = WorkerPool(num_workers=2, backend=XTBBackend(), scratch_root=self.scratch_root)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_scratch_directories(self):
+        directories = [self.pool.executor.submit(worker_pool.get_scratch_directory).result() for _ in range(4)]
+        for directory in directories:
+            self.assertEqual(os.path.dirname(directory), self.scratch_root)
+            self.assertTrue(os.path.isdir(directory))
+
+    def test_h2(self):
+        reward = InteractionReward(pool=self.pool)
+
+        atoms = Atoms()
+        atoms.append(Atom('H', position=(0, 0, 0)))
+
+        value, info = reward.calculate(atoms, Atom('H', position=(1, 0, 0)))
+        self.assertAlmostEqual(value, 0.1696435)
+
+
+class TestWarmStart(TestCase):
+    def test_workers(self):
+        with WorkerPool(num_workers=2, backend=WarmStartBackend()) as pool:
+            # Start both workers before any calculation
+            futures = [pool.executor.submit(get_pid_after, 0.2) for _ in range(2)]
+            self.assertEqual(len({future.result() for future in futures}), 2)
+
+            # While one worker is busy, the next step of the episode is calculated by the other one
+            atoms = Atoms('H6', positions=[(i, 0, 0) for i in range(6)])
+            warm_starts = []
+            for i in range(1, 7):
+                blocker = pool.executor.submit(time.sleep, 0.2)
+                warm_starts.append(pool.submit(atoms[:i], charge=0, spin=i % 2).result())
+                blocker.result()
+
+            self.assertEqual(warm_starts, [0.0] + [1.0] * 5)
@@ -0,0 +1,42 @@
+import tempfile
+import time
+from unittest import TestCase
+
+import numpy as np
+from ase import Atoms
+
+from molgym.xtb import XTB, XTBTimeoutError, pad_restart, _read_records, _write_records
+
+
+class TestXTB(TestCase):
+    def test_timeout(self):
+        calculator = XTB(directory=tempfile.mkdtemp(), timeout=0.5)
+        calculator.command = 'sleep 30'
+        calculator.atoms = Atoms('H2', positions=[(0, 0, 0), (0.74, 0, 0)])
+
+        start = time.time()
+        with self.assertRaises(XTBTimeoutError):
+            calculator.get_potential_energy()
+        self.assertLess(time.time() - start, 10.0)
+
+    def test_pad_restart(self):
+        # Restart file of H2: version, dimensions, open shells, shell charges, dipole and quadrupole moments
+        restart = _write_records([
+            np.array([1, 2], dtype=np.int64).tobytes(),
+            np.array([2, 2], dtype=np.int64).tobytes(),
+            np.int32(0).tobytes(),
+            np.array([0.1, -0.1]).tobytes(),
+            np.ones(3 * 2).tobytes(),
+            np.ones(6 * 2).tobytes(),
+        ])
+
+        records = _read_records(pad_restart(restart, numbers=[8], spin=1))
+        self.assertEqual(len(records), 6)
+        self.assertEqual(np.frombuffer(records[1], dtype=np.int64).tolist(), [3, 4])
+        self.assertEqual(np.frombuffer(records[2], dtype=np.int32).tolist(), [1])
+        self.assertEqual(np.frombuffer(records[3]).tolist(), [0.1, -0.1, 0.0, 0.0])
+        self.assertEqual(np.frombuffer(records[4]).shape, (3 * 3, ))
+        self.assertEqual(np.frombuffer(records[5]).shape, (6 * 3, ))
+
+        self.assertIsNone(pad_restart(restart[:-1], numbers=[8], spin=1))
+        self.assertIsNone(pad_restart(restart, numbers=[92], spin=1))